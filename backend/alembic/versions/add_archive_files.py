@@ -0,0 +1,38 @@
+"""Add archive files
+
+Revision ID: add_archive_files
+Revises: add_team_purge_owner
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_archive_files"
+down_revision = "add_team_purge_owner"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "archive_files",
+        sa.Column("id", sa.UUID(as_uuid=True), nullable=False),
+        sa.Column("team_id", sa.UUID(as_uuid=True), nullable=True),
+        sa.Column("table_name", sa.String(length=50), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("path", sa.String(length=500), nullable=False),
+        sa.Column("row_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_archive_files_team_id_table_name", "archive_files", ["team_id", "table_name"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_archive_files_team_id_table_name", table_name="archive_files")
+    op.drop_table("archive_files")
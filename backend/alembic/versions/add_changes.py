@@ -0,0 +1,48 @@
+"""Add the change feed
+
+Revision ID: add_changes
+Revises: add_archive_files
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_changes"
+down_revision = "add_archive_files"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "changes",
+        sa.Column("seq", sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column("team_id", sa.UUID(as_uuid=True), nullable=True),
+        sa.Column("table_name", sa.String(length=50), nullable=False),
+        sa.Column("row_id", sa.UUID(as_uuid=True), nullable=False),
+        sa.Column("op", sa.String(length=10), nullable=False),
+        sa.Column(
+            "changed_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("(now() at time zone 'utc')"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("seq"),
+    )
+    op.create_index("ix_changes_team_id_seq", "changes", ["team_id", "seq"], unique=False)
+    op.create_table(
+        "change_sequence",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("last_seq", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute("INSERT INTO change_sequence (id, last_seq) VALUES (1, 0)")
+
+
+def downgrade():
+    op.drop_table("change_sequence")
+    op.drop_index("ix_changes_team_id_seq", table_name="changes")
+    op.drop_table("changes")
@@ -0,0 +1,46 @@
+"""Add email outbox
+
+Revision ID: add_email_outbox
+Revises: f2d7b7f26a90
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_email_outbox"
+down_revision = "f2d7b7f26a90"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "email_outbox",
+        sa.Column("id", sa.UUID(as_uuid=True), nullable=False),
+        sa.Column("template", sa.String(length=50), nullable=False),
+        sa.Column("to_email", sa.String(length=255), nullable=False),
+        sa.Column("substitutions", sa.JSON(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column(
+            "next_attempt_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("(now() at time zone 'utc')"),
+            nullable=False,
+        ),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.Column("sent_at", sa.TIMESTAMP(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_email_outbox_due", "email_outbox", ["status", "next_attempt_at"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_email_outbox_due", table_name="email_outbox")
+    op.drop_table("email_outbox")
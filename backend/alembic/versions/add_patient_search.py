@@ -0,0 +1,51 @@
+"""Add team-scoped patient search indexes
+
+Revision ID: add_patient_search
+Revises: add_changes
+Create Date: 2026-10-19 21:00:00.000000
+
+Both indexes are built on the expressions of ``app/services/patient_search.py``
+(``name_key`` and ``rut_key``), which must stay identical for the planner to
+use them.
+"""
+
+from alembic import op
+
+
+revision = "add_patient_search"
+down_revision = "add_changes"
+branch_labels = None
+depends_on = None
+
+NAME_KEY = (
+    "translate(lower(name), "
+    "'áàâäãéèêëíìîïóòôöõúùûüñçÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÑÇ', "
+    "'aaaaaeeeeiiiiooooouuuuncaaaaaeeeeiiiiooooouuuunc')"
+)
+RUT_KEY = "left(regexp_replace(upper(rut), '[^0-9K]', '', 'g'), -1)"
+
+
+def upgrade():
+    if op.get_context().dialect.name != "postgresql":
+        return
+    # pg_trgm for the trigram operators, btree_gin to put team_id in the same GIN index
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    # Built concurrently so patients stay writable meanwhile
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_team_id_name_key "
+            f"ON patients USING gin (team_id, ({NAME_KEY}) gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_team_id_rut_key "
+            f"ON patients (team_id, ({RUT_KEY}) text_pattern_ops)"
+        )
+
+
+def downgrade():
+    if op.get_context().dialect.name != "postgresql":
+        return
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_patients_team_id_rut_key")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_patients_team_id_name_key")
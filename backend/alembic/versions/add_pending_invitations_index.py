@@ -0,0 +1,38 @@
+"""Add partial index on pending team invitations
+
+Revision ID: add_pending_invitations_index
+Revises: add_team_seat_counters
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_pending_invitations_index"
+down_revision = "add_team_seat_counters"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so invitations stay writable meanwhile; that cannot
+    # run inside the migration's transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_team_invitations_pending",
+            "team_invitations",
+            ["team_id", "status", "expires_at"],
+            postgresql_where=sa.text("status = 'pending'"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_team_invitations_pending",
+            table_name="team_invitations",
+            postgresql_concurrently=True,
+        )
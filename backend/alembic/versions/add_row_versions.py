@@ -0,0 +1,30 @@
+"""Add version to patients, treatments and diagnostics
+
+Revision ID: add_row_versions
+Revises: add_idempotency_keys
+Create Date: 2026-10-19 23:30:00.000000
+
+A column with a constant default is added without rewriting the table, so
+this is quick even on the partitioned tables.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_row_versions"
+down_revision = "add_idempotency_keys"
+branch_labels = None
+depends_on = None
+
+TABLES = ("patients", "treatments", "diagnostics")
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_column(table, "version")
@@ -0,0 +1,119 @@
+"""Add patients.rut_normalized, unique per team
+
+Revision ID: add_rut_normalized
+Revises: add_patient_search
+Create Date: 2026-10-19 22:00:00.000000
+
+1. add the column, empty;
+2. build the unique index on (team_id, rut_normalized) concurrently (NULLs
+   never collide, so it builds over the empty column and guards the backfill);
+3. backfill in batches of ``BATCH_SIZE`` rows in id order, each in its own
+   transaction. A row whose RUT is invalid, or normalizes to a RUT another
+   patient of its team already has, keeps NULL; their ids are logged so they
+   can be fixed or merged by hand;
+4. drop the (rut, team_id) constraint, which formatting could get around.
+
+Run it with the new app code deployed, which sets the column on every write.
+"""
+
+from contextlib import nullcontext
+import logging
+import re
+import time
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_rut_normalized"
+down_revision = "add_patient_search"
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+BATCH_SIZE = 5000
+BATCH_PAUSE = 0.05  # seconds between batches
+
+
+# Frozen copy of app.rut.normalize_rut, so this migration does not change with the app
+def normalize_rut(value):
+    match = re.fullmatch(r"(\d{1,9})([\dK])", re.sub(r"[.\s-]", "", value).upper())
+    if match is None:
+        return None
+    body, digit = match.group(1).lstrip("0"), match.group(2)
+    total, factor = 0, 2
+    for number in reversed(body):
+        total += int(number) * factor
+        factor = 2 if factor == 7 else factor + 1
+    remainder = 11 - total % 11
+    if not body or {11: "0", 10: "K"}.get(remainder, str(remainder)) != digit:
+        return None
+    return f"{body}-{digit}"
+
+
+def backfill(begin):
+    """Fill rut_normalized batch by batch; ``begin()`` opens a batch's transaction."""
+    last = None
+    skipped = []
+    while True:
+        with begin() as connection:
+            query = "SELECT id, rut FROM patients WHERE rut_normalized IS NULL"
+            if last is not None:
+                query += " AND id > :last"
+            rows = connection.execute(
+                sa.text(query + " ORDER BY id LIMIT :limit"), {"last": last, "limit": BATCH_SIZE}
+            ).all()
+            if not rows:
+                break
+            for patient_id, rut in rows:
+                normalized = normalize_rut(rut)
+                updated = normalized is not None and connection.execute(
+                    sa.text(
+                        "UPDATE patients SET rut_normalized = :normalized WHERE id = :id "
+                        "AND NOT EXISTS (SELECT 1 FROM patients other "
+                        "WHERE other.rut_normalized = :normalized AND other.team_id IS NOT DISTINCT FROM "
+                        "(SELECT team_id FROM patients WHERE id = :id))"
+                    ),
+                    {"normalized": normalized, "id": patient_id},
+                ).rowcount
+                if not updated:
+                    skipped.append(str(patient_id))
+        last = rows[-1][0]
+        time.sleep(BATCH_PAUSE)
+    if skipped:
+        logger.warning(
+            "%d patients kept an empty rut_normalized (invalid or duplicate RUT): %s",
+            len(skipped), ", ".join(skipped),
+        )
+
+
+def upgrade():
+    op.add_column("patients", sa.Column("rut_normalized", sa.String(length=12), nullable=True))
+    if op.get_context().dialect.name != "postgresql":
+        op.create_index(
+            "uq_patients_team_id_rut_normalized", "patients", ["team_id", "rut_normalized"], unique=True
+        )
+        # Within the migration's transaction
+        backfill(lambda: nullcontext(op.get_bind()))
+        return
+    if op.get_context().as_sql:
+        raise RuntimeError("add_rut_normalized backfills data and cannot run in --sql mode")
+    engine = op.get_bind().engine
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "uq_patients_team_id_rut_normalized",
+            "patients",
+            ["team_id", "rut_normalized"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        backfill(engine.begin)
+        op.execute("ALTER TABLE patients DROP CONSTRAINT IF EXISTS uq_patient_rut_team")
+
+
+def downgrade():
+    if op.get_context().dialect.name == "postgresql":
+        op.create_unique_constraint("uq_patient_rut_team", "patients", ["rut", "team_id"])
+    op.drop_index("uq_patients_team_id_rut_normalized", table_name="patients")
+    op.drop_column("patients", "rut_normalized")
@@ -0,0 +1,47 @@
+"""Add stripe events
+
+Revision ID: add_stripe_events
+Revises: add_email_outbox
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_stripe_events"
+down_revision = "add_email_outbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "stripe_events",
+        sa.Column("id", sa.String(length=255), nullable=False),
+        sa.Column("type", sa.String(length=100), nullable=False),
+        sa.Column("ordering_key", sa.String(length=255), nullable=False),
+        sa.Column("stripe_created", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column(
+            "next_attempt_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("(now() at time zone 'utc')"),
+            nullable=False,
+        ),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("received_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.Column("processed_at", sa.TIMESTAMP(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_stripe_events_pending", "stripe_events", ["status", "stripe_created"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_stripe_events_pending", table_name="stripe_events")
+    op.drop_table("stripe_events")
@@ -0,0 +1,24 @@
+"""Add the lease owner to team purges
+
+Revision ID: add_team_purge_owner
+Revises: partition_clinical_history
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_team_purge_owner"
+down_revision = "partition_clinical_history"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("team_purges", sa.Column("claimed_by", sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    op.drop_column("team_purges", "claimed_by")
@@ -0,0 +1,52 @@
+"""Add team purges
+
+Revision ID: add_team_purges
+Revises: add_pending_invitations_index
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_team_purges"
+down_revision = "add_pending_invitations_index"
+branch_labels = None
+depends_on = None
+
+INDEXED_COLUMNS = [
+    ("patients", "team_id"),
+    ("diagnostics", "patient_id"),
+    ("treatments", "patient_id"),
+    ("bed_history", "patient_id"),
+]
+
+
+def upgrade():
+    op.create_table(
+        "team_purges",
+        sa.Column("team_id", sa.UUID(as_uuid=True), nullable=False),
+        sa.Column("team_name", sa.String(length=100), nullable=True),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="running"),
+        sa.Column("rows_deleted", sa.JSON(), nullable=False),
+        sa.Column("claimed_until", sa.TIMESTAMP(), nullable=True),
+        sa.Column("started_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.Column("updated_at", sa.TIMESTAMP(), nullable=True),
+        sa.Column("completed_at", sa.TIMESTAMP(), nullable=True),
+        sa.PrimaryKeyConstraint("team_id"),
+    )
+    # The purge (and every per-patient lookup) finds a team's rows through
+    # these; built concurrently so the tables stay writable meanwhile
+    with op.get_context().autocommit_block():
+        for table, column in INDEXED_COLUMNS:
+            op.create_index(
+                f"ix_{table}_{column}", table, [column], postgresql_concurrently=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table, column in INDEXED_COLUMNS:
+            op.drop_index(f"ix_{table}_{column}", table_name=table, postgresql_concurrently=True)
+    op.drop_table("team_purges")
@@ -0,0 +1,44 @@
+"""Add team seat counters
+
+Revision ID: add_team_seat_counters
+Revises: add_stripe_events
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_team_seat_counters"
+down_revision = "add_stripe_events"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "teams", sa.Column("member_count", sa.Integer(), nullable=False, server_default="0")
+    )
+    op.add_column(
+        "teams",
+        sa.Column("pending_invitation_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.execute(
+        """
+        UPDATE teams SET
+            member_count = (
+                SELECT count(*) FROM users WHERE users.team_id = teams.id
+            ),
+            pending_invitation_count = (
+                SELECT count(*) FROM team_invitations
+                WHERE team_invitations.team_id = teams.id
+                  AND team_invitations.status = 'pending'
+            )
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("teams", "pending_invitation_count")
+    op.drop_column("teams", "member_count")
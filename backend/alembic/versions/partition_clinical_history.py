@@ -0,0 +1,226 @@
+"""Partition bed_history, treatments and diagnostics by month
+
+Revision ID: partition_clinical_history
+Revises: add_team_purges
+Create Date: 2026-10-19 17:00:00.000000
+
+Converts each table online, on Postgres only:
+
+1. create ``<table>_partitioned``, range-partitioned by month of its date
+   (a history partition below the oldest month, then one partition per
+   month up to three months ahead), with primary key (id, date);
+2. a trigger on the old table mirrors every insert, update and delete into
+   it; rows without a date get ``created_at`` (or today) as their date;
+3. copy the existing rows in batches in id order, each batch in its own short
+   transaction that locks only the rows it copies;
+4. swap the names in one short transaction and drop the old table.
+
+Writes keep going during steps 1-3; step 4 takes the table lock for the
+rename only. The downgrade copies the rows back into a plain table and
+blocks writes while it does.
+"""
+
+from datetime import date
+import time
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+
+
+revision = "partition_clinical_history"
+down_revision = "add_team_purges"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+BATCH_PAUSE = 0.05  # seconds between copy batches
+MONTHS_AHEAD = 3
+SWAP_ATTEMPTS = 10
+
+# table -> (partition key, date for rows without one, foreign keys)
+TABLES = {
+    "bed_history": (
+        "start_date",
+        "current_date",
+        [("patient_id", "patients"), ("bed_id", "beds")],
+    ),
+    "treatments": (
+        "start_date",
+        "created_at::date",
+        [("patient_id", "patients"), ("created_by_user_id", "users")],
+    ),
+    "diagnostics": (
+        "date_diagnosed",
+        "created_at::date",
+        [
+            ("patient_id", "patients"),
+            ("category_id", "diagnostic_categories"),
+            ("subcategory_id", "diagnostic_subcategories"),
+            ("created_by_user_id", "users"),
+        ],
+    ),
+}
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def columns_of(connection, table):
+    return connection.execute(
+        sa.text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table ORDER BY ordinal_position"
+        ),
+        {"table": table},
+    ).scalars().all()
+
+
+def create_partitioned(connection, table, key, fallback, foreign_keys):
+    shadow = f"{table}_partitioned"
+    connection.execute(sa.text(
+        f"CREATE TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY RANGE ({key})"
+    ))
+    connection.execute(sa.text(f"ALTER TABLE {shadow} ALTER COLUMN {key} SET NOT NULL"))
+    connection.execute(sa.text(
+        f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow}_pkey PRIMARY KEY (id, {key})"
+    ))
+    for column, referenced in foreign_keys:
+        connection.execute(sa.text(
+            f"ALTER TABLE {shadow} ADD CONSTRAINT {table}_{column}_fkey "
+            f"FOREIGN KEY ({column}) REFERENCES {referenced} (id)"
+        ))
+    connection.execute(sa.text(
+        f"CREATE INDEX ix_{table}_patient_id_{key} ON {shadow} (patient_id, {key})"
+    ))
+
+    oldest, newest = connection.execute(sa.text(
+        f"SELECT min(coalesce({key}, {fallback})), max(coalesce({key}, {fallback})) FROM {table}"
+    )).one()
+    this_month = date.today().replace(day=1)
+    first = min(oldest.replace(day=1), this_month) if oldest else this_month
+    last = max(newest.replace(day=1), add_months(this_month, MONTHS_AHEAD)) if newest else add_months(this_month, MONTHS_AHEAD)
+    connection.execute(sa.text(
+        f"CREATE TABLE {table}_history PARTITION OF {shadow} FOR VALUES FROM (MINVALUE) TO ('{first}')"
+    ))
+    month = first
+    while month <= last:
+        connection.execute(sa.text(
+            f"CREATE TABLE {table}_{month:%Y_%m} PARTITION OF {shadow} "
+            f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+        ))
+        month = add_months(month, 1)
+
+
+def install_mirror(connection, table, key, fallback, columns):
+    shadow = f"{table}_partitioned"
+    values = ", ".join(
+        f"coalesce(NEW.{key}, {fallback.replace('created_at', 'NEW.created_at')})" if column == key else f"NEW.{column}"
+        for column in columns
+    )
+    connection.execute(sa.text(f"""
+        CREATE FUNCTION {table}_mirror() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM {shadow} WHERE id = OLD.id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO {shadow} ({", ".join(columns)}) VALUES ({values});
+            END IF;
+            RETURN NULL;
+        END $$
+    """))
+    connection.execute(sa.text(
+        f"CREATE TRIGGER {table}_mirror AFTER INSERT OR UPDATE OR DELETE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION {table}_mirror()"
+    ))
+
+
+def copy_rows(engine, table, key, fallback, columns):
+    shadow = f"{table}_partitioned"
+    selected = ", ".join(
+        f"coalesce({key}, {fallback})" if column == key else column for column in columns
+    )
+    last = "00000000-0000-0000-0000-000000000000"
+    while True:
+        with engine.begin() as connection:
+            # Locking the batch makes concurrent updates of these rows wait,
+            # so the copy cannot overwrite a newer version mirrored meanwhile
+            ids = connection.execute(
+                sa.text(
+                    f"SELECT id::text FROM {table} WHERE id > CAST(:last AS uuid) "
+                    f"ORDER BY id LIMIT :limit FOR UPDATE"
+                ),
+                {"last": last, "limit": BATCH_SIZE},
+            ).scalars().all()
+            if not ids:
+                return
+            params = {"ids": ids}
+            connection.execute(
+                sa.text(f"DELETE FROM {shadow} WHERE id = ANY(CAST(:ids AS uuid[]))"), params
+            )
+            connection.execute(
+                sa.text(
+                    f"INSERT INTO {shadow} ({', '.join(columns)}) "
+                    f"SELECT {selected} FROM {table} WHERE id = ANY(CAST(:ids AS uuid[]))"
+                ),
+                params,
+            )
+        last = ids[-1]
+        time.sleep(BATCH_PAUSE)
+
+
+def swap(engine, table):
+    for attempt in range(SWAP_ATTEMPTS):
+        try:
+            with engine.begin() as connection:
+                # Give up quickly rather than queue every query behind the lock
+                connection.execute(sa.text("SET LOCAL lock_timeout = '3s'"))
+                connection.execute(sa.text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+                connection.execute(sa.text(f"DROP TRIGGER {table}_mirror ON {table}"))
+                connection.execute(sa.text(f"DROP FUNCTION {table}_mirror()"))
+                connection.execute(sa.text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+                connection.execute(sa.text(f"ALTER TABLE {table}_partitioned RENAME TO {table}"))
+            break
+        except OperationalError:
+            if attempt == SWAP_ATTEMPTS - 1:
+                raise
+            time.sleep(1)
+    with engine.begin() as connection:
+        connection.execute(sa.text(f"DROP TABLE {table}_unpartitioned"))
+        connection.execute(sa.text(
+            f"ALTER TABLE {table} RENAME CONSTRAINT {table}_partitioned_pkey TO {table}_pkey"
+        ))
+
+
+def upgrade():
+    if op.get_context().dialect.name != "postgresql":
+        return
+    if op.get_context().as_sql:
+        raise RuntimeError("partition_clinical_history copies data and cannot run in --sql mode")
+    engine = op.get_bind().engine
+    with op.get_context().autocommit_block():
+        for table, (key, fallback, foreign_keys) in TABLES.items():
+            with engine.begin() as connection:
+                columns = columns_of(connection, table)
+                create_partitioned(connection, table, key, fallback, foreign_keys)
+                install_mirror(connection, table, key, fallback, columns)
+            copy_rows(engine, table, key, fallback, columns)
+            swap(engine, table)
+
+
+def downgrade():
+    if op.get_context().dialect.name != "postgresql":
+        return
+    for table, (key, _, foreign_keys) in TABLES.items():
+        op.execute(f"CREATE TABLE {table}_plain (LIKE {table} INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {table}_plain SELECT * FROM {table}")
+        op.execute(f"DROP TABLE {table}")
+        op.execute(f"ALTER TABLE {table}_plain RENAME TO {table}")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {key} DROP NOT NULL")
+        op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+        for column, referenced in foreign_keys:
+            op.execute(f"ALTER TABLE {table} ADD FOREIGN KEY ({column}) REFERENCES {referenced} (id)")
+        op.execute(f"CREATE INDEX ix_{table}_patient_id ON {table} (patient_id)")
@@ -0,0 +1,105 @@
+"""
+Request-scoped SQL instrumentation.
+
+SQLAlchemy cursor events are attached to every ``Engine`` and, while a request
+is being served, add each statement's count and duration to the request's
+``RequestStats``. The stats object travels in a context variable, which
+anyio copies into the threadpool, so sync endpoints and ``get_db`` are
+covered as well. Statements executed outside a request (startup, scripts)
+are ignored.
+
+When the query inspector is enabled, each statement is also handed to it for
+N+1 and slow-query detection (see ``app.query_inspector``).
+"""
+
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .query_inspector import inspector
+
+
+class RequestStats:
+    """SQL activity of a single request."""
+
+    __slots__ = ("statements", "db_time", "scope", "fingerprints")
+
+    def __init__(self, scope=None):
+        self.statements = 0
+        self.db_time = 0.0
+        self.scope = scope
+        self.fingerprints = None
+
+    def route(self) -> str:
+        """Route template of the request, or its raw path before routing."""
+        if self.scope is None:
+            return "<no request>"
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path", "")
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def start_request(scope=None):
+    """Begin collecting stats for the current request. Returns (stats, token)."""
+    stats = RequestStats(scope)
+    return stats, _current_stats.set(stats)
+
+
+def end_request(token) -> None:
+    stats = _current_stats.get()
+    _current_stats.reset(token)
+    if inspector.enabled and stats is not None:
+        inspector.finish(stats)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current_stats.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        conn.info.setdefault("query_start_time", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    duration = perf_counter() - start_times.pop()
+    stats.statements += 1
+    stats.db_time += duration
+    if inspector.enabled:
+        inspector.record(stats, statement, parameters, executemany, duration)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
+
+def install() -> None:
+    """Attach the cursor event listeners to all engines."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+def uninstall() -> None:
+    """Detach the cursor event listeners."""
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.remove(Engine, "handle_error", _handle_error)
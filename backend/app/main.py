@@ -1,9 +1,26 @@
+import asyncio
 import os
-from fastapi import FastAPI
+import tempfile
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
+from sqlalchemy.orm.exc import StaleDataError
 from .database import engine, SessionLocal
 from .models import Base
+from .middleware.compression import CompressionMiddleware, NO_COMPRESSION
+from .middleware.metrics import MetricsMiddleware, PROMETHEUS_CONTENT_TYPE, REGISTRY
+from .middleware.profiling import ProfilingMiddleware
+from .middleware.query_inspector import QueryInspectorMiddleware
+from .services.archive import ArchiveWorker
+from .services.email_outbox import EmailOutboxWorker
+from .services.entitlements import require_active_subscription
+from .services.events import hub as change_hub
+from .services.idempotency import IdempotencySweeper
+from .services.invitation_expiry import InvitationSweeper
+from .services.partitions import PartitionMaintainer
+from .services.stripe_events import StripeEventWorker
+from .services.team_purge import TeamPurgeWorker
 from .routers import (
     patients,
     diagnostics,
@@ -18,6 +35,8 @@ from .routers import (
     subscriptions,
     antibiotics,
     diagnostic_categories,
+    sync,
+    events,
 )
 
 # Create database tables
@@ -42,27 +61,129 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=get_cors_origins(),
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type", "Idempotency-Key", "Last-Event-ID"],
 )
 
+# Compress large responses (exports, patient lists, category trees).
+# Health checks are polled constantly and tiny, so they skip compression.
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")),
+    policies={
+        "/api/v1/health": NO_COMPRESSION,
+    },
+)
+
+# N+1 and slow-query logging; shares the metrics' request scope when both run
+if os.getenv("QUERY_INSPECTOR_ENABLED", "false").lower() == "true":
+    app.add_middleware(QueryInspectorMiddleware)
+
+# Per-route latency and DB metrics, exposed on /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, registry=REGISTRY)
+
+# Opt-in request profiler: only installed when a token or sample rate is set
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+PROFILER_SAMPLE_RATE = int(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+if PROFILER_TOKEN or PROFILER_SAMPLE_RATE:
+    app.add_middleware(
+        ProfilingMiddleware,
+        output_dir=os.getenv(
+            "PROFILER_OUTPUT_DIR", os.path.join(tempfile.gettempdir(), "biotrack-profiles")
+        ),
+        token=PROFILER_TOKEN,
+        sample_rate=PROFILER_SAMPLE_RATE,
+        interval=float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000,
+        max_files=int(os.getenv("PROFILER_MAX_FILES", "50")),
+        output_format=os.getenv("PROFILER_FORMAT", "speedscope"),
+    )
+
+
+@app.exception_handler(StaleDataError)
+async def stale_data(request: Request, exc: StaleDataError):
+    """A PUT whose row was updated since it was read (versioned models)"""
+    return JSONResponse(
+        status_code=409, content={"detail": "Changed by someone else since it was read; reload and retry"}
+    )
+
+
 app.include_router(auth.router, prefix="/api/v1")
-app.include_router(patients.router, prefix="/api/v1", tags=["patients"])
-app.include_router(diagnostics.router, prefix="/api/v1", tags=["diagnostics"])
-app.include_router(treatments.router, prefix="/api/v1", tags=["treatments"])
+# Routers that need a logged-in user: teams whose trial or subscription lapsed
+# can read but not write. The dependency authenticates, so it is only added
+# where every route already does. Auth, teams, invitations and subscriptions
+# are left out: they are how a lapsed team renews, restores or manages itself.
+subscription_required = [Depends(require_active_subscription)]
+app.include_router(
+    patients.router, prefix="/api/v1", tags=["patients"], dependencies=subscription_required
+)
+app.include_router(
+    diagnostics.router, prefix="/api/v1", tags=["diagnostics"], dependencies=subscription_required
+)
+app.include_router(
+    treatments.router, prefix="/api/v1", tags=["treatments"], dependencies=subscription_required
+)
+# Units, beds and bed configurations are shared by all teams and need no login
 app.include_router(units.router, prefix="/api/v1", tags=["units"])
 app.include_router(beds.router, prefix="/api/v1", tags=["beds"])
 app.include_router(
     bed_configurations.router, prefix="/api/v1", tags=["bed_configurations"]
 )
-app.include_router(bed_history.router, prefix="/api/v1", tags=["bed_history"])
+app.include_router(
+    bed_history.router, prefix="/api/v1", tags=["bed_history"], dependencies=subscription_required
+)
 app.include_router(teams.router, prefix="/api/v1", tags=["teams"])
 app.include_router(invitations.router, prefix="/api/v1", tags=["invitations"])
 app.include_router(subscriptions.router, prefix="/api/v1", tags=["subscriptions"])
-app.include_router(antibiotics.router, prefix="/api/v1", tags=["antibiotics"])
 app.include_router(
-    diagnostic_categories.router, prefix="/api/v1", tags=["diagnostic_categories"]
+    antibiotics.router, prefix="/api/v1", tags=["antibiotics"], dependencies=subscription_required
 )
+app.include_router(
+    diagnostic_categories.router,
+    prefix="/api/v1",
+    tags=["diagnostic_categories"],
+    dependencies=subscription_required,
+)
+app.include_router(sync.router, prefix="/api/v1", tags=["sync"], dependencies=subscription_required)
+app.include_router(events.router, prefix="/api/v1", tags=["events"], dependencies=subscription_required)
+
+# Background workers: the email outbox, stored Stripe events, invitation
+# expiry, the purge of deleted teams, the creation of upcoming monthly
+# partitions, the cold archive (opt-in), expired idempotency keys and the
+# live change events of this process. Disable one where it runs standalone
+# instead (python -m app.services.email_outbox, .stripe_events,
+# .invitation_expiry, .team_purge, .partitions, .archive or .idempotency);
+# the change events only serve this process.
+background_workers = []
+if os.getenv("EMAIL_OUTBOX_WORKER_ENABLED", "true").lower() == "true":
+    background_workers.append(EmailOutboxWorker())
+if os.getenv("STRIPE_EVENT_WORKER_ENABLED", "true").lower() == "true":
+    background_workers.append(StripeEventWorker())
+if os.getenv("INVITATION_SWEEPER_ENABLED", "true").lower() == "true":
+    background_workers.append(InvitationSweeper())
+if os.getenv("TEAM_PURGE_WORKER_ENABLED", "true").lower() == "true":
+    background_workers.append(TeamPurgeWorker())
+if os.getenv("PARTITION_MAINTAINER_ENABLED", "true").lower() == "true":
+    background_workers.append(PartitionMaintainer())
+if os.getenv("ARCHIVE_WORKER_ENABLED", "false").lower() == "true":
+    background_workers.append(ArchiveWorker())
+if os.getenv("IDEMPOTENCY_SWEEPER_ENABLED", "true").lower() == "true":
+    background_workers.append(IdempotencySweeper())
+if os.getenv("CHANGE_EVENTS_ENABLED", "true").lower() == "true":
+    background_workers.append(change_hub)
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    app.state.worker_tasks = [asyncio.create_task(worker.run()) for worker in background_workers]
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    for worker in background_workers:
+        worker.stop()
+    await asyncio.gather(*app.state.worker_tasks)
 
 
 @app.get("/")
@@ -76,6 +197,12 @@ def health_check():
     return {"status": "healthy", "service": "biotrack-api"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app.get("/api/v1/health/ready")
 def readiness_check():
     """Readiness check - verifies database connectivity."""
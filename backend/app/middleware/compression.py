@@ -0,0 +1,268 @@
+"""
+Response compression negotiated by Accept-Encoding.
+
+gzip is always available. Brotli (``brotli`` package) and zstd
+(``zstandard`` package) are offered when they are installed.
+
+Responses are compressed when:
+
+* the client accepts one of the available encodings,
+* the response does not already carry a Content-Encoding,
+* the media type is textual (JSON, text, CSV, XML, JS), and
+* the body reaches the route's minimum size.
+
+Every response that could have been compressed carries ``Vary:
+Accept-Encoding``, compressed or not (too small, or the client accepts no
+available encoding), so shared caches never serve one client's variant to
+another.
+
+Streaming responses (more than one body message) are compressed
+incrementally: every chunk is flushed so clients receive data as it is
+produced instead of waiting for the whole export.
+
+Policies are resolved per route by longest path prefix, so health checks can
+opt out entirely and large exports can lower the threshold.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+import logging
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+@dataclass(frozen=True)
+class CompressionPolicy:
+    """How responses for a route prefix are compressed."""
+
+    enabled: bool = True
+    minimum_size: int = 1024
+
+
+NO_COMPRESSION = CompressionPolicy(enabled=False)
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+# Server preference when the client weighs several encodings equally
+ENCODING_PREFERENCE = ("br", "zstd", "gzip")
+
+
+class GzipEncoder:
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = 5):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+def available_encoders() -> dict:
+    """Map content-coding names to encoder factories available in this process."""
+    encoders = {"gzip": GzipEncoder}
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, available) -> Optional[str]:
+    """Pick the best encoding from an Accept-Encoding header, or None."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    wildcard = weights.get("*")
+    best, best_q = None, 0.0
+    for name in ENCODING_PREFERENCE:
+        if name not in available:
+            continue
+        q = weights.get(name, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    if content_type.startswith("text/event-stream"):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES) or "+json" in content_type
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses responses per route policy."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        policies: Optional[dict] = None,
+    ):
+        self.app = app
+        self.default_policy = CompressionPolicy(minimum_size=minimum_size)
+        # Longest prefix first so the most specific policy wins
+        self.policies = sorted(
+            (policies or {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
+        self.encoders = available_encoders()
+        logger.info("Response compression enabled: %s", ", ".join(self.encoders))
+
+    def policy_for(self, path: str) -> CompressionPolicy:
+        for prefix, policy in self.policies:
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+                return policy
+        return self.default_policy
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.policy_for(scope["path"])
+        if not policy.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, self.encoders)
+        # Without an encoding the responder only adds the Vary header
+        responder = _CompressedResponder(
+            self.app, send, encoding, self.encoders.get(encoding), policy.minimum_size
+        )
+        await responder(scope, receive)
+
+
+class _CompressedResponder:
+    def __init__(self, app, send, encoding, encoder_factory, minimum_size):
+        self.app = app
+        self.send = send
+        self.encoding = encoding
+        self.encoder_factory = encoder_factory
+        self.minimum_size = minimum_size
+        self.start_message: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive) -> None:
+        await self.app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            headers = MutableHeaders(scope=message)
+            compressible = (
+                "content-encoding" not in headers
+                and message["status"] not in (204, 304)
+                and is_compressible(headers.get("content-type", ""))
+            )
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            self.passthrough = not compressible or self.encoding is None
+            if self.passthrough:
+                await self.send(message)
+            else:
+                # Hold the start message until the first body chunk tells us
+                # whether the response is worth compressing.
+                self.start_message = message
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+
+            if not more_body and len(body) < self.minimum_size:
+                # Small single-message response: send as is
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            self.encoder = self.encoder_factory()
+
+            if not more_body:
+                compressed = self.encoder.finish(body)
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streaming: length is unknown up front
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self.send(start)
+
+        if more_body:
+            data = self.encoder.chunk(body) if body else b""
+        else:
+            data = self.encoder.finish(body)
+        await self.send(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
@@ -0,0 +1,223 @@
+"""
+Per-route request and database metrics in Prometheus text format.
+
+``MetricsMiddleware`` records, per route template (``/api/v1/patients/{patient_id}``,
+never the raw path), method and status:
+
+* request latency,
+* SQL statements executed while serving the request,
+* time spent in the database (from the cursor events in ``app.instrumentation``),
+
+plus an in-flight gauge per method (the route template is only known once the
+router has matched the request).
+
+The metrics live in process memory; with several uvicorn workers each worker
+exposes its own series on ``/metrics`` and Prometheus aggregates them.
+"""
+
+from bisect import bisect_left
+from time import perf_counter
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .. import instrumentation
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+        ]
+        for labels, value in self._values.items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple, buckets: tuple
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (non-cumulative), sum, count]
+        self._series: dict = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, labels: tuple) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def sum(self, labels: tuple) -> float:
+        series = self._series.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            inf = 'le="+Inf"'
+            lines.append(
+                f"{self.name}_bucket{_format_labels(self.labelnames, labels, inf)} {count}"
+            )
+            lines.append(
+                f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            )
+            lines.append(
+                f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+            )
+        return lines
+
+
+class MetricsRegistry:
+    """The set of metrics exposed on /metrics."""
+
+    def __init__(self):
+        route_labels = ("method", "route", "status")
+        self.request_duration = Histogram(
+            "biotrack_http_request_duration_seconds",
+            "HTTP request latency in seconds.",
+            route_labels,
+            LATENCY_BUCKETS,
+        )
+        self.db_statements = Histogram(
+            "biotrack_db_statements_per_request",
+            "SQL statements executed per HTTP request.",
+            route_labels,
+            STATEMENT_BUCKETS,
+        )
+        self.db_duration = Histogram(
+            "biotrack_db_duration_seconds",
+            "Time spent executing SQL per HTTP request, in seconds.",
+            route_labels,
+            LATENCY_BUCKETS,
+        )
+        self.in_flight = Gauge(
+            "biotrack_http_requests_in_flight",
+            "HTTP requests currently being served.",
+            ("method",),
+        )
+
+    def metrics(self) -> list:
+        return [self.request_duration, self.db_statements, self.db_duration, self.in_flight]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def route_template(scope: Scope) -> str:
+    """The matched route's path template, set on the scope by FastAPI's router."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """ASGI middleware that records per-route latency and DB metrics."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        registry: Optional[MetricsRegistry] = None,
+        exclude_paths: tuple = ("/metrics",),
+    ):
+        self.app = app
+        self.registry = registry or REGISTRY
+        self.exclude_paths = frozenset(exclude_paths)
+        instrumentation.install()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats, token = instrumentation.start_request(scope)
+        registry.in_flight.inc((method,))
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = perf_counter() - start
+            registry.in_flight.dec((method,))
+            instrumentation.end_request(token)
+            labels = (method, route_template(scope), str(status_code))
+            registry.request_duration.observe(labels, duration)
+            registry.db_statements.observe(labels, stats.statements)
+            registry.db_duration.observe(labels, stats.db_time)
@@ -0,0 +1,238 @@
+"""
+On-demand stack-sampling profiler for individual requests.
+
+A request is profiled when it carries ``X-Profile-Token`` matching
+``PROFILER_TOKEN``, or when it is picked by sampling one in
+``PROFILER_SAMPLE_RATE`` requests. While it runs, a background thread samples
+the stacks of every busy thread in the process (the event loop and the
+threadpool running sync endpoints) every ``PROFILER_INTERVAL_MS``. Idle
+threads are skipped.
+
+The profile is written to ``PROFILER_OUTPUT_DIR`` as a speedscope JSON file
+(https://www.speedscope.app) or as collapsed stacks for flamegraph.pl, named
+after the route and the request id. Only the newest ``PROFILER_MAX_FILES``
+profiles are kept.
+
+The middleware is only installed when a token or a sample rate is
+configured, so it costs nothing when profiling is off. Only one request is
+profiled at a time; requests arriving while a profile is running are served
+normally.
+"""
+
+from collections import Counter
+from datetime import datetime
+from itertools import count
+from pathlib import Path
+from typing import Optional
+import hmac
+import json
+import logging
+import re
+import sys
+import threading
+import uuid
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile-token"
+REQUEST_ID_HEADER = "x-request-id"
+
+MAX_STACK_DEPTH = 128
+
+# Leaf functions of threads that are waiting rather than working
+IDLE_FUNCTIONS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (Path(code.co_filename).name, code.co_name) in IDLE_FUNCTIONS
+
+
+class StackSampler:
+    """Samples the stacks of all busy threads at a fixed interval."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profiler-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append((names.get(thread_id, str(thread_id)), "<thread>", 0))
+                stack.reverse()
+                self.samples[tuple(stack)] += 1
+
+
+def to_collapsed(samples: Counter) -> str:
+    """Brendan Gregg's collapsed stack format: ``a;b;c <count>`` per line."""
+    lines = []
+    for stack, hits in samples.items():
+        frames = ";".join(
+            name if file == "<thread>" else f"{name} ({Path(file).name}:{line})"
+            for name, file, line in stack
+        )
+        lines.append(f"{frames} {hits}")
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(samples: Counter, name: str, interval: float) -> dict:
+    """A speedscope 'sampled' profile, weighted in milliseconds."""
+    frame_index: dict = {}
+    frames = []
+    stacks = []
+    weights = []
+    for stack, hits in samples.items():
+        indexes = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                func, file, line = frame
+                entry = {"name": func}
+                if file != "<thread>":
+                    entry.update(file=file, line=line)
+                frames.append(entry)
+            indexes.append(frame_index[frame])
+        stacks.append(indexes)
+        weights.append(hits * interval * 1000)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": stacks,
+                "weights": weights,
+            }
+        ],
+        "name": name,
+        "exporter": "biotrack",
+    }
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", value).strip("_") or "root"
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles selected requests."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        output_dir: str,
+        token: Optional[str] = None,
+        sample_rate: int = 0,
+        interval: float = 0.005,
+        max_files: int = 50,
+        output_format: str = "speedscope",
+    ):
+        self.app = app
+        self.output_dir = Path(output_dir)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_files = max_files
+        self.output_format = output_format
+        self._counter = count(1)
+        self._busy = threading.Lock()
+
+    def should_profile(self, scope: Scope) -> bool:
+        if self.token:
+            supplied = Headers(scope=scope).get(PROFILE_HEADER)
+            if supplied and hmac.compare_digest(supplied, self.token):
+                return True
+        return bool(self.sample_rate) and next(self._counter) % self.sample_rate == 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex[:12]
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Request-Id"] = request_id
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            self._busy.release()
+            try:
+                await anyio.to_thread.run_sync(self._write, scope, request_id, sampler)
+            except Exception:
+                logger.exception("Failed to write profile for request %s", request_id)
+
+    def _write(self, scope: Scope, request_id: str, sampler: StackSampler) -> Path:
+        route = getattr(scope.get("route"), "path", None) or scope["path"]
+        name = f"{scope['method']} {route} {request_id}"
+        stem = "{}-{}-{}-{}".format(
+            datetime.utcnow().strftime("%Y%m%dT%H%M%S"),
+            scope["method"],
+            _slug(route),
+            _slug(request_id),
+        )
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.output_format == "collapsed":
+            path = self.output_dir / f"{stem}.collapsed.txt"
+            path.write_text(to_collapsed(sampler.samples))
+        else:
+            path = self.output_dir / f"{stem}.speedscope.json"
+            path.write_text(
+                json.dumps(to_speedscope(sampler.samples, name, self.interval))
+            )
+        logger.info("Wrote profile %s (%d samples)", path, sum(sampler.samples.values()))
+        self._enforce_retention()
+        return path
+
+    def _enforce_retention(self) -> None:
+        profiles = sorted(
+            (
+                p
+                for p in self.output_dir.iterdir()
+                if p.name.endswith((".speedscope.json", ".collapsed.txt"))
+            ),
+            key=lambda p: p.stat().st_mtime,
+        )
+        for stale in profiles[: max(0, len(profiles) - self.max_files)]:
+            stale.unlink(missing_ok=True)
@@ -0,0 +1,33 @@
+"""
+Request scope for the query inspector.
+
+The inspector (``app.query_inspector``) reads the SQL statements of each
+request from the cursor events in ``app.instrumentation``, which only count
+while a request scope is open. ``MetricsMiddleware`` opens one, but metrics
+can be disabled on their own; this middleware installs the listeners and
+opens the scope itself, so the inspector works with or without metrics.
+When a scope is already open (metrics installed outside it), it reuses it.
+"""
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .. import instrumentation
+
+
+class QueryInspectorMiddleware:
+    """ASGI middleware that opens a per-request SQL scope for the inspector."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        instrumentation.install()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or instrumentation.current_stats() is not None:
+            await self.app(scope, receive, send)
+            return
+
+        _, token = instrumentation.start_request(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            instrumentation.end_request(token)
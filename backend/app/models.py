@@ -1,4 +1,5 @@
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
@@ -7,25 +8,32 @@ from sqlalchemy import (
     Boolean,
     ForeignKey,
     TIMESTAMP,
+    JSON,
+    Index,
     func,
+    text,
 )
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 import uuid
-from datetime import datetime, timedelta
-from .database import Base
+from datetime import date, datetime, timedelta
+from .database import Base, GUID
+from .rut import normalize_rut
 
 
 class Team(Base):
     __tablename__ = "teams"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     name = Column(String(100), nullable=False)
     subscription_status = Column(
         String(20), default="trial"
     )  # trial, active, cancelled, expired
     subscription_plan = Column(String(50), nullable=True)  # basic, premium
     member_limit = Column(Integer, default=5)
+    # Seat usage, kept by services/seats.py with conditional UPDATEs:
+    # members plus pending invitations never exceed member_limit
+    member_count = Column(Integer, nullable=False, default=0, server_default="0")
+    pending_invitation_count = Column(Integer, nullable=False, default=0, server_default="0")
     trial_ends_at = Column(TIMESTAMP, nullable=True)
     stripe_customer_id = Column(String(100), nullable=True)
     stripe_subscription_id = Column(String(100), nullable=True)
@@ -41,11 +49,23 @@ class Team(Base):
 
 class TeamInvitation(Base):
     __tablename__ = "team_invitations"
+    # Only pending invitations are looked up by team and expiry (seat checks,
+    # services/invitation_expiry.py), so the index holds just those rows
+    __table_args__ = (
+        Index(
+            "ix_team_invitations_pending",
+            "team_id",
+            "status",
+            "expires_at",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    team_id = Column(UUID(as_uuid=True), ForeignKey("teams.id"), nullable=False)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    team_id = Column(GUID(), ForeignKey("teams.id"), nullable=False)
     email = Column(String(255), nullable=False, index=True)
-    invited_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    invited_by = Column(GUID(), ForeignKey("users.id"), nullable=False)
     role = Column(String(20), default="member")  # admin, member
     token = Column(String(100), nullable=False, unique=True, index=True)
     expires_at = Column(TIMESTAMP, nullable=False)
@@ -53,7 +73,7 @@ class TeamInvitation(Base):
         String(20), default="pending"
     )  # pending, accepted, cancelled, expired
     accepted_at = Column(TIMESTAMP, nullable=True)
-    accepted_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    accepted_by = Column(GUID(), ForeignKey("users.id"), nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     # Relationships
@@ -65,12 +85,12 @@ class TeamInvitation(Base):
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False, index=True)
     hashed_password = Column(String, nullable=False)
     role = Column(String, nullable=False, default="basic")  # basic, advanced
-    team_id = Column(UUID(as_uuid=True), ForeignKey("teams.id"), nullable=True)
+    team_id = Column(GUID(), ForeignKey("teams.id"), nullable=True)
     team_role = Column(String, nullable=True)  # owner, admin, member
     is_active = Column(Boolean, default=True)
     email_verified = Column(Boolean, default=False)
@@ -97,10 +117,15 @@ class User(Base):
 
 class Patient(Base):
     __tablename__ = "patients"
+    __table_args__ = (
+        Index("uq_patients_team_id_rut_normalized", "team_id", "rut_normalized", unique=True),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    team_id = Column(UUID(as_uuid=True), ForeignKey("teams.id"), nullable=True)
-    rut = Column(String, unique=True, nullable=False)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    team_id = Column(GUID(), ForeignKey("teams.id"), nullable=True, index=True)
+    rut = Column(String, nullable=False)  # as entered
+    # rut as <body>-<check digit>, set along with rut; None if rut is not a valid RUT
+    rut_normalized = Column(String(12))
     name = Column(String, nullable=False)
     age = Column(Integer)
     status = Column(String, nullable=False)  # waiting, active, archived
@@ -109,34 +134,56 @@ class Patient(Base):
     has_ending_soon_program = Column(Boolean, default=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Bumped by every update; PATCH only applies to the version it was read at
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     diagnostics = relationship("Diagnostic", back_populates="patient")
     treatments = relationship("Treatment", back_populates="patient")
     bed_history = relationship("BedHistory", back_populates="patient")
 
+    @validates("rut")
+    def _normalize_rut(self, key, value):
+        try:
+            self.rut_normalized = normalize_rut(value)
+        except ValueError:
+            self.rut_normalized = None
+        return value
+
 
 class Diagnostic(Base):
     __tablename__ = "diagnostics"
+    # Partitioned by month of date_diagnosed on Postgres (services/partitions.py)
+    __table_args__ = (
+        Index("ix_diagnostics_patient_id_date_diagnosed", "patient_id", "date_diagnosed"),
+        {"postgresql_partition_by": "RANGE (date_diagnosed)"},
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False)
+    # A partitioned table's primary key must include the partition key
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    patient_id = Column(GUID(), ForeignKey("patients.id"), nullable=False)
     category_id = Column(
-        UUID(as_uuid=True), ForeignKey("diagnostic_categories.id"), nullable=True
+        GUID(), ForeignKey("diagnostic_categories.id"), nullable=True
     )
     subcategory_id = Column(
-        UUID(as_uuid=True), ForeignKey("diagnostic_subcategories.id"), nullable=True
+        GUID(), ForeignKey("diagnostic_subcategories.id"), nullable=True
     )
     diagnosis_name = Column(String, nullable=False)
     diagnosis_code = Column(String)
-    date_diagnosed = Column(Date)
+    date_diagnosed = Column(Date, primary_key=True, default=date.today)
     severity = Column(String)  # mild, moderate, severe, critical
     notes = Column(Text)
     created_by = Column(String)  # Legacy field for name
     created_by_user_id = Column(
-        UUID(as_uuid=True), ForeignKey("users.id"), nullable=True
+        GUID(), ForeignKey("users.id"), nullable=True
     )
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Bumped by every update; PATCH only applies to the version it was read at
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     patient = relationship("Patient", back_populates="diagnostics")
     creator = relationship(
@@ -148,22 +195,31 @@ class Diagnostic(Base):
 
 class Treatment(Base):
     __tablename__ = "treatments"
+    # Partitioned by month of start_date on Postgres (services/partitions.py)
+    __table_args__ = (
+        Index("ix_treatments_patient_id_start_date", "patient_id", "start_date"),
+        {"postgresql_partition_by": "RANGE (start_date)"},
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    patient_id = Column(GUID(), ForeignKey("patients.id"), nullable=False)
     antibiotic_name = Column(String, nullable=False)
     antibiotic_type = Column(String, nullable=False)  # antibiotic, corticoide
-    start_date = Column(Date)
+    start_date = Column(Date, primary_key=True, default=date.today)
     days_applied = Column(Integer, default=0)
     programmed_days = Column(Integer)
     status = Column(String, nullable=False)  # active, suspended, extended, finished
     start_count = Column(Integer)  # 0 or 1
     dosage = Column(String)
     created_by_user_id = Column(
-        UUID(as_uuid=True), ForeignKey("users.id"), nullable=True
+        GUID(), ForeignKey("users.id"), nullable=True
     )
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Bumped by every update; PATCH only applies to the version it was read at
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     patient = relationship("Patient", back_populates="treatments")
     creator = relationship(
@@ -174,7 +230,7 @@ class Treatment(Base):
 class Unit(Base):
     __tablename__ = "units"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     name = Column(String, unique=True, nullable=False)
     description = Column(Text)
 
@@ -184,8 +240,8 @@ class Unit(Base):
 class Bed(Base):
     __tablename__ = "beds"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    unit_id = Column(UUID(as_uuid=True), ForeignKey("units.id"), nullable=False)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    unit_id = Column(GUID(), ForeignKey("units.id"), nullable=False)
     bed_number = Column(Integer, nullable=False)
     is_occupied = Column(Boolean, default=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
@@ -196,11 +252,16 @@ class Bed(Base):
 
 class BedHistory(Base):
     __tablename__ = "bed_history"
+    # Partitioned by month of start_date on Postgres (services/partitions.py)
+    __table_args__ = (
+        Index("ix_bed_history_patient_id_start_date", "patient_id", "start_date"),
+        {"postgresql_partition_by": "RANGE (start_date)"},
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False)
-    bed_id = Column(UUID(as_uuid=True), ForeignKey("beds.id"), nullable=False)
-    start_date = Column(Date)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    patient_id = Column(GUID(), ForeignKey("patients.id"), nullable=False)
+    bed_id = Column(GUID(), ForeignKey("beds.id"), nullable=False)
+    start_date = Column(Date, primary_key=True, default=date.today)
     end_date = Column(Date)
     notes = Column(Text)
 
@@ -211,7 +272,7 @@ class BedHistory(Base):
 class Antibiotic(Base):
     __tablename__ = "antibiotics"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     name = Column(String(100), nullable=False, unique=True)
     type = Column(String(20), nullable=False)
     default_start_count = Column(Integer, nullable=False, default=0)
@@ -223,7 +284,7 @@ class Antibiotic(Base):
 class DiagnosticCategory(Base):
     __tablename__ = "diagnostic_categories"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     name = Column(String(100), nullable=False, unique=True)
     code = Column(String(20), nullable=False, unique=True)
     description = Column(Text)
@@ -241,9 +302,9 @@ class DiagnosticCategory(Base):
 class DiagnosticSubcategory(Base):
     __tablename__ = "diagnostic_subcategories"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     category_id = Column(
-        UUID(as_uuid=True), ForeignKey("diagnostic_categories.id"), nullable=False
+        GUID(), ForeignKey("diagnostic_categories.id"), nullable=False
     )
     name = Column(String(300), nullable=False)
     code = Column(String(50), nullable=False)
@@ -255,3 +316,108 @@ class DiagnosticSubcategory(Base):
 
     category = relationship("DiagnosticCategory", back_populates="subcategories")
     diagnostics = relationship("Diagnostic", back_populates="subcategory")
+
+
+# Emails are written here in the same transaction as the change that triggers
+# them and sent by the worker in services/email_outbox.py
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (Index("ix_email_outbox_due", "status", "next_attempt_at"),)
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    template = Column(String(50), nullable=False)  # invitation, verification
+    to_email = Column(String(255), nullable=False)
+    substitutions = Column(JSON, nullable=False, default=dict)
+    status = Column(String(20), nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    sent_at = Column(TIMESTAMP, nullable=True)
+
+
+# Verified Stripe webhook events, stored before processing so redeliveries are
+# no-ops; processed in order per subscription by services/stripe_events.py
+class StripeEvent(Base):
+    __tablename__ = "stripe_events"
+    __table_args__ = (Index("ix_stripe_events_pending", "status", "stripe_created"),)
+
+    id = Column(String(255), primary_key=True)  # Stripe event id (evt_...)
+    type = Column(String(100), nullable=False)
+    ordering_key = Column(String(255), nullable=False)  # subscription, customer or event id
+    stripe_created = Column(Integer, nullable=False)  # event.created (epoch seconds)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, processing, processed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(TIMESTAMP, server_default=func.now())
+    processed_at = Column(TIMESTAMP, nullable=True)
+
+
+# Progress of purging a soft-deleted team past its grace period, one row per
+# team; kept after the team row is gone (services/team_purge.py)
+class TeamPurge(Base):
+    __tablename__ = "team_purges"
+
+    team_id = Column(GUID(), primary_key=True)  # no foreign key: outlives the team
+    team_name = Column(String(100), nullable=True)
+    status = Column(String(20), nullable=False, default="running")  # running, completed
+    rows_deleted = Column(JSON, nullable=False, default=dict)  # table -> rows so far
+    claimed_by = Column(String(100), nullable=True)  # worker holding the lease
+    claimed_until = Column(TIMESTAMP, nullable=True)  # lease of the worker purging it
+    started_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, nullable=True)
+    completed_at = Column(TIMESTAMP, nullable=True)
+
+
+# Parquet files of the cold archive, one row per file; a file only counts once
+# its row is committed, with the deletion of its rows (services/archive.py)
+class ArchiveFile(Base):
+    __tablename__ = "archive_files"
+    __table_args__ = (Index("ix_archive_files_team_id_table_name", "team_id", "table_name"),)
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    team_id = Column(GUID(), nullable=True)  # no foreign key: purged with the team
+    table_name = Column(String(50), nullable=False)  # patients, treatments, diagnostics, bed_history
+    month = Column(Date, nullable=False)
+    path = Column(String(500), nullable=False)  # relative to ARCHIVE_DIR
+    row_count = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+
+# Change feed of the clinical tables and beds: one row per changed row and
+# transaction, numbered in commit order (services/changes.py)
+class Change(Base):
+    __tablename__ = "changes"
+    __table_args__ = (Index("ix_changes_team_id_seq", "team_id", "seq"),)
+
+    seq = Column(BigInteger, primary_key=True, autoincrement=False)
+    team_id = Column(GUID(), nullable=True)  # None: shared by all teams (beds)
+    table_name = Column(String(50), nullable=False)
+    row_id = Column(GUID(), nullable=False)
+    op = Column(String(10), nullable=False)  # upsert, delete
+    changed_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+
+
+# Last change number handed out; its single row is locked by each committing
+# transaction that records changes, so numbers follow commit order
+class ChangeSequence(Base):
+    __tablename__ = "change_sequence"
+
+    id = Column(Integer, primary_key=True)
+    last_seq = Column(BigInteger, nullable=False, default=0)
+
+
+# Stored responses of create requests sent with an Idempotency-Key, replayed
+# when the request is retried (services/idempotency.py)
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (Index("ix_idempotency_keys_expires_at", "expires_at"),)
+
+    user_id = Column(GUID(), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)  # sha256 of method, path and body
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(Text, nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=False)
@@ -0,0 +1,178 @@
+"""
+N+1 and slow-query detection.
+
+While enabled, every SQL statement executed inside a request is reduced to a
+fingerprint (literals and bound parameters replaced by ``?``, IN lists
+collapsed) and counted per request. When the request ends, any fingerprint
+executed more than ``n_plus_one_threshold`` times is logged as a probable N+1.
+Statements slower than ``slow_query_ms`` are logged as they finish, together
+with the route and the shape of their parameters (types only, never values).
+
+Configuration comes from the environment and can be changed at runtime:
+
+    QUERY_INSPECTOR_ENABLED=true
+    QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD=5
+    QUERY_INSPECTOR_SLOW_QUERY_MS=200
+
+    from app.query_inspector import inspector
+    inspector.enable(n_plus_one_threshold=3)
+
+In tests, ``capture_queries()`` enables the inspector for a block and collects
+its findings:
+
+    with capture_queries() as report:
+        client.get("/api/v1/treatments", headers=auth_headers)
+    assert not report.n_plus_one
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s|\$\d+|\?")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """Normalize a SQL statement so repeated executions compare equal."""
+    normalized = _STRING_RE.sub("?", statement)
+    normalized = _PARAM_RE.sub("?", normalized)
+    normalized = _NUMBER_RE.sub("?", normalized)
+    normalized = _IN_LIST_RE.sub("IN (...)", normalized)
+    return _SPACE_RE.sub(" ", normalized).strip()
+
+
+def parameters_shape(parameters, executemany: bool = False) -> str:
+    """Describe bound parameters by name and type, without their values."""
+    if executemany:
+        if not parameters:
+            return "[]"
+        return f"{len(parameters)} x {parameters_shape(parameters[0])}"
+    if isinstance(parameters, dict):
+        items = ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items())
+        return "{" + items + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+@dataclass
+class NPlusOneFinding:
+    route: str
+    fingerprint: str
+    count: int
+
+
+@dataclass
+class SlowQueryFinding:
+    route: str
+    fingerprint: str
+    duration_ms: float
+    parameters: str
+
+
+@dataclass
+class QueryReport:
+    """Findings collected while ``capture_queries`` is active."""
+
+    n_plus_one: list = field(default_factory=list)
+    slow_queries: list = field(default_factory=list)
+    statements: int = 0
+
+
+class QueryInspector:
+    def __init__(self):
+        self.enabled = os.getenv("QUERY_INSPECTOR_ENABLED", "false").lower() == "true"
+        self.n_plus_one_threshold = int(
+            os.getenv("QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD", "5")
+        )
+        self.slow_query_ms = float(os.getenv("QUERY_INSPECTOR_SLOW_QUERY_MS", "200"))
+        self._reports: list = []
+
+    def enable(self, n_plus_one_threshold=None, slow_query_ms=None) -> None:
+        if n_plus_one_threshold is not None:
+            self.n_plus_one_threshold = n_plus_one_threshold
+        if slow_query_ms is not None:
+            self.slow_query_ms = slow_query_ms
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def record(self, stats, statement, parameters, executemany, duration) -> None:
+        """Called by the cursor listener for each statement of a request."""
+        key = fingerprint(statement)
+        counts = stats.fingerprints
+        if counts is None:
+            counts = stats.fingerprints = {}
+        counts[key] = counts.get(key, 0) + 1
+
+        duration_ms = duration * 1000
+        if duration_ms >= self.slow_query_ms:
+            finding = SlowQueryFinding(
+                route=stats.route(),
+                fingerprint=key,
+                duration_ms=duration_ms,
+                parameters=parameters_shape(parameters, executemany),
+            )
+            logger.warning(
+                "Slow query on %s (%.1f ms, params %s): %s",
+                finding.route,
+                finding.duration_ms,
+                finding.parameters,
+                finding.fingerprint,
+            )
+            for report in self._reports:
+                report.slow_queries.append(finding)
+
+    def finish(self, stats) -> None:
+        """Called when a request ends; reports repeated fingerprints."""
+        for report in self._reports:
+            report.statements += stats.statements
+        if not stats.fingerprints:
+            return
+        route = stats.route()
+        for key, count in stats.fingerprints.items():
+            if count > self.n_plus_one_threshold:
+                finding = NPlusOneFinding(route=route, fingerprint=key, count=count)
+                logger.warning(
+                    "Probable N+1 on %s: %d executions of %s", route, count, key
+                )
+                for report in self._reports:
+                    report.n_plus_one.append(finding)
+
+
+inspector = QueryInspector()
+
+
+@contextmanager
+def capture_queries(n_plus_one_threshold=None, slow_query_ms=None):
+    """Enable the inspector for a block and collect its findings.
+
+    Requests served by the app during the block are inspected per request;
+    statements executed directly in the block (outside any request) are
+    treated as one request of their own.
+    """
+    from . import instrumentation
+
+    instrumentation.install()
+    previous = (inspector.enabled, inspector.n_plus_one_threshold, inspector.slow_query_ms)
+    inspector.enable(n_plus_one_threshold, slow_query_ms)
+    report = QueryReport()
+    inspector._reports.append(report)
+    stats, token = instrumentation.start_request()
+    try:
+        yield report
+    finally:
+        instrumentation.end_request(token)
+        inspector._reports.remove(report)
+        inspector.enabled, inspector.n_plus_one_threshold, inspector.slow_query_ms = previous
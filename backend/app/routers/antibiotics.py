@@ -5,6 +5,7 @@ from ..database import get_db
 from ..models import Antibiotic as AntibioticModel
 from ..schemas import Antibiotic, AntibioticCreate
 from ..auth import get_current_user
+from ..serialization import antibiotic_list
 
 router = APIRouter()
 
@@ -16,7 +17,7 @@ def read_antibiotics(
     antibiotics = (
         db.query(AntibioticModel).filter(AntibioticModel.is_active == True).all()
     )
-    return antibiotics
+    return antibiotic_list.response(antibiotics)
 
 
 @router.post("/antibiotics", response_model=Antibiotic)
@@ -14,12 +14,12 @@ from ..auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     get_current_active_user,
 )
-from ..services.email import send_verification_email
+from ..services.email import queue_verification_email
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 @router.post("/register", response_model=schemas.Token, status_code=status.HTTP_201_CREATED)
-async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Register a new user."""
     # Check if user already exists
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
@@ -44,12 +44,11 @@ async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         email_verification_expires=datetime.utcnow() + timedelta(days=1)
     )
     db.add(new_user)
+    # Queued in the same transaction; the outbox worker sends it
+    queue_verification_email(db, new_user.email, verification_token)
     db.commit()
     db.refresh(new_user)
     
-    # Send verification email
-    await send_verification_email(new_user.email, verification_token)
-    
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -185,7 +184,7 @@ def verify_email(token: str, db: Session = Depends(get_db)):
     }
 
 @router.post("/resend-verification-email")
-async def resend_verification_email(
+def resend_verification_email(
     current_user: models.User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -200,9 +199,7 @@ async def resend_verification_email(
     verification_token = secrets.token_urlsafe(32)
     current_user.email_verification_token = verification_token
     current_user.email_verification_expires = datetime.utcnow() + timedelta(days=1)
+    queue_verification_email(db, current_user.email, verification_token)
     db.commit()
     
-    # Send email
-    await send_verification_email(current_user.email, verification_token)
-    
     return {"message": "Verification email sent"}
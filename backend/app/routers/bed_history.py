@@ -2,15 +2,17 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
+from datetime import date
 from ..database import get_db
 from ..models import BedHistory as BedHistoryModel, Patient as PatientModel
 from ..schemas import BedHistory, BedHistoryCreate
 from ..auth import get_current_user
+from ..serialization import bed_history_list
 
 router = APIRouter()
 
 @router.get("/bed-history", response_model=List[BedHistory])
-def read_bed_history(patient_id: Optional[UUID] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def read_bed_history(patient_id: Optional[UUID] = None, since: Optional[date] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     query = db.query(BedHistoryModel)
     
     # If patient_id is provided, filter by patient
@@ -21,8 +23,12 @@ def read_bed_history(patient_id: Optional[UUID] = None, skip: int = 0, limit: in
             raise HTTPException(status_code=404, detail="Patient not found")
         query = query.filter(BedHistoryModel.patient_id == patient_id)
     
+    # Only recent partitions are read when the date is bounded
+    if since:
+        query = query.filter(BedHistoryModel.start_date >= since)
+    
     bed_history = query.offset(skip).limit(limit).all()
-    return bed_history
+    return bed_history_list.response(bed_history)
 
 @router.post("/bed-history", response_model=BedHistory)
 def create_bed_history(bed_history: BedHistoryCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
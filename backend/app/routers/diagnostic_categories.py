@@ -14,6 +14,7 @@ from ..schemas import (
     DiagnosticSubcategoryCreate,
 )
 from ..auth import get_current_user
+from ..serialization import diagnostic_category_list, diagnostic_subcategory_list
 
 router = APIRouter()
 
@@ -33,7 +34,7 @@ def read_diagnostic_categories(
         .limit(limit)
         .all()
     )
-    return categories
+    return diagnostic_category_list.response(categories)
 
 
 @router.post("/diagnostic-categories", response_model=DiagnosticCategory)
@@ -125,7 +126,7 @@ def read_diagnostic_subcategories(
         .limit(limit)
         .all()
     )
-    return subcategories
+    return diagnostic_subcategory_list.response(subcategories)
 
 
 @router.post("/diagnostic-subcategories", response_model=DiagnosticSubcategory)
@@ -2,15 +2,19 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
+from datetime import date
 from ..database import get_db
 from ..models import Diagnostic as DiagnosticModel, Patient as PatientModel
-from ..schemas import Diagnostic, DiagnosticCreate
+from ..schemas import Diagnostic, DiagnosticCreate, DiagnosticPatch
 from ..auth import get_current_user
+from ..services.idempotency import IdempotencyClaim, idempotency_claim
+from ..services.patches import patch_row
+from ..serialization import diagnostic_list
 
 router = APIRouter()
 
 @router.get("/diagnostics", response_model=List[Diagnostic])
-def read_diagnostics(patient_id: Optional[UUID] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def read_diagnostics(patient_id: Optional[UUID] = None, since: Optional[date] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     query = db.query(DiagnosticModel)
     
     # If patient_id is provided, filter by patient
@@ -21,11 +25,19 @@ def read_diagnostics(patient_id: Optional[UUID] = None, skip: int = 0, limit: in
             raise HTTPException(status_code=404, detail="Patient not found")
         query = query.filter(DiagnosticModel.patient_id == patient_id)
     
+    # Only recent partitions are read when the date is bounded
+    if since:
+        query = query.filter(DiagnosticModel.date_diagnosed >= since)
+    
     diagnostics = query.offset(skip).limit(limit).all()
-    return diagnostics
+    return diagnostic_list.response(diagnostics)
 
 @router.post("/diagnostics", response_model=Diagnostic)
-def create_diagnostic(diagnostic: DiagnosticCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def create_diagnostic(diagnostic: DiagnosticCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user), claim: Optional[IdempotencyClaim] = Depends(idempotency_claim)):
+    # A retry of a request that already ran gets its response back
+    if claim and claim.replay:
+        return claim.replay
+
     # Verify patient exists
     patient = db.query(PatientModel).filter(PatientModel.id == diagnostic.patient_id).first()
     if not patient:
@@ -36,6 +48,8 @@ def create_diagnostic(diagnostic: DiagnosticCreate, db: Session = Depends(get_db
         created_by_user_id=current_user.id
     )
     db.add(db_diagnostic)
+    if claim:
+        claim.record(Diagnostic, db_diagnostic)
     db.commit()
     db.refresh(db_diagnostic)
     return db_diagnostic
@@ -59,6 +73,17 @@ def update_diagnostic(diagnostic_id: str, diagnostic: DiagnosticCreate, db: Sess
     db.refresh(db_diagnostic)
     return db_diagnostic
 
+@router.patch("/diagnostics/{diagnostic_id}", response_model=Diagnostic)
+def patch_diagnostic(diagnostic_id: UUID, patch: DiagnosticPatch, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    """Update the fields sent, if the diagnostic is still at ``version``; 409 if not"""
+    criteria = []
+    if current_user.team_id:
+        criteria.append(PatientModel.team_id == current_user.team_id)
+    db_diagnostic = patch_row(db, DiagnosticModel, diagnostic_id, patch.model_dump(exclude_unset=True), *criteria)
+    response = Diagnostic.model_validate(db_diagnostic)
+    db.commit()
+    return response
+
 @router.delete("/diagnostics/{diagnostic_id}")
 def delete_diagnostic(diagnostic_id: str, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     db_diagnostic = db.query(DiagnosticModel).filter(DiagnosticModel.id == diagnostic_id).first()
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+import anyio
+from ..database import get_db
+from ..models import User
+from ..auth import get_current_user
+from ..services.events import EventStream, hub
+
+router = APIRouter()
+
+
+@router.get("/events", response_class=EventStream)
+async def stream_events(
+    last_event_id: Optional[int] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Server-Sent Events for the team's patients, treatments and beds; send
+    ``Last-Event-ID`` to resume. See ``services/events.py``."""
+    if hub.position is None:
+        raise HTTPException(status_code=503, detail="Live events are not available")
+    team_id = current_user.team_id
+    # The stream stays open for hours; give the session's connection back now
+    db.close()
+    subscriber = hub.subscribe(team_id)
+    backlog = []
+    if last_event_id is not None:
+        try:
+            backlog = await anyio.to_thread.run_sync(hub.backlog, team_id, last_event_id)
+        except BaseException:
+            hub.unsubscribe(subscriber)
+            raise
+    return EventStream(hub, subscriber, backlog)
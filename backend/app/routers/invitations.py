@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from typing import List
-from uuid import UUID
+from uuid import UUID, uuid4
 from datetime import datetime, timedelta
 import secrets
 from .. import models, schemas
 from ..database import get_db
 from ..auth import get_current_active_user, get_current_verified_user
-from ..services.email import send_invitation_email
+from ..services.email import queue_invitation_email, queue_invitation_emails, queue_verification_email
+from ..services import seats
+from ..services.entitlements import get_entitlements
+from ..services.invitation_expiry import expire_overdue_invitations
 
 router = APIRouter(tags=["invitations"])
 
@@ -15,9 +19,14 @@ def generate_invitation_token() -> str:
     """Generate a secure random token for invitations"""
     return secrets.token_urlsafe(32)
 
+def _member_limit(db: Session, team_id: UUID):
+    """The team's member limit from its (cached) entitlements."""
+    entitlements = get_entitlements(db, team_id)
+    return entitlements.member_limit if entitlements else None
+
 
 @router.post("/teams/{team_id}/invitations", response_model=schemas.TeamInvitationResponse, status_code=status.HTTP_201_CREATED)
-async def send_invitation(
+def send_invitation(
     team_id: UUID,
     invitation: schemas.TeamInvitationCreate,
     db: Session = Depends(get_db),
@@ -37,26 +46,17 @@ async def send_invitation(
             detail="Only team owners or admins can send invitations"
         )
     
-    # Get team to check member limit
-    team = db.query(models.Team).filter(models.Team.id == team_id).first()
-    if not team:
+    # Get the team's plan (cached) to check member limit
+    entitlements = get_entitlements(db, team_id)
+    if not entitlements:
         raise HTTPException(status_code=404, detail="Team not found")
     
-    # Count current members
-    current_member_count = db.query(models.User).filter(models.User.team_id == team_id).count()
+    reason = entitlements.inactive_reason()
+    if reason:
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail=reason)
     
-    # Count pending invitations
-    pending_invitations = db.query(models.TeamInvitation).filter(
-        models.TeamInvitation.team_id == team_id,
-        models.TeamInvitation.status == "pending"
-    ).count()
-    
-    # Check if adding this invitation would exceed limit
-    if current_member_count + pending_invitations >= team.member_limit:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Team member limit ({team.member_limit}) reached. Remove members or upgrade plan."
-        )
+    # Free the seats of overdue invitations the sweeper has not reached yet
+    expire_overdue_invitations(db, team_id=team_id)
     
     # Check if user already has a pending invitation
     existing_invitation = db.query(models.TeamInvitation).filter(
@@ -83,6 +83,13 @@ async def send_invitation(
             detail="User is already a member of this team"
         )
     
+    # Reserve a seat; fails if members plus pending invitations are at the limit
+    if not seats.reserve_invitation_seats(db, team_id, member_limit=entitlements.member_limit):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Team member limit ({entitlements.member_limit}) reached. Remove members or upgrade plan."
+        )
+    
     # Create invitation
     token = generate_invitation_token()
     new_invitation = models.TeamInvitation(
@@ -96,23 +103,120 @@ async def send_invitation(
     )
     
     db.add(new_invitation)
+    # Queued in the same transaction; the outbox worker sends it
+    queue_invitation_email(
+        db,
+        to_email=invitation.email,
+        team_name=entitlements.team_name,
+        invited_by=current_user.name or current_user.email,
+        token=token
+    )
     db.commit()
     db.refresh(new_invitation)
     
-    # Send invitation email
-    try:
-        await send_invitation_email(
-            to_email=invitation.email,
-            team_name=team.name,
-            invited_by=current_user.name or current_user.email,
-            token=token
+    return new_invitation
+
+
+@router.post("/teams/{team_id}/invitations/bulk", response_model=schemas.TeamInvitationBulkResponse)
+def send_bulk_invitations(
+    team_id: UUID,
+    bulk: schemas.TeamInvitationBulkCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_verified_user)
+):
+    """
+    Invite many emails at once (admin or owner only).
+    
+    Emails that are already members, already invited or repeated in the
+    request are skipped. The rest are invited in order while seats remain;
+    the others get "seat_limit". Returns a status per email.
+    """
+    if current_user.team_id != team_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this team"
         )
-    except Exception as e:
-        # Log error but don't fail the invitation creation
-        import logging
-        logging.getLogger(__name__).error(f"Failed to send invitation email: {str(e)}")
     
-    return new_invitation
+    if current_user.team_role not in ["owner", "admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only team owners or admins can send invitations"
+        )
+    
+    entitlements = get_entitlements(db, team_id)
+    if not entitlements:
+        raise HTTPException(status_code=404, detail="Team not found")
+    
+    reason = entitlements.inactive_reason()
+    if reason:
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail=reason)
+    
+    expire_overdue_invitations(db, team_id=team_id)
+    
+    emails = list(dict.fromkeys(bulk.emails))
+    
+    # One query each for existing members and pending invitations
+    members = {
+        email for (email,) in db.query(models.User.email).filter(
+            models.User.team_id == team_id,
+            models.User.email.in_(emails)
+        )
+    }
+    invited = {
+        email for (email,) in db.query(models.TeamInvitation.email).filter(
+            models.TeamInvitation.team_id == team_id,
+            models.TeamInvitation.status == "pending",
+            models.TeamInvitation.email.in_(emails)
+        )
+    }
+    candidates = [email for email in emails if email not in members and email not in invited]
+    
+    reserved = seats.reserve_available_invitation_seats(
+        db, team_id, len(candidates), member_limit=entitlements.member_limit
+    )
+    
+    expires_at = datetime.utcnow() + timedelta(days=7)
+    rows = [
+        {
+            "id": uuid4(),
+            "team_id": team_id,
+            "email": email,
+            "invited_by": current_user.id,
+            "role": bulk.role,
+            "token": generate_invitation_token(),
+            "expires_at": expires_at,
+            "status": "pending",
+        }
+        for email in candidates[:reserved]
+    ]
+    if rows:
+        db.execute(insert(models.TeamInvitation), rows)
+        queue_invitation_emails(
+            db,
+            [(row["email"], row["token"]) for row in rows],
+            team_name=entitlements.team_name,
+            invited_by=current_user.name or current_user.email
+        )
+    db.commit()
+    
+    created = {row["email"]: row["id"] for row in rows}
+    results = []
+    seen = set()
+    for email in bulk.emails:
+        if email in seen:
+            result = schemas.BulkInvitationResult(email=email, status="duplicate")
+        elif email in members:
+            result = schemas.BulkInvitationResult(email=email, status="already_member")
+        elif email in invited:
+            result = schemas.BulkInvitationResult(email=email, status="already_invited")
+        elif email in created:
+            result = schemas.BulkInvitationResult(email=email, status="invited", invitation_id=created[email])
+        else:
+            result = schemas.BulkInvitationResult(email=email, status="seat_limit")
+        seen.add(email)
+        results.append(result)
+    
+    return schemas.TeamInvitationBulkResponse(invited=len(rows), results=results)
 
 
 @router.get("/teams/{team_id}/invitations", response_model=List[schemas.TeamInvitationResponse])
@@ -165,20 +269,19 @@ def cancel_invitation(
     if not invitation:
         raise HTTPException(status_code=404, detail="Invitation not found")
     
-    if invitation.status != "pending":
+    if invitation.status != "pending" or not seats.close_invitation(db, invitation, "cancelled"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Can only cancel pending invitations"
         )
     
-    invitation.status = "cancelled"
     db.commit()
     
     return None
 
 
 @router.post("/teams/{team_id}/invitations/{invitation_id}/resend", response_model=schemas.TeamInvitationResponse)
-async def resend_invitation(
+def resend_invitation(
     team_id: UUID,
     invitation_id: UUID,
     db: Session = Depends(get_db),
@@ -214,24 +317,19 @@ async def resend_invitation(
     
     # Extend expiration by 7 days from now
     invitation.expires_at = datetime.utcnow() + timedelta(days=7)
-    db.commit()
-    db.refresh(invitation)
     
     # Get team for email
     team = db.query(models.Team).filter(models.Team.id == team_id).first()
     
-    # Send invitation email
-    try:
-        await send_invitation_email(
-            to_email=invitation.email,
-            team_name=team.name,
-            invited_by=current_user.name or current_user.email,
-            token=invitation.token
-        )
-    except Exception as e:
-        # Log error but don't fail the resend
-        import logging
-        logging.getLogger(__name__).error(f"Failed to resend invitation email: {str(e)}")
+    queue_invitation_email(
+        db,
+        to_email=invitation.email,
+        team_name=team.name,
+        invited_by=current_user.name or current_user.email,
+        token=invitation.token
+    )
+    db.commit()
+    db.refresh(invitation)
     
     return invitation
 
@@ -251,7 +349,7 @@ def get_invitation_by_token(
     
     # Check if invitation has expired
     if invitation.expires_at < datetime.utcnow():
-        invitation.status = "expired"
+        seats.close_invitation(db, invitation, "expired")
         db.commit()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -290,7 +388,7 @@ def accept_invitation(
     
     # Check if invitation has expired
     if invitation.expires_at < datetime.utcnow():
-        invitation.status = "expired"
+        seats.close_invitation(db, invitation, "expired")
         db.commit()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -310,14 +408,19 @@ def accept_invitation(
             detail="You already belong to a team. Leave your current team first."
         )
     
-    # Get team to verify it still exists and has space
-    team = db.query(models.Team).filter(models.Team.id == invitation.team_id).first()
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
+    # Mark invitation as accepted (once, even under concurrent accepts)
+    if not seats.close_invitation(
+        db, invitation, "accepted", accepted_at=datetime.utcnow(), accepted_by=current_user.id
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="This invitation is no longer pending"
+        )
     
-    # Count current members
-    current_member_count = db.query(models.User).filter(models.User.team_id == team.id).count()
-    if current_member_count >= team.member_limit:
+    # Move the invitation's seat to a member's; fails if the team is full
+    member_limit = _member_limit(db, invitation.team_id)
+    if not seats.accept_invitation_seat(db, invitation.team_id, member_limit=member_limit):
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Team has reached its member limit"
@@ -328,11 +431,6 @@ def accept_invitation(
     current_user.team_role = invitation.role
     current_user.role = "advanced"  # Grant advanced access
     
-    # Mark invitation as accepted
-    invitation.status = "accepted"
-    invitation.accepted_at = datetime.utcnow()
-    invitation.accepted_by = current_user.id
-    
     db.commit()
     db.refresh(current_user)
     
@@ -340,7 +438,7 @@ def accept_invitation(
 
 
 @router.post("/invitations/{token}/accept-and-register", response_model=schemas.Token)
-async def accept_invitation_and_register(
+def accept_invitation_and_register(
     token: str,
     user_data: schemas.UserCreate,
     db: Session = Depends(get_db)
@@ -350,7 +448,6 @@ async def accept_invitation_and_register(
     Email must match the invitation email.
     """
     from ..auth import get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
-    from ..services.email import send_verification_email
     
     # 1. Get invitation by token
     invitation = db.query(models.TeamInvitation).filter(
@@ -368,7 +465,7 @@ async def accept_invitation_and_register(
         )
     
     if invitation.expires_at < datetime.utcnow():
-        invitation.status = "expired"
+        seats.close_invitation(db, invitation, "expired")
         db.commit()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -393,23 +490,16 @@ async def accept_invitation_and_register(
             detail="Account already exists. Please login instead."
         )
     
-    # 5. Get team
-    team = db.query(models.Team).filter(models.Team.id == invitation.team_id).first()
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    
-    # 6. Check team has space
-    current_members = db.query(models.User).filter(
-        models.User.team_id == team.id
-    ).count()
-    
-    if current_members >= team.member_limit:
+    # 5. Move the invitation's seat to a member's; fails if the team is full
+    member_limit = _member_limit(db, invitation.team_id)
+    if not seats.accept_invitation_seat(db, invitation.team_id, member_limit=member_limit):
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Team has reached member limit ({team.member_limit})"
+            detail="Team has reached its member limit"
         )
     
-    # 7. Create user account
+    # 6. Create user account
     hashed_password = get_password_hash(user_data.password)
     
     # Generate email verification token
@@ -420,7 +510,7 @@ async def accept_invitation_and_register(
         email=user_data.email,
         hashed_password=hashed_password,
         role=user_data.role or "advanced",  # Grant advanced access when joining team
-        team_id=team.id,
+        team_id=invitation.team_id,
         team_role=invitation.role,  # Use role from invitation
         email_verified=False,  # Require verification
         email_verification_token=verification_token,
@@ -428,19 +518,25 @@ async def accept_invitation_and_register(
     )
     
     db.add(new_user)
+    db.flush()  # Get user ID
+    
+    # 7. Mark invitation as accepted (once, even under concurrent requests)
+    if not seats.close_invitation(
+        db, invitation, "accepted", accepted_at=datetime.utcnow(), accepted_by=new_user.id
+    ):
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invitation is no longer pending"
+        )
     
-    # 8. Mark invitation as accepted
-    invitation.status = "accepted"
-    invitation.accepted_at = datetime.utcnow()
-    invitation.accepted_by = new_user.id
+    # 8. Queue verification email
+    queue_verification_email(db, new_user.email, verification_token)
     
     db.commit()
     db.refresh(new_user)
     
-    # 9. Send verification email
-    await send_verification_email(new_user.email, verification_token)
-    
-    # 10. Create access token
+    # 9. Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": str(new_user.id)},
@@ -1,10 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from uuid import UUID
 from ..database import get_db
-from ..models import Patient as PatientModel, User
-from ..schemas import Patient, PatientCreate
+from ..models import (
+    BedHistory as BedHistoryModel,
+    Diagnostic as DiagnosticModel,
+    Patient as PatientModel,
+    Treatment as TreatmentModel,
+    User,
+)
+from ..schemas import Patient, PatientCreate, PatientExport, PatientPatch
 from ..auth import get_current_user
+from ..rut import normalize_rut
+from ..serialization import patient_list
+from ..services import archive
+from ..services.idempotency import IdempotencyClaim, idempotency_claim
+from ..services.patches import patch_row
+from ..services.patient_search import search_patients
 
 router = APIRouter()
 
@@ -21,28 +35,73 @@ async def read_patients(
     if current_user.team_id:
         query = query.filter(PatientModel.team_id == current_user.team_id)
     patients = query.offset(skip).limit(limit).all()
-    return patients
+    return patient_list.response(patients)
+
+
+@router.get("/patients/search", response_model=List[Patient])
+def search(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Patients whose RUT starts with ``q`` (digits, dots optional) or whose
+    name resembles it, best match first"""
+    patients = search_patients(db, current_user.team_id, q, limit)
+    return patient_list.response(patients)
 
 
 @router.post("/patients", response_model=Patient)
-async def create_patient(
+def create_patient(
     patient: PatientCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    claim: Optional[IdempotencyClaim] = Depends(idempotency_claim),
 ):
-    patient_data = patient.dict()
-    # Set team_id from current user
-    patient_data["team_id"] = current_user.team_id
-    db_patient = PatientModel(**patient_data)
-    db.add(db_patient)
-    db.commit()
+    """Create a patient, or update the team's patient with the same RUT"""
+    # A retry of a request that already ran gets its response back
+    if claim and claim.replay:
+        return claim.replay
+    # A concurrent create of the same RUT loses on the unique index; the
+    # retry then finds its row and updates it
+    for attempt in range(2):
+        # The rollback released the key's lock: take it again
+        if claim and attempt and claim.begin():
+            return claim.replay
+        db_patient = _find_by_rut(db, current_user.team_id, patient.rut)
+        if db_patient is None:
+            patient_data = patient.dict()
+            # Set team_id from current user
+            patient_data["team_id"] = current_user.team_id
+            db_patient = PatientModel(**patient_data)
+            db.add(db_patient)
+        else:
+            for key, value in patient.dict().items():
+                setattr(db_patient, key, value)
+        if claim:
+            claim.record(Patient, db_patient)
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
     db.refresh(db_patient)
     return db_patient
 
 
+def _find_by_rut(db: Session, team_id, rut: str):
+    query = db.query(PatientModel).filter(PatientModel.rut_normalized == normalize_rut(rut))
+    if team_id:
+        return query.filter(PatientModel.team_id == team_id).first()
+    return query.filter(PatientModel.team_id.is_(None)).first()
+
+
 @router.get("/patients/{patient_id}", response_model=Patient)
 async def read_patient(
-    patient_id: str,
+    patient_id: UUID,
+    include_archived: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -51,11 +110,41 @@ async def read_patient(
     if current_user.team_id:
         query = query.filter(PatientModel.team_id == current_user.team_id)
     patient = query.first()
+    # Archived patients may have moved to the cold archive
+    if patient is None and include_archived:
+        patient = archive.find_patient(db, current_user.team_id, patient_id)
     if patient is None:
         raise HTTPException(status_code=404, detail="Patient not found")
     return patient
 
 
+@router.get("/patients/{patient_id}/export", response_model=PatientExport)
+def export_patient(
+    patient_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """The patient with all its records, live and archived"""
+    query = db.query(PatientModel).filter(PatientModel.id == patient_id)
+    if current_user.team_id:
+        query = query.filter(PatientModel.team_id == current_user.team_id)
+    patient = query.first() or archive.find_patient(db, current_user.team_id, patient_id)
+    if patient is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    # Live and archived rows of a table never overlap: archiving moves them
+    archived = archive.patient_records(db, current_user.team_id, patient_id)
+    records = {}
+    for table, model in (
+        ("diagnostics", DiagnosticModel),
+        ("treatments", TreatmentModel),
+        ("bed_history", BedHistoryModel),
+    ):
+        live = db.query(model).filter(model.patient_id == patient_id).all()
+        records[table] = [*archived[table], *live]
+    return {"patient": patient, **records}
+
+
 @router.put("/patients/{patient_id}", response_model=Patient)
 async def update_patient(
     patient_id: str,
@@ -70,13 +159,44 @@ async def update_patient(
     db_patient = query.first()
     if db_patient is None:
         raise HTTPException(status_code=404, detail="Patient not found")
+    same_rut = _find_by_rut(db, db_patient.team_id, patient.rut)
+    if same_rut is not None and same_rut.id != db_patient.id:
+        raise HTTPException(status_code=409, detail="Another patient has this RUT")
     for key, value in patient.dict().items():
         setattr(db_patient, key, value)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Another patient has this RUT")
     db.refresh(db_patient)
     return db_patient
 
 
+@router.patch("/patients/{patient_id}", response_model=Patient)
+def patch_patient(
+    patient_id: UUID,
+    patch: PatientPatch,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Update the fields sent, if the patient is still at ``version``; 409 if not"""
+    values = patch.model_dump(exclude_unset=True)
+    if "rut" in values:
+        values["rut_normalized"] = normalize_rut(values["rut"])
+    criteria = []
+    if current_user.team_id:
+        criteria.append(PatientModel.team_id == current_user.team_id)
+    try:
+        db_patient = patch_row(db, PatientModel, patient_id, values, *criteria)
+        response = Patient.model_validate(db_patient)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Another patient has this RUT")
+    return response
+
+
 @router.delete("/patients/{patient_id}")
 async def delete_patient(
     patient_id: str,
@@ -1,18 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional
 from uuid import UUID
 from datetime import datetime, timedelta
+import json
 import stripe
 import os
 from .. import models, schemas
 from ..database import get_db
 from ..auth import get_current_active_user
+from ..services import stripe_client
+from ..services.entitlements import PLAN_MEMBER_LIMITS
+from ..services.stripe_events import record_event
 
 router = APIRouter(prefix="/subscriptions", tags=["subscriptions"])
 
-# Initialize Stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "sk_test_placeholder")
+# Stripe is configured in services/stripe_client.py
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "whsec_placeholder")
 
 # Stripe Price IDs (these need to be created in your Stripe dashboard)
@@ -22,6 +26,25 @@ STRIPE_PRICES = {
 }
 
 
+@router.get("/plans")
+async def list_plans():
+    """Price of each plan, for the pricing page"""
+    
+    try:
+        return {
+            plan: await stripe_client.get_price(price_id)
+            for plan, price_id in STRIPE_PRICES.items()
+            if not price_id.endswith("_placeholder")
+        }
+    except stripe_client.CircuitOpenError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except stripe.error.StripeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Stripe error: {str(e)}"
+        )
+
+
 @router.post("/checkout")
 async def create_checkout_session(
     plan: str,  # "basic" or "premium"
@@ -56,7 +79,7 @@ async def create_checkout_session(
         # Create Stripe checkout session
         frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173/biotrack")
         
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = await stripe_client.create_checkout_session(
             customer_email=current_user.email,
             mode="subscription",
             payment_method_types=["card"],
@@ -79,6 +102,8 @@ async def create_checkout_session(
             "session_id": checkout_session.id
         }
         
+    except stripe_client.CircuitOpenError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except stripe.error.StripeError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -114,7 +139,7 @@ async def create_customer_portal(
         # Create Stripe customer portal session
         frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173/biotrack")
         
-        portal_session = stripe.billing_portal.Session.create(
+        portal_session = await stripe_client.create_portal_session(
             customer=team.stripe_customer_id,
             return_url=f"{frontend_url}/teams/manage",
         )
@@ -123,6 +148,8 @@ async def create_customer_portal(
             "url": portal_session.url
         }
         
+    except stripe_client.CircuitOpenError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except stripe.error.StripeError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -192,31 +219,32 @@ async def downgrade_subscription(
             detail="Team is not on premium plan"
         )
     
-    # Count current members
-    member_count = db.query(models.User).filter(models.User.team_id == team.id).count()
+    member_count = team.member_count
+    basic_limit = PLAN_MEMBER_LIMITS["basic"]
     
-    # Basic plan allows 5 members, premium allows 15
-    if member_count > 5:
+    if member_count > basic_limit:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Cannot downgrade. Team has {member_count} members. Remove members to get under 5 members first."
+            detail=f"Cannot downgrade. Team has {member_count} members. Remove members to get under {basic_limit} members first."
         )
     
     # Update subscription in Stripe
     if team.stripe_subscription_id:
         try:
-            subscription = stripe.Subscription.retrieve(team.stripe_subscription_id)
+            item_id = await stripe_client.get_subscription_item_id(team.stripe_subscription_id)
             
             # Update subscription to basic plan
-            stripe.Subscription.modify(
+            await stripe_client.modify_subscription(
                 team.stripe_subscription_id,
                 items=[{
-                    'id': subscription['items']['data'][0].id,
+                    'id': item_id,
                     'price': STRIPE_PRICES["basic"],
                 }],
                 proration_behavior='create_prorations',  # Prorate the change
             )
             
+        except stripe_client.CircuitOpenError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
         except stripe.error.StripeError as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -225,14 +253,14 @@ async def downgrade_subscription(
     
     # Update team
     team.subscription_plan = "basic"
-    team.member_limit = 5
+    team.member_limit = basic_limit
     team.updated_at = datetime.utcnow()
     db.commit()
     
     return {
         "message": "Successfully downgraded to basic plan",
         "plan": "basic",
-        "member_limit": 5
+        "member_limit": basic_limit
     }
 
 
@@ -247,10 +275,13 @@ async def stripe_webhook(
     sig_header = request.headers.get("stripe-signature")
     
     try:
-        # Verify webhook signature
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, STRIPE_WEBHOOK_SECRET
+        # Verify webhook signature. The event is stored as plain JSON, so
+        # skip building a stripe.Event from it.
+        stripe.WebhookSignature.verify_header(
+            payload.decode("utf-8"), sig_header, STRIPE_WEBHOOK_SECRET,
+            stripe.Webhook.DEFAULT_TOLERANCE
         )
+        event = json.loads(payload)
         
     except ValueError:
         # Invalid payload
@@ -259,93 +290,8 @@ async def stripe_webhook(
         # Invalid signature
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    # Handle different event types
-    event_type = event['type']
-    
-    if event_type == "checkout.session.completed":
-        # Payment successful, create team
-        session = event['data']['object']
-        
-        user_id = session['metadata'].get('user_id')
-        plan = session['metadata'].get('plan', 'basic')
-        
-        if user_id:
-            user = db.query(models.User).filter(models.User.id == user_id).first()
-            if user and not user.team_id:
-                # Create team
-                member_limit = 5 if plan == "basic" else 15
-                team = models.Team(
-                    name=f"{user.name}'s Team",
-                    subscription_status="active",
-                    subscription_plan=plan,
-                    member_limit=member_limit,
-                    stripe_customer_id=session.get('customer'),
-                    stripe_subscription_id=session.get('subscription')
-                )
-                db.add(team)
-                db.flush()
-                
-                # Assign user as team owner
-                user.team_id = team.id
-                user.team_role = "owner"
-                user.role = "advanced"
-                
-                db.commit()
-    
-    elif event_type == "customer.subscription.updated":
-        # Subscription plan changed
-        subscription = event['data']['object']
-        
-        # Find team by subscription ID
-        team = db.query(models.Team).filter(
-            models.Team.stripe_subscription_id == subscription['id']
-        ).first()
-        
-        if team:
-            # Update subscription status
-            status_mapping = {
-                "active": "active",
-                "past_due": "active",  # Keep active but may need payment
-                "canceled": "cancelled",
-                "unpaid": "expired",
-                "incomplete": "trial",
-                "incomplete_expired": "expired"
-            }
-            
-            team.subscription_status = status_mapping.get(
-                subscription['status'], 
-                "active"
-            )
-            team.updated_at = datetime.utcnow()
-            db.commit()
-    
-    elif event_type == "customer.subscription.deleted":
-        # Subscription cancelled
-        subscription = event['data']['object']
-        
-        # Find team by subscription ID
-        team = db.query(models.Team).filter(
-            models.Team.stripe_subscription_id == subscription['id']
-        ).first()
-        
-        if team:
-            team.subscription_status = "cancelled"
-            team.updated_at = datetime.utcnow()
-            db.commit()
-    
-    elif event_type == "invoice.payment_failed":
-        # Payment failed
-        invoice = event['data']['object']
-        customer_id = invoice.get('customer')
-        
-        # Find team by customer ID
-        team = db.query(models.Team).filter(
-            models.Team.stripe_customer_id == customer_id
-        ).first()
-        
-        if team:
-            # TODO: Send email notification in Phase 4
-            # send_payment_failed_email(team.owner_email, team.name)
-            pass
+    # Store the event and answer right away; StripeEventWorker applies it.
+    # A redelivered event is already stored and is ignored.
+    await run_in_threadpool(record_event, db, event)
     
     return {"status": "success"}
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models import User
+from ..schemas import SyncPage
+from ..auth import get_current_user
+from ..services import changes
+
+router = APIRouter()
+
+
+@router.get("/sync", response_model=SyncPage)
+def sync(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Changes to the team's patients, treatments, diagnostics, beds and bed
+    history after change number ``since``. Start from 0, then pass ``next``
+    back until ``has_more`` is false."""
+    return changes.read_changes(db, current_user.team_id, since, limit)
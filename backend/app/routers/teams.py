@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 from .. import models, schemas
 from ..database import get_db
 from ..auth import get_current_active_user, get_current_verified_user
+from ..services import seats
+from ..services.entitlements import PLAN_MEMBER_LIMITS
 
 router = APIRouter(prefix="/teams", tags=["teams"])
 
@@ -57,13 +59,14 @@ def create_team(
         name=team.name,
         subscription_status="trial",
         subscription_plan="basic",  # Default to basic plan
-        member_limit=5,  # Default to 5 members (basic plan limit)
+        member_limit=PLAN_MEMBER_LIMITS["basic"],
         trial_ends_at=datetime.utcnow() + timedelta(days=14)
     )
     db.add(new_team)
     db.flush()  # Get team ID
     
-    # Assign user as team owner
+    # Assign user as team owner, taking the team's first seat
+    seats.add_member_seat(db, new_team.id)
     current_user.team_id = new_team.id
     current_user.team_role = "owner"
     current_user.role = "advanced"
@@ -166,6 +169,13 @@ def restore_team(
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     
+    # Past the grace period the team may already be partly purged
+    if team.deletion_scheduled_for and team.deletion_scheduled_for <= datetime.utcnow():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The grace period has ended and the team is being deleted"
+        )
+    
     # Restore team
     team.deleted_at = None
     team.deletion_scheduled_for = None
@@ -280,6 +290,7 @@ def remove_team_member(
     user.team_id = None
     user.team_role = None
     user.role = "basic"
+    seats.release_member_seat(db, team_id)
     
     db.commit()
     
@@ -349,6 +360,7 @@ def leave_team(
         )
 
     # Remove user from team
+    seats.release_member_seat(db, current_user.team_id)
     current_user.team_id = None
     current_user.team_role = None
     current_user.role = "basic"
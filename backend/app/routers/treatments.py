@@ -1,16 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from uuid import UUID
+from datetime import date
 from ..database import get_db
 from ..models import Treatment as TreatmentModel, Patient as PatientModel
-from ..schemas import Treatment, TreatmentCreate
+from ..schemas import Treatment, TreatmentCreate, TreatmentPatch
 from ..auth import get_current_user
+from ..services.idempotency import IdempotencyClaim, idempotency_claim
+from ..services.patches import patch_row
+from ..serialization import treatment_list
+from ..services import archive
 
 router = APIRouter()
 
 @router.get("/treatments", response_model=List[Treatment])
-def read_treatments(patient_id: UUID = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def read_treatments(patient_id: UUID = None, since: Optional[date] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     query = db.query(TreatmentModel)
     
     # If patient_id is provided, filter by patient
@@ -21,11 +26,19 @@ def read_treatments(patient_id: UUID = None, skip: int = 0, limit: int = 100, db
             raise HTTPException(status_code=404, detail="Patient not found")
         query = query.filter(TreatmentModel.patient_id == patient_id)
     
+    # Only recent partitions are read when the date is bounded
+    if since:
+        query = query.filter(TreatmentModel.start_date >= since)
+    
     treatments = query.offset(skip).limit(limit).all()
-    return treatments
+    return treatment_list.response(treatments)
 
 @router.post("/treatments", response_model=Treatment)
-def create_treatment(treatment: TreatmentCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def create_treatment(treatment: TreatmentCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user), claim: Optional[IdempotencyClaim] = Depends(idempotency_claim)):
+    # A retry of a request that already ran gets its response back
+    if claim and claim.replay:
+        return claim.replay
+
     # Verify patient exists
     patient = db.query(PatientModel).filter(PatientModel.id == treatment.patient_id).first()
     if not patient:
@@ -36,13 +49,18 @@ def create_treatment(treatment: TreatmentCreate, db: Session = Depends(get_db),
         created_by_user_id=current_user.id
     )
     db.add(db_treatment)
+    if claim:
+        claim.record(Treatment, db_treatment)
     db.commit()
     db.refresh(db_treatment)
     return db_treatment
 
 @router.get("/treatments/{treatment_id}", response_model=Treatment)
-def read_treatment(treatment_id: str, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def read_treatment(treatment_id: UUID, include_archived: bool = False, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     treatment = db.query(TreatmentModel).filter(TreatmentModel.id == treatment_id).first()
+    # Finished treatments may have moved to the cold archive
+    if treatment is None and include_archived:
+        treatment = archive.find_treatment(db, current_user.team_id, treatment_id)
     if treatment is None:
         raise HTTPException(status_code=404, detail="Treatment not found")
     return treatment
@@ -59,6 +77,17 @@ def update_treatment(treatment_id: str, treatment: TreatmentCreate, db: Session
     db.refresh(db_treatment)
     return db_treatment
 
+@router.patch("/treatments/{treatment_id}", response_model=Treatment)
+def patch_treatment(treatment_id: UUID, patch: TreatmentPatch, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    """Update the fields sent, if the treatment is still at ``version``; 409 if not"""
+    criteria = []
+    if current_user.team_id:
+        criteria.append(PatientModel.team_id == current_user.team_id)
+    db_treatment = patch_row(db, TreatmentModel, treatment_id, patch.model_dump(exclude_unset=True), *criteria)
+    response = Treatment.model_validate(db_treatment)
+    db.commit()
+    return response
+
 @router.delete("/treatments/{treatment_id}")
 def delete_treatment(treatment_id: str, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     db_treatment = db.query(TreatmentModel).filter(TreatmentModel.id == treatment_id).first()
@@ -0,0 +1,34 @@
+"""
+Chilean RUT normalization and check-digit validation.
+
+A RUT is a body of digits and a check digit (0-9 or K) computed from the body
+with modulo 11. It is written with or without dots, dash and leading zeros
+(``12.345.678-5``, ``12345678-5``, ``123456785``); ``normalize_rut`` reduces
+all of them to ``12345678-5``. That form is what ``Patient.rut_normalized``
+stores and what patients are unique by within a team.
+"""
+
+import re
+
+_RUT = re.compile(r"(\d{1,9})([\dK])")
+
+
+def check_digit(body: str) -> str:
+    """Check digit of a RUT body."""
+    total, factor = 0, 2
+    for digit in reversed(body):
+        total += int(digit) * factor
+        factor = 2 if factor == 7 else factor + 1
+    remainder = 11 - total % 11
+    return {11: "0", 10: "K"}.get(remainder, str(remainder))
+
+
+def normalize_rut(value: str) -> str:
+    """``value`` as ``<body>-<check digit>``; ValueError when it is not a valid RUT."""
+    match = _RUT.fullmatch(re.sub(r"[.\s-]", "", value).upper())
+    if match is None:
+        raise ValueError("RUT must be digits followed by a check digit (0-9 or K)")
+    body, digit = match.group(1).lstrip("0"), match.group(2)
+    if not body or check_digit(body) != digit:
+        raise ValueError("RUT check digit does not match")
+    return f"{body}-{digit}"
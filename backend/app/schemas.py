@@ -1,7 +1,8 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import List, Optional
 from datetime import date, datetime
 from uuid import UUID
+from .rut import normalize_rut
 
 
 # User schemas
@@ -60,13 +61,43 @@ class PatientBase(BaseModel):
 
 
 class PatientCreate(PatientBase):
-    pass
+    @field_validator("rut")
+    @classmethod
+    def rut_must_be_valid(cls, value):
+        normalize_rut(value)
+        return value
+
+
+# PATCH sends the fields that changed and the version they were read at
+class PatientPatch(BaseModel):
+    version: int
+    rut: Optional[str] = None
+    name: Optional[str] = None
+    age: Optional[int] = None
+    status: Optional[str] = None
+    unit: Optional[str] = None
+    bed_number: Optional[int] = None
+    has_ending_soon_program: Optional[bool] = None
+
+    @field_validator("rut", "name", "status", "unit")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
+    @field_validator("rut")
+    @classmethod
+    def rut_must_be_valid(cls, value):
+        normalize_rut(value)
+        return value
 
 
 class Patient(PatientBase):
     id: UUID
     created_at: datetime
     updated_at: datetime
+    version: Optional[int] = None  # None for records in the cold archive
 
     class Config:
         from_attributes = True
@@ -86,6 +117,32 @@ class DiagnosticBase(BaseModel):
 
 class DiagnosticCreate(DiagnosticBase):
     patient_id: UUID
+    # Diagnostics are partitioned by this date, so a missing one means today
+    date_diagnosed: date = Field(default_factory=date.today)
+
+    @field_validator("date_diagnosed", mode="before")
+    @classmethod
+    def default_to_today(cls, value):
+        return value or date.today()
+
+
+class DiagnosticPatch(BaseModel):
+    version: int
+    diagnosis_name: Optional[str] = None
+    diagnosis_code: Optional[str] = None
+    date_diagnosed: Optional[date] = None
+    severity: Optional[str] = None
+    notes: Optional[str] = None
+    created_by: Optional[str] = None
+    category_id: Optional[UUID] = None
+    subcategory_id: Optional[UUID] = None
+
+    @field_validator("diagnosis_name", "date_diagnosed")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
 
 
 class Diagnostic(DiagnosticBase):
@@ -94,6 +151,7 @@ class Diagnostic(DiagnosticBase):
     created_by_user_id: Optional[UUID] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    version: Optional[int] = None  # None for records in the cold archive
 
     class Config:
         from_attributes = True
@@ -113,6 +171,32 @@ class TreatmentBase(BaseModel):
 
 class TreatmentCreate(TreatmentBase):
     patient_id: UUID
+    # Treatments are partitioned by this date, so a missing one means today
+    start_date: date = Field(default_factory=date.today)
+
+    @field_validator("start_date", mode="before")
+    @classmethod
+    def default_to_today(cls, value):
+        return value or date.today()
+
+
+class TreatmentPatch(BaseModel):
+    version: int
+    antibiotic_name: Optional[str] = None
+    antibiotic_type: Optional[str] = None
+    start_date: Optional[date] = None
+    days_applied: Optional[int] = None
+    programmed_days: Optional[int] = None
+    status: Optional[str] = None
+    start_count: Optional[int] = None
+    dosage: Optional[str] = None
+
+    @field_validator("antibiotic_name", "antibiotic_type", "start_date", "status")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
 
 
 class Treatment(TreatmentBase):
@@ -121,6 +205,7 @@ class Treatment(TreatmentBase):
     created_by_user_id: Optional[UUID] = None
     created_at: datetime
     updated_at: datetime
+    version: Optional[int] = None  # None for records in the cold archive
 
     class Config:
         from_attributes = True
@@ -183,6 +268,29 @@ class BedHistory(BedHistoryBase):
         from_attributes = True
 
 
+# A patient with all its records, including those in the cold archive
+class PatientExport(BaseModel):
+    patient: Patient
+    diagnostics: List[Diagnostic]
+    treatments: List[Treatment]
+    bed_history: List[BedHistory]
+
+
+# Delta sync: changes after a change number, oldest first
+class SyncChange(BaseModel):
+    seq: int
+    table: str  # patients, treatments, diagnostics, beds, bed_history
+    id: UUID
+    op: str  # upsert, delete
+    data: Optional[dict] = None  # the row as its endpoints return it; None when deleted
+
+
+class SyncPage(BaseModel):
+    changes: List[SyncChange]
+    next: int  # pass as ``since`` for the next page
+    has_more: bool
+
+
 # Team schemas
 class TeamCreate(BaseModel):
     name: str
@@ -234,6 +342,22 @@ class TeamInvitationCreate(BaseModel):
     role: str = "member"  # admin, member
 
 
+class TeamInvitationBulkCreate(BaseModel):
+    emails: List[EmailStr] = Field(..., min_length=1, max_length=500)
+    role: str = "member"  # admin, member
+
+
+class BulkInvitationResult(BaseModel):
+    email: str
+    status: str  # invited, already_member, already_invited, duplicate, seat_limit
+    invitation_id: Optional[UUID] = None
+
+
+class TeamInvitationBulkResponse(BaseModel):
+    invited: int
+    results: List[BulkInvitationResult]
+
+
 class InvitationResponse(BaseModel):
     id: UUID
     team_id: UUID
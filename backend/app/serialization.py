@@ -0,0 +1,74 @@
+"""
+Fast JSON serialization for list endpoints.
+
+When a route returns ORM rows, FastAPI validates every row against the
+``response_model``, runs ``jsonable_encoder`` over the validated objects and
+finally encodes the result with the stdlib ``json`` module. For the list
+endpoints that work costs more than the query itself.
+
+``ListSerializer`` builds everything it needs once at import time. By default
+it trusts the ORM output: it reads the schema's fields straight off each row
+and encodes the result with orjson in a single pass. Pass ``validate=True`` to
+run the rows through a prebuilt pydantic ``TypeAdapter`` and let pydantic-core
+encode them instead.
+
+Routes keep their ``response_model`` so the OpenAPI schema is unchanged; since
+they return a ``Response`` directly, FastAPI skips its own serialization.
+"""
+
+from typing import Any, Iterable, List
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+from . import schemas
+
+
+class ListSerializer:
+    """Serialize lists of ORM rows as a JSON array of ``schema`` objects."""
+
+    def __init__(self, schema: type[BaseModel]):
+        self.schema = schema
+        self.fields = tuple(schema.model_fields)
+        self.adapter = TypeAdapter(List[schema])
+
+    def to_python(self, rows: Iterable[Any]) -> list[dict]:
+        """Read the schema's fields off each row without validating them."""
+        fields = self.fields
+        items = []
+        for row in rows:
+            # Loaded column values live in the instance __dict__; reading them
+            # there skips the instrumented descriptor. Expired or deferred
+            # attributes are missing and go through getattr to be loaded.
+            loaded = row.__dict__
+            items.append(
+                {
+                    name: loaded[name] if name in loaded else getattr(row, name)
+                    for name in fields
+                }
+            )
+        return items
+
+    def dumps(self, rows: Iterable[Any], validate: bool = False) -> bytes:
+        """Encode rows to JSON bytes."""
+        if validate:
+            items = self.adapter.validate_python(list(rows), from_attributes=True)
+            return self.adapter.dump_json(items)
+        return orjson.dumps(self.to_python(rows))
+
+    def response(self, rows: Iterable[Any], validate: bool = False) -> Response:
+        """Build a JSON response for rows."""
+        return Response(
+            content=self.dumps(rows, validate=validate), media_type="application/json"
+        )
+
+
+patient_list = ListSerializer(schemas.Patient)
+treatment_list = ListSerializer(schemas.Treatment)
+diagnostic_list = ListSerializer(schemas.Diagnostic)
+bed_list = ListSerializer(schemas.Bed)
+bed_history_list = ListSerializer(schemas.BedHistory)
+antibiotic_list = ListSerializer(schemas.Antibiotic)
+diagnostic_category_list = ListSerializer(schemas.DiagnosticCategory)
+diagnostic_subcategory_list = ListSerializer(schemas.DiagnosticSubcategory)
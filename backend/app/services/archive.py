@@ -0,0 +1,323 @@
+"""
+Cold archive of closed clinical records.
+
+Archived patients (``status = 'archived'``) and finished treatments are most
+of the clinical rows and are rarely read again. ``ArchiveWorker`` moves the
+ones nobody has touched for ``after_days`` out of the database into
+zstd-compressed Parquet files, per team and month, under ``ARCHIVE_DIR``:
+
+    <ARCHIVE_DIR>/<team_id>/<YYYY-MM>/<table>-<uuid>.parquet
+
+An archived patient moves together with its diagnostics, treatments and bed
+history, which reference it; the month is that of the patient's last update.
+A finished treatment of a patient still in care moves on its own, in the
+month it started.
+
+Each batch writes its files first, then, in one transaction, records them in
+``archive_files`` and deletes exactly the rows it wrote (locked since they
+were read). If that transaction fails, the files are removed; if the process
+dies in between, the files stay behind with no ``archive_files`` row. Readers
+only open files listed there, so nothing is read twice, and the rows are
+archived again on the next run.
+
+Reads go through the manifest: ``find_patient``, ``find_treatment`` and
+``patient_records`` open the team's files for a table and filter them by id
+with the Parquet statistics. The patient and treatment detail endpoints use
+them with ``include_archived=true``, and the patient export always does.
+
+Needs ``pyarrow``; without it the worker logs an error and the archive reads
+as empty. The worker runs inside the app when ``ARCHIVE_WORKER_ENABLED`` is
+set (see ``main.py``) or on its own with ``python -m app.services.archive``.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional
+from uuid import UUID, uuid4
+import asyncio
+import logging
+import os
+import shutil
+
+import anyio
+from sqlalchemy import Boolean, Date, Integer, TIMESTAMP, delete
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import GUID, SessionLocal
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.getcwd(), "archive"))
+
+ARCHIVED_MODELS = {
+    "patients": models.Patient,
+    "diagnostics": models.Diagnostic,
+    "treatments": models.Treatment,
+    "bed_history": models.BedHistory,
+}
+
+# Tables archived along with their patient
+PATIENT_RECORDS = ("diagnostics", "treatments", "bed_history")
+
+
+def _arrow_type(column):
+    if isinstance(column.type, GUID):
+        return pyarrow.string()
+    if isinstance(column.type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column.type, Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, Date):
+        return pyarrow.date32()
+    if isinstance(column.type, TIMESTAMP):
+        return pyarrow.timestamp("us")
+    return pyarrow.string()
+
+
+@lru_cache(maxsize=None)
+def arrow_schema(table: str):
+    """Parquet schema of a table, from its model's columns."""
+    columns = ARCHIVED_MODELS[table].__table__.columns
+    return pyarrow.schema([(column.name, _arrow_type(column)) for column in columns])
+
+
+def _to_record(row) -> dict:
+    record = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.key)
+        record[column.name] = str(value) if isinstance(value, UUID) else value
+    return record
+
+
+def _from_record(table: str, record: dict) -> dict:
+    for column in ARCHIVED_MODELS[table].__table__.columns:
+        if isinstance(column.type, GUID) and record.get(column.name) is not None:
+            record[column.name] = UUID(record[column.name])
+    return record
+
+
+def _team_dir(team_id: Optional[UUID]) -> str:
+    return str(team_id) if team_id else "no-team"
+
+
+def write_file(team_id: Optional[UUID], month: date, table: str, rows: list) -> str:
+    """Write rows to a new Parquet file; return its path relative to ``ARCHIVE_DIR``."""
+    relative = os.path.join(
+        _team_dir(team_id), f"{month:%Y-%m}", f"{table}-{uuid4().hex}.parquet"
+    )
+    path = os.path.join(ARCHIVE_DIR, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    records = pyarrow.Table.from_pylist([_to_record(row) for row in rows], schema=arrow_schema(table))
+    # Written aside and renamed, so a file is either complete or absent
+    pyarrow.parquet.write_table(records, path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+    return relative
+
+
+def _remove_files(paths: List[str]) -> None:
+    for relative in paths:
+        try:
+            os.remove(os.path.join(ARCHIVE_DIR, relative))
+        except FileNotFoundError:
+            pass
+
+
+def read_archive(db: Session, team_id: Optional[UUID], table: str, **equals) -> List[dict]:
+    """Archived rows of a team's table whose columns equal ``equals``."""
+    if pyarrow is None:
+        return []
+    query = db.query(models.ArchiveFile.path).filter(models.ArchiveFile.table_name == table)
+    if team_id:
+        query = query.filter(models.ArchiveFile.team_id == team_id)
+    else:
+        query = query.filter(models.ArchiveFile.team_id.is_(None))
+    paths = [os.path.join(ARCHIVE_DIR, path) for (path,) in query]
+    if not paths:
+        return []
+    condition = None
+    for name, value in equals.items():
+        term = pyarrow.dataset.field(name) == str(value)
+        condition = term if condition is None else condition & term
+    dataset = pyarrow.dataset.dataset(paths, schema=arrow_schema(table), format="parquet")
+    return [_from_record(table, record) for record in dataset.to_table(filter=condition).to_pylist()]
+
+
+def find_patient(db: Session, team_id: Optional[UUID], patient_id: UUID) -> Optional[dict]:
+    found = read_archive(db, team_id, "patients", id=patient_id)
+    return found[0] if found else None
+
+
+def find_treatment(db: Session, team_id: Optional[UUID], treatment_id: UUID) -> Optional[dict]:
+    found = read_archive(db, team_id, "treatments", id=treatment_id)
+    return found[0] if found else None
+
+
+def patient_records(db: Session, team_id: Optional[UUID], patient_id: UUID) -> Dict[str, List[dict]]:
+    """A patient's archived diagnostics, treatments and bed history."""
+    return {
+        table: read_archive(db, team_id, table, patient_id=patient_id) for table in PATIENT_RECORDS
+    }
+
+
+def delete_team_archive(team_id: UUID) -> None:
+    """Remove a purged team's files (its ``archive_files`` rows go with the purge)."""
+    shutil.rmtree(os.path.join(ARCHIVE_DIR, _team_dir(team_id)), ignore_errors=True)
+
+
+def _month(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+@dataclass(frozen=True)
+class ArchiveSettings:
+    after_days: int = 90  # untouched for this long before moving to the archive
+    batch_size: int = 500
+    batch_pause: float = 1.0  # seconds between batches
+    interval: float = 86400.0  # seconds between runs
+
+    @classmethod
+    def from_env(cls) -> "ArchiveSettings":
+        return cls(
+            after_days=int(os.getenv("ARCHIVE_AFTER_DAYS", "90")),
+            batch_size=int(os.getenv("ARCHIVE_BATCH_SIZE", "500")),
+            interval=float(os.getenv("ARCHIVE_INTERVAL", "86400")),
+        )
+
+
+class ArchiveWorker:
+    def __init__(self, session_factory=SessionLocal, settings: Optional[ArchiveSettings] = None):
+        self.session_factory = session_factory
+        self.settings = settings or ArchiveSettings.from_env()
+        self._stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Archive closed records every ``interval`` seconds until ``stop()`` is called."""
+        while not self._stopped.is_set():
+            try:
+                await self.archive()
+            except Exception:
+                logger.exception("Archiving failed")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.settings.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def archive(self) -> int:
+        """Move every closed record past the cutoff; return how many top-level rows moved."""
+        if pyarrow is None:
+            logger.error("Archiving needs pyarrow, which is not installed")
+            return 0
+        cutoff = datetime.utcnow() - timedelta(days=self.settings.after_days)
+        total = 0
+        for archive_batch in (self._archive_patients, self._archive_treatments):
+            while not self._stopped.is_set():
+                moved = await anyio.to_thread.run_sync(archive_batch, cutoff)
+                total += moved
+                if moved < self.settings.batch_size:
+                    break
+                await asyncio.sleep(self.settings.batch_pause)
+        if total:
+            logger.info("Archived %d patients and treatments", total)
+        return total
+
+    def _archive_patients(self, cutoff: datetime) -> int:
+        """Archive a batch of archived patients with all their records."""
+        db = self.session_factory()
+        try:
+            patients = (
+                db.query(models.Patient)
+                .filter(models.Patient.status == "archived", models.Patient.updated_at < cutoff)
+                .order_by(models.Patient.id)
+                .limit(self.settings.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not patients:
+                return 0
+            owner = {patient.id: (patient.team_id, _month(patient.updated_at)) for patient in patients}
+            groups = defaultdict(list)
+            for patient in patients:
+                groups[(*owner[patient.id], "patients")].append(patient)
+            for table in PATIENT_RECORDS:
+                model = ARCHIVED_MODELS[table]
+                records = (
+                    db.query(model).filter(model.patient_id.in_(list(owner))).with_for_update().all()
+                )
+                for record in records:
+                    groups[(*owner[record.patient_id], table)].append(record)
+            # Children first: patients are referenced by them
+            order = [*PATIENT_RECORDS, "patients"]
+            self._move(db, sorted(groups.items(), key=lambda item: order.index(item[0][2])))
+            return len(patients)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _archive_treatments(self, cutoff: datetime) -> int:
+        """Archive a batch of finished treatments of patients still in care."""
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(models.Treatment, models.Patient.team_id)
+                .join(models.Patient, models.Treatment.patient_id == models.Patient.id)
+                .filter(models.Treatment.status == "finished", models.Treatment.updated_at < cutoff)
+                .order_by(models.Treatment.id)
+                .limit(self.settings.batch_size)
+                .with_for_update(of=models.Treatment, skip_locked=True)
+                .all()
+            )
+            if not rows:
+                return 0
+            groups = defaultdict(list)
+            for treatment, team_id in rows:
+                groups[(team_id, _month(treatment.start_date), "treatments")].append(treatment)
+            self._move(db, list(groups.items()))
+            return len(rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _move(self, db: Session, groups: list) -> None:
+        """Write each (team, month, table) group to a file, then record the
+        files and delete their rows in one transaction."""
+        written = []
+        try:
+            for (team_id, month, table), rows in groups:
+                path = write_file(team_id, month, table, rows)
+                written.append(path)
+                db.add(models.ArchiveFile(
+                    team_id=team_id, table_name=table, month=month, path=path, row_count=len(rows)
+                ))
+                model = ARCHIVED_MODELS[table]
+                db.execute(
+                    delete(model)
+                    .where(model.id.in_([row.id for row in rows]))
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+        except BaseException:
+            db.rollback()
+            _remove_files(written)
+            raise
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(ArchiveWorker().run())
@@ -0,0 +1,179 @@
+"""
+Change feed of patients, treatments, diagnostics, beds and bed history.
+
+Every insert, update and delete of those rows made through the ORM is
+recorded in ``changes`` in the same transaction, once per row and
+transaction, with the row's team (beds belong to no team and are shared by
+all). The change numbers (``seq``) are handed out from the single
+``change_sequence`` row just before commit. That row stays locked until the
+commit, so numbers follow commit order: once a client has read up to N, no
+change numbered N or below can still appear. The lock is only held for the
+commit itself.
+
+``read_changes`` (``GET /sync?since=N``) returns a team's changes after N in
+order, each row once at its latest change, with its current payload, or as
+deleted. Polling costs one index range scan on (team_id, seq) plus one
+lookup per changed table, however large the team.
+
+On Postgres the transaction also notifies ``CHANNEL`` with its last change
+number; the notification is delivered on commit and wakes the live event
+streams (``services/events.py``).
+
+Bulk statements (cold archive, team purge) bypass the ORM and are not
+recorded, unless they call ``record_change`` themselves (PATCH does).
+"""
+
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import event, insert, or_, text, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..serialization import (
+    bed_history_list,
+    bed_list,
+    diagnostic_list,
+    patient_list,
+    treatment_list,
+)
+
+# model -> table, for the models whose changes are recorded
+TRACKED = {
+    models.Patient: "patients",
+    models.Treatment: "treatments",
+    models.Diagnostic: "diagnostics",
+    models.Bed: "beds",
+    models.BedHistory: "bed_history",
+}
+
+# table -> (model, serializer of its payload)
+TABLES = {
+    "patients": (models.Patient, patient_list),
+    "treatments": (models.Treatment, treatment_list),
+    "diagnostics": (models.Diagnostic, diagnostic_list),
+    "beds": (models.Bed, bed_list),
+    "bed_history": (models.BedHistory, bed_history_list),
+}
+
+_PENDING = "pending_changes"
+
+CHANNEL = "biotrack_changes"
+
+
+def _team_of(session: Session, instance, flushed_patients: dict) -> Optional[UUID]:
+    if isinstance(instance, models.Patient):
+        return instance.team_id
+    if isinstance(instance, models.Bed):
+        return None
+    if instance.patient_id in flushed_patients:
+        return flushed_patients[instance.patient_id]
+    with session.no_autoflush:
+        patient = session.get(models.Patient, instance.patient_id)
+    return patient.team_id if patient is not None else None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    # new/dirty/deleted still describe what this flush wrote
+    flushed = [
+        *(("upsert", instance) for instance in session.new),
+        *(("upsert", instance) for instance in session.dirty if session.is_modified(instance)),
+        *(("delete", instance) for instance in session.deleted),
+    ]
+    flushed = [(op, instance) for op, instance in flushed if type(instance) in TRACKED]
+    if not flushed:
+        return
+    # Patients deleted in this flush can no longer be looked up
+    flushed_patients = {
+        instance.id: instance.team_id
+        for _, instance in flushed
+        if isinstance(instance, models.Patient)
+    }
+    pending = session.info.setdefault(_PENDING, {})
+    for op, instance in flushed:
+        key = (TRACKED[type(instance)], instance.id)
+        pending[key] = (_team_of(session, instance, flushed_patients), op)
+
+
+@event.listens_for(Session, "before_commit")
+def _record_changes(session):
+    session.flush()
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    sequence = models.ChangeSequence
+    last = session.execute(
+        update(sequence)
+        .where(sequence.id == 1)
+        .values(last_seq=sequence.last_seq + len(pending))
+        .returning(sequence.last_seq)
+    ).scalar()
+    if last is None:
+        # Databases created without the migration have no row yet
+        last = len(pending)
+        session.execute(insert(sequence).values(id=1, last_seq=last))
+    first = last - len(pending) + 1
+    now = datetime.utcnow()
+    session.execute(
+        insert(models.Change),
+        [
+            {
+                "seq": first + offset, "team_id": team_id, "table_name": table,
+                "row_id": row_id, "op": op, "changed_at": now,
+            }
+            for offset, ((table, row_id), (team_id, op)) in enumerate(pending.items())
+        ],
+    )
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SELECT pg_notify(:channel, :seq)"), {"channel": CHANNEL, "seq": str(last)})
+
+
+def record_change(session: Session, table: str, row_id: UUID, team_id: Optional[UUID], op: str = "upsert") -> None:
+    """Record a change made by a statement outside the unit of work."""
+    session.info.setdefault(_PENDING, {})[(table, row_id)] = (team_id, op)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop(_PENDING, None)
+
+
+def read_changes(db: Session, team_id: Optional[UUID], since: int, limit: int) -> dict:
+    """The team's (and shared) changes after ``since``, at most ``limit``."""
+    Change = models.Change
+    query = db.query(Change).filter(Change.seq > since)
+    # Like the list endpoints: users without a team are not filtered
+    if team_id:
+        query = query.filter(or_(Change.team_id == team_id, Change.team_id.is_(None)))
+    rows = query.order_by(Change.seq).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Each row once, at its latest change in this page
+    latest = {(row.table_name, row.row_id): row for row in rows}
+    payloads = {}
+    for table, (model, serializer) in TABLES.items():
+        ids = [row_id for (name, row_id), row in latest.items() if name == table and row.op != "delete"]
+        if ids:
+            found = db.query(model).filter(model.id.in_(ids)).all()
+            for instance, payload in zip(found, serializer.to_python(found)):
+                payloads[(table, instance.id)] = payload
+
+    changes = []
+    for key, row in sorted(latest.items(), key=lambda item: item[1].seq):
+        data = payloads.get(key)
+        changes.append({
+            "seq": row.seq,
+            "table": row.table_name,
+            "id": row.row_id,
+            # Gone since (deleted in bulk or archived): report it deleted
+            "op": "upsert" if data is not None else "delete",
+            "data": data,
+        })
+    return {
+        "changes": changes,
+        "next": rows[-1].seq if rows else since,
+        "has_more": has_more,
+    }
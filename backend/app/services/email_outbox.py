@@ -0,0 +1,232 @@
+"""
+Worker that drains the email outbox.
+
+Rows are claimed in batches with a lease (``status = 'sending'`` and
+``next_attempt_at`` pushed into the future), so several app workers can drain
+the same table: on Postgres the claim uses ``FOR UPDATE SKIP LOCKED``, and a
+worker that dies mid-send only delays its batch until the lease expires.
+
+Claimed emails are grouped by template and sent through SendGrid's v3 API
+with one personalization per recipient (up to 1000 per request), over a
+single pooled ``httpx.AsyncClient``. Failures are retried with exponential
+backoff and jitter; after ``max_attempts`` an email is marked ``failed``.
+Without a SendGrid API key emails are only logged, as before.
+
+The worker runs inside the app (started on startup, see ``main.py``) or on
+its own with ``python -m app.services.email_outbox``.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Optional
+import asyncio
+import logging
+import os
+import random
+
+import anyio
+import httpx
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from .email import FROM_EMAIL, SENDGRID_API_KEY, TEMPLATES
+
+logger = logging.getLogger(__name__)
+
+SENDGRID_URL = "https://api.sendgrid.com/v3/mail/send"
+MAX_PERSONALIZATIONS = 1000  # SendGrid's limit per request
+
+
+@dataclass(frozen=True)
+class OutboxSettings:
+    batch_size: int = 500
+    poll_interval: float = 1.0
+    lease: timedelta = timedelta(minutes=5)
+    max_attempts: int = 8
+    backoff_base: float = 30.0  # seconds; doubles per attempt
+    backoff_max: float = 3600.0
+    request_timeout: float = 10.0
+    max_connections: int = 10
+
+    @classmethod
+    def from_env(cls) -> "OutboxSettings":
+        return cls(
+            batch_size=int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "500")),
+            poll_interval=float(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", "1")),
+            max_attempts=int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "8")),
+        )
+
+
+class PermanentSendError(Exception):
+    """SendGrid rejected the request; retrying will not help."""
+
+
+def backoff_delay(attempts: int, settings: OutboxSettings) -> float:
+    """Exponential backoff with full jitter for the given attempt count."""
+    ceiling = min(settings.backoff_max, settings.backoff_base * 2 ** (attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class EmailOutboxWorker:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        api_key: Optional[str] = SENDGRID_API_KEY,
+        settings: Optional[OutboxSettings] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.session_factory = session_factory
+        self.api_key = api_key
+        self.settings = settings or OutboxSettings.from_env()
+        self.transport = transport
+        self.client: Optional[httpx.AsyncClient] = None
+        self._stopped = asyncio.Event()
+
+    async def __aenter__(self) -> "EmailOutboxWorker":
+        self.client = httpx.AsyncClient(
+            timeout=self.settings.request_timeout,
+            limits=httpx.Limits(max_connections=self.settings.max_connections),
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            transport=self.transport,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.client.aclose()
+        self.client = None
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Drain the outbox until ``stop()`` is called."""
+        async with self:
+            while not self._stopped.is_set():
+                try:
+                    sent = await self.drain_once()
+                except Exception:
+                    logger.exception("Email outbox drain failed")
+                    sent = 0
+                if not sent:
+                    try:
+                        await asyncio.wait_for(
+                            self._stopped.wait(), timeout=self.settings.poll_interval
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+
+    async def drain_once(self) -> int:
+        """Claim and send one batch; return the number of emails handled."""
+        batch = await anyio.to_thread.run_sync(self._claim)
+        if not batch:
+            return 0
+        results = {}
+        for template, group in groupby(batch, key=lambda row: row[1]):
+            group = list(group)
+            for start in range(0, len(group), MAX_PERSONALIZATIONS):
+                chunk = group[start : start + MAX_PERSONALIZATIONS]
+                error = await self._send(template, chunk)
+                for row in chunk:
+                    results[row[0]] = error
+        await anyio.to_thread.run_sync(self._record, results)
+        return len(batch)
+
+    def _claim(self) -> list:
+        settings = self.settings
+        now = datetime.utcnow()
+        db: Session = self.session_factory()
+        try:
+            rows = (
+                db.query(models.EmailOutbox)
+                .filter(
+                    models.EmailOutbox.status.in_(("pending", "sending")),
+                    models.EmailOutbox.next_attempt_at <= now,
+                )
+                .order_by(models.EmailOutbox.template, models.EmailOutbox.next_attempt_at)
+                .limit(settings.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for row in rows:
+                row.status = "sending"
+                row.next_attempt_at = now + settings.lease
+            batch = [(row.id, row.template, row.to_email, dict(row.substitutions or {})) for row in rows]
+            db.commit()
+            return batch
+        finally:
+            db.close()
+
+    async def _send(self, template_name: str, chunk: list) -> Optional[BaseException]:
+        """Send one request for ``chunk``; return the error, if any."""
+        template = TEMPLATES.get(template_name)
+        if template is None:
+            return PermanentSendError(f"Unknown template {template_name!r}")
+
+        if not self.api_key:
+            for _, _, to_email, substitutions in chunk:
+                preview = template.render(substitutions)
+                logger.info(f"[EMAIL PREVIEW] Would send {template_name} email to {to_email}")
+                logger.info(f"[EMAIL PREVIEW] Subject: {preview.subject}")
+            return None
+
+        payload = {
+            "personalizations": [
+                {
+                    "to": [{"email": to_email}],
+                    "substitutions": {f"-{name}-": str(value) for name, value in substitutions.items()},
+                }
+                for _, _, to_email, substitutions in chunk
+            ],
+            "from": {"email": FROM_EMAIL},
+            "reply_to": {"email": FROM_EMAIL},
+            "subject": template.subject,
+            "content": [
+                {"type": "text/plain", "value": template.text},
+                {"type": "text/html", "value": template.html},
+            ],
+        }
+        try:
+            response = await self.client.post(SENDGRID_URL, json=payload)
+        except httpx.HTTPError as exc:
+            return exc
+        if response.status_code == 429 or response.status_code >= 500:
+            return httpx.HTTPStatusError(
+                f"SendGrid returned {response.status_code}", request=response.request, response=response
+            )
+        if response.status_code >= 400:
+            return PermanentSendError(f"SendGrid returned {response.status_code}: {response.text[:500]}")
+        logger.info(f"✓ Sent {len(chunk)} {template_name} email(s), status: {response.status_code}")
+        return None
+
+    def _record(self, results: dict) -> None:
+        settings = self.settings
+        now = datetime.utcnow()
+        db: Session = self.session_factory()
+        try:
+            rows = db.query(models.EmailOutbox).filter(models.EmailOutbox.id.in_(list(results))).all()
+            for row in rows:
+                error = results[row.id]
+                row.attempts += 1
+                if error is None:
+                    row.status = "sent"
+                    row.sent_at = now
+                    row.last_error = None
+                    continue
+                row.last_error = str(error)[:2000]
+                if isinstance(error, PermanentSendError) or row.attempts >= settings.max_attempts:
+                    row.status = "failed"
+                    logger.error(f"✗ Giving up on email {row.id} to {row.to_email}: {error}")
+                else:
+                    row.status = "pending"
+                    row.next_attempt_at = now + timedelta(seconds=backoff_delay(row.attempts, settings))
+                    logger.warning(f"Email {row.id} failed (attempt {row.attempts}), retrying: {error}")
+            db.commit()
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(EmailOutboxWorker().run())
@@ -0,0 +1,149 @@
+"""
+Team entitlements: what a team's subscription currently allows.
+
+``get_entitlements`` returns a snapshot of the team's subscription fields,
+cached per team for ``ENTITLEMENTS_CACHE_TTL`` seconds, so enforcing the plan
+on every request costs no query. Any change to a ``Team`` row made through
+the ORM (team endpoints, downgrade, Stripe webhook events) drops the team's
+snapshot once the session commits; bulk UPDATEs must call ``invalidate``.
+The TTL bounds staleness across processes.
+
+Trial expiry is evaluated when checking, not when caching, so a snapshot
+never outlives the trial it describes.
+
+Routers enforce it with ``require_active_subscription``: a lapsed team (trial
+over, cancelled, expired or scheduled for deletion) keeps read access to its
+data but gets 402 on writes. The member limit in the snapshot is the one the
+seat counters are checked against (``services/seats.py``); each plan's limit
+is in ``PLAN_MEMBER_LIMITS``.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+import os
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .. import models
+from ..auth import get_current_user
+from ..cache import TTLCache
+from ..database import get_db
+
+ENTITLEMENTS_CACHE_TTL = float(os.getenv("ENTITLEMENTS_CACHE_TTL", "60"))
+
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Members (including the owner) each plan allows
+PLAN_MEMBER_LIMITS = {"basic": 5, "premium": 15}
+
+_PENDING_INVALIDATIONS = "entitlements_invalidate"
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    team_id: UUID
+    team_name: str
+    subscription_status: Optional[str]  # trial, active, cancelled, expired
+    subscription_plan: Optional[str]  # basic, premium
+    member_limit: int
+    trial_ends_at: Optional[datetime]
+    deleted: bool
+
+    @classmethod
+    def from_team(cls, team: models.Team) -> "Entitlements":
+        return cls(
+            team_id=team.id,
+            team_name=team.name,
+            subscription_status=team.subscription_status,
+            subscription_plan=team.subscription_plan,
+            member_limit=team.member_limit,
+            trial_ends_at=team.trial_ends_at,
+            deleted=team.deleted_at is not None,
+        )
+
+    def inactive_reason(self, now: Optional[datetime] = None) -> Optional[str]:
+        """Why the team cannot make changes, or None if it can."""
+        now = now or datetime.utcnow()
+        if self.deleted:
+            return "Team is scheduled for deletion. Restore it to make changes."
+        if self.subscription_status == "trial":
+            if self.trial_ends_at and self.trial_ends_at <= now:
+                return "Trial has ended. Subscribe to continue making changes."
+            return None
+        if self.subscription_status in ("cancelled", "expired"):
+            return f"Subscription is {self.subscription_status}. Renew it to continue making changes."
+        return None
+
+    def is_active(self, now: Optional[datetime] = None) -> bool:
+        return self.inactive_reason(now) is None
+
+
+_snapshots = TTLCache(ENTITLEMENTS_CACHE_TTL, maxsize=10_000)
+
+
+def get_entitlements(db: Session, team_id: UUID) -> Optional[Entitlements]:
+    """Cached entitlements for a team, or None if the team does not exist."""
+    snapshot = _snapshots.get(team_id)
+    if snapshot is None:
+        team = db.query(models.Team).filter(models.Team.id == team_id).first()
+        if team is None:
+            return None
+        snapshot = Entitlements.from_team(team)
+        _snapshots.set(team_id, snapshot)
+    return snapshot
+
+
+def invalidate(team_id: UUID) -> None:
+    _snapshots.delete(team_id)
+
+
+def clear() -> None:
+    _snapshots.clear()
+
+
+@event.listens_for(models.Team, "after_insert")
+@event.listens_for(models.Team, "after_update")
+@event.listens_for(models.Team, "after_delete")
+def _team_changed(mapper, connection, team):
+    # Drop the snapshot only after commit, so a concurrent request cannot
+    # cache the old row again in between
+    session = object_session(team)
+    if session is not None:
+        session.info.setdefault(_PENDING_INVALIDATIONS, set()).add(team.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for team_id in session.info.pop(_PENDING_INVALIDATIONS, ()):
+        invalidate(team_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_INVALIDATIONS, None)
+
+
+async def get_team_entitlements(
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> Optional[Entitlements]:
+    """Entitlements of the current user's team (None without a team)."""
+    if not current_user.team_id:
+        return None
+    return get_entitlements(db, current_user.team_id)
+
+
+async def require_active_subscription(
+    request: Request,
+    entitlements: Optional[Entitlements] = Depends(get_team_entitlements),
+) -> Optional[Entitlements]:
+    """Reject writes from teams whose trial or subscription has lapsed."""
+    if entitlements is not None and request.method not in READ_METHODS:
+        reason = entitlements.inactive_reason()
+        if reason:
+            raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail=reason)
+    return entitlements
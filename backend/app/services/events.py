@@ -0,0 +1,324 @@
+"""
+Live change events for the bed board and patient lists.
+
+``GET /events`` streams a team's changes to patients, treatments and beds as
+Server-Sent Events, taken from the change feed (``services/changes.py``):
+
+    id: <change number>
+    event: change
+    data: {"table": "patients", "id": "<uuid>", "op": "upsert"}
+
+Clients load the rows themselves, or through ``/sync`` from their last change
+number. Beds are shared, so every team gets their events.
+
+Each worker process runs one ``ChangeHub``. A single dedicated connection
+LISTENs on the channel that every transaction recording changes notifies on
+commit. On each notification the hub reads the new changes once, encodes
+each event once, and appends it to the queue of every subscriber of the
+team. Without Postgres, or while the listening connection is down, the hub
+polls every ``poll_interval`` seconds instead.
+
+A subscriber is a queue and a future; it has no task of its own. An idle
+stream waits on that future and on one task watching for the client to
+leave, and sends a comment every ``heartbeat`` seconds so proxies keep the
+connection open.
+
+A reconnecting client sends ``Last-Event-ID`` and first gets the events it
+missed. The stream sends ``event: reset`` and closes in two cases: the client
+missed more than ``backlog_limit`` events, or its queue reached
+``queue_size`` because it reads too slowly. The client should then resync
+through ``/sync``.
+
+The hub runs inside the app when ``CHANGE_EVENTS_ENABLED`` is set (the
+default; see ``main.py``). Every process serving ``/events`` needs its own.
+"""
+
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+import asyncio
+import logging
+import os
+
+import anyio
+import orjson
+from sqlalchemy import func, or_
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from .. import models
+from ..database import SessionLocal
+from .changes import CHANNEL
+
+logger = logging.getLogger(__name__)
+
+EVENT_TABLES = ("patients", "treatments", "beds")
+
+HEARTBEAT = b": ping\n\n"
+RESET = b"event: reset\ndata: {}\n\n"
+
+READ_BATCH = 1000
+
+
+def encode_event(seq: int, table: str, row_id: UUID, op: str) -> bytes:
+    data = orjson.dumps({"table": table, "id": str(row_id), "op": op})
+    return b"id: %d\nevent: change\ndata: %s\n\n" % (seq, data)
+
+
+@dataclass(frozen=True)
+class EventSettings:
+    heartbeat: float = 15.0  # seconds between comments on an idle stream
+    poll_interval: float = 5.0  # seconds between reads when no notification arrives
+    queue_size: int = 1000  # events a subscriber may fall behind before a reset
+    backlog_limit: int = 1000  # events replayed on reconnect before a reset
+
+    @classmethod
+    def from_env(cls) -> "EventSettings":
+        return cls(
+            heartbeat=float(os.getenv("CHANGE_EVENTS_HEARTBEAT", "15")),
+            poll_interval=float(os.getenv("CHANGE_EVENTS_POLL_INTERVAL", "5")),
+            queue_size=int(os.getenv("CHANGE_EVENTS_QUEUE_SIZE", "1000")),
+            backlog_limit=int(os.getenv("CHANGE_EVENTS_BACKLOG_LIMIT", "1000")),
+        )
+
+
+class Subscriber:
+    """One open stream: its team, pending events and a future to wake it."""
+
+    __slots__ = ("team_id", "events", "overflowed", "waiter")
+
+    def __init__(self, team_id: Optional[UUID]):
+        self.team_id = team_id
+        self.events: deque = deque()  # (seq, encoded event)
+        self.overflowed = False
+        self.waiter: Optional[asyncio.Future] = None
+
+    def wake(self) -> None:
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+
+class ChangeHub:
+    def __init__(self, session_factory=SessionLocal, settings: Optional[EventSettings] = None):
+        self.session_factory = session_factory
+        self.settings = settings or EventSettings.from_env()
+        self.position: Optional[int] = None  # last change handed out; None until started
+        # team -> subscribers; users without a team are under None and get every team's events
+        self._teams: Dict[Optional[UUID], Set[Subscriber]] = defaultdict(set)
+        self._listener = None
+        self._notified = asyncio.Event()
+        self._stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._notified.set()
+
+    async def run(self) -> None:
+        """Hand out new changes on every notification until ``stop()`` is called."""
+        try:
+            while not self._stopped.is_set():
+                if self._listener is None:
+                    self._listen()
+                self._notified.clear()
+                try:
+                    await self.dispatch()
+                except Exception:
+                    logger.exception("Reading changes failed")
+                try:
+                    await asyncio.wait_for(self._notified.wait(), timeout=self.settings.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._unlisten()
+
+    def _listen(self) -> None:
+        engine = self.session_factory.kw["bind"]
+        if engine.dialect.name != "postgresql":
+            return
+        try:
+            # Its own connection, outside the pool: it stays open for good
+            cargs, cparams = engine.dialect.create_connect_args(engine.url)
+            connection = engine.dialect.connect(*cargs, **cparams)
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+        except Exception:
+            logger.warning("Could not listen for changes; polling", exc_info=True)
+            return
+        asyncio.get_running_loop().add_reader(connection.fileno(), self._on_notify)
+        self._listener = connection
+
+    def _unlisten(self) -> None:
+        connection, self._listener = self._listener, None
+        if connection is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(connection.fileno())
+        except Exception:
+            pass  # already closed
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _on_notify(self) -> None:
+        try:
+            self._listener.poll()
+        except Exception:
+            logger.warning("Lost the connection listening for changes", exc_info=True)
+            self._unlisten()
+        else:
+            self._listener.notifies.clear()
+        # Read now, also after losing the connection: something may have been missed
+        self._notified.set()
+
+    async def dispatch(self) -> None:
+        """Hand every change after ``position`` to its subscribers."""
+        if self.position is None or not self.subscriber_count():
+            # Nobody to tell: skip ahead (reconnecting clients replay from the table)
+            self.position = await anyio.to_thread.run_sync(self._last_seq)
+            return
+        while True:
+            rows = await anyio.to_thread.run_sync(self._read, self.position)
+            for seq, team_id, table, row_id, op in rows:
+                if table in EVENT_TABLES:
+                    self.publish(seq, team_id, encode_event(seq, table, row_id, op))
+            if rows:
+                self.position = rows[-1][0]
+            if len(rows) < READ_BATCH:
+                return
+
+    def _last_seq(self) -> int:
+        db = self.session_factory()
+        try:
+            return db.query(func.max(models.Change.seq)).scalar() or 0
+        finally:
+            db.close()
+
+    def _read(self, after: int) -> list:
+        Change = models.Change
+        db = self.session_factory()
+        try:
+            return (
+                db.query(Change.seq, Change.team_id, Change.table_name, Change.row_id, Change.op)
+                .filter(Change.seq > after)
+                .order_by(Change.seq)
+                .limit(READ_BATCH)
+                .all()
+            )
+        finally:
+            db.close()
+
+    def publish(self, seq: int, team_id: Optional[UUID], event: bytes) -> None:
+        if team_id is None:
+            # Shared rows (beds) go to everyone
+            targets = [subscriber for subscribers in self._teams.values() for subscriber in subscribers]
+        else:
+            targets = [*self._teams.get(team_id, ()), *self._teams.get(None, ())]
+        for subscriber in targets:
+            if len(subscriber.events) >= self.settings.queue_size:
+                subscriber.overflowed = True
+            else:
+                subscriber.events.append((seq, event))
+            subscriber.wake()
+
+    def subscribe(self, team_id: Optional[UUID]) -> Subscriber:
+        subscriber = Subscriber(team_id)
+        self._teams[team_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._teams.get(subscriber.team_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._teams[subscriber.team_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._teams.values())
+
+    def backlog(self, team_id: Optional[UUID], after: int) -> Optional[List[Tuple[int, bytes]]]:
+        """The team's events after ``after``; None when there are too many to replay."""
+        Change = models.Change
+        limit = self.settings.backlog_limit
+        db = self.session_factory()
+        try:
+            query = db.query(Change.seq, Change.table_name, Change.row_id, Change.op).filter(
+                Change.seq > after, Change.table_name.in_(EVENT_TABLES)
+            )
+            if team_id:
+                query = query.filter(or_(Change.team_id == team_id, Change.team_id.is_(None)))
+            rows = query.order_by(Change.seq).limit(limit + 1).all()
+        finally:
+            db.close()
+        if len(rows) > limit:
+            return None
+        return [(seq, encode_event(seq, table, row_id, op)) for seq, table, row_id, op in rows]
+
+
+hub = ChangeHub()
+
+
+async def _wait_for_disconnect(receive: Receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class EventStream(Response):
+    """Server-Sent Events response of one subscriber, open until the client leaves."""
+
+    media_type = "text/event-stream"
+
+    def __init__(
+        self,
+        hub: ChangeHub,
+        subscriber: Subscriber,
+        backlog: Optional[List[Tuple[int, bytes]]] = None,
+    ):
+        self.hub = hub
+        self.subscriber = subscriber
+        self.backlog = backlog
+        self.status_code = 200
+        self.background = None
+        self.init_headers({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        subscriber = self.subscriber
+        left = asyncio.ensure_future(_wait_for_disconnect(receive))
+        left.add_done_callback(lambda _: subscriber.wake())
+        loop = asyncio.get_running_loop()
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if self.backlog is None:
+                await send({"type": "http.response.body", "body": RESET})
+                return
+            sent = 0
+            pending = list(self.backlog)
+            while not left.done():
+                while subscriber.events:
+                    pending.append(subscriber.events.popleft())
+                chunks = []
+                for seq, event in pending:
+                    # The backlog and the live queue can overlap
+                    if seq > sent:
+                        chunks.append(event)
+                        sent = seq
+                pending.clear()
+                body = b"".join(chunks)
+                if subscriber.overflowed:
+                    await send({"type": "http.response.body", "body": body + RESET})
+                    return
+                if body:
+                    await send({"type": "http.response.body", "body": body, "more_body": True})
+                    continue
+                subscriber.waiter = loop.create_future()
+                if subscriber.events or left.done():
+                    continue
+                try:
+                    await asyncio.wait_for(subscriber.waiter, timeout=self.hub.settings.heartbeat)
+                except asyncio.TimeoutError:
+                    await send({"type": "http.response.body", "body": HEARTBEAT, "more_body": True})
+        finally:
+            self.hub.unsubscribe(subscriber)
+            left.cancel()
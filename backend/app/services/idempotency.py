@@ -0,0 +1,201 @@
+"""
+Idempotency keys for the create endpoints.
+
+A client that may retry ``POST /patients``, ``/treatments`` or
+``/diagnostics`` sends an ``Idempotency-Key`` header (any unique string, one
+per logical request). The first request with a key runs normally and stores
+its response in ``idempotency_keys`` in the same transaction as its writes,
+so a response is stored exactly when the writes were committed. A retry with
+the same key gets that stored response back with ``Idempotent-Replayed:
+true`` and writes nothing. Reusing a key for a different request (method,
+path and body hashed) is rejected with 422.
+
+Keys are scoped to the user. Requests with the same key are serialized by a
+transaction-level advisory lock on Postgres: a concurrent duplicate waits for
+the first to commit or roll back, then replays its response or runs itself.
+Nothing is stored for a request that failed, so it can be retried. On other
+databases the primary key rejects the second of two concurrent duplicates.
+
+Stored responses are kept ``IDEMPOTENCY_KEY_TTL`` hours. ``IdempotencySweeper``
+deletes expired rows in batches; it runs inside the app (see ``main.py``) or
+on its own with ``python -m app.services.idempotency``.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from hashlib import sha256
+from typing import Optional
+from uuid import UUID
+import asyncio
+import logging
+import os
+
+import anyio
+from fastapi import Depends, Header, HTTPException, Request, Response
+from pydantic import BaseModel
+from sqlalchemy import delete, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..auth import get_current_user
+from ..database import SessionLocal, get_db
+
+logger = logging.getLogger(__name__)
+
+IdempotencyKey = models.IdempotencyKey
+
+KEY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_KEY_TTL", "24")))
+
+
+class IdempotencyClaim:
+    """A request's hold on its key: the stored response to replay, or the
+    right to run and record one."""
+
+    def __init__(self, db: Session, user_id: UUID, key: str, request_hash: str):
+        self.db = db
+        self.user_id = user_id
+        self.key = key
+        self.request_hash = request_hash
+        self.replay: Optional[Response] = None
+
+    def begin(self) -> Optional[Response]:
+        """Wait for other requests with this key; return the stored response, if any."""
+        db = self.db
+        if db.get_bind().dialect.name == "postgresql":
+            # Released when this request's transaction ends
+            lock = int.from_bytes(sha256(f"{self.user_id}:{self.key}".encode()).digest()[:8], "big", signed=True)
+            db.execute(text("SELECT pg_advisory_xact_lock(:lock)"), {"lock": lock})
+        stored = db.get(IdempotencyKey, (self.user_id, self.key), populate_existing=True)
+        if stored is not None and stored.expires_at <= datetime.utcnow():
+            db.delete(stored)
+            db.flush()
+            stored = None
+        if stored is None:
+            self.replay = None
+        elif stored.request_hash != self.request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        else:
+            self.replay = Response(
+                content=stored.response_body,
+                status_code=stored.status_code,
+                media_type="application/json",
+                headers={"Idempotent-Replayed": "true"},
+            )
+        return self.replay
+
+    def record(self, schema: type[BaseModel], instance, status_code: int = 200) -> None:
+        """Store the response for ``instance``; call before the route commits."""
+        self.db.flush()
+        self.db.add(IdempotencyKey(
+            user_id=self.user_id,
+            key=self.key,
+            request_hash=self.request_hash,
+            status_code=status_code,
+            response_body=schema.model_validate(instance).model_dump_json(),
+            expires_at=datetime.utcnow() + KEY_TTL,
+        ))
+
+
+async def _request_hash(request: Request) -> str:
+    body = await request.body()
+    return sha256(b"%s %s\n%s" % (request.method.encode(), request.url.path.encode(), body)).hexdigest()
+
+
+def idempotency_claim(
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+    request_hash: str = Depends(_request_hash),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> Optional[IdempotencyClaim]:
+    """Dependency of the create routes; None without an ``Idempotency-Key``.
+
+    A sync dependency, so waiting for the lock happens in the threadpool.
+    """
+    if idempotency_key is None:
+        return None
+    claim = IdempotencyClaim(db, current_user.id, idempotency_key, request_hash)
+    claim.begin()
+    return claim
+
+
+def delete_expired_keys(db: Session, now: datetime, limit: int) -> int:
+    """Delete up to ``limit`` expired keys in the caller's transaction."""
+    expired = (
+        select(IdempotencyKey.user_id, IdempotencyKey.key)
+        .where(IdempotencyKey.expires_at < now)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = db.execute(
+        delete(IdempotencyKey)
+        .where(tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+@dataclass(frozen=True)
+class IdempotencySweeperSettings:
+    batch_size: int = 1000
+    interval: float = 3600.0  # seconds between sweeps
+    batch_pause: float = 0.1  # seconds between batches of one sweep
+
+    @classmethod
+    def from_env(cls) -> "IdempotencySweeperSettings":
+        return cls(
+            batch_size=int(os.getenv("IDEMPOTENCY_SWEEPER_BATCH_SIZE", "1000")),
+            interval=float(os.getenv("IDEMPOTENCY_SWEEPER_INTERVAL", "3600")),
+        )
+
+
+class IdempotencySweeper:
+    def __init__(self, session_factory=SessionLocal, settings: Optional[IdempotencySweeperSettings] = None):
+        self.session_factory = session_factory
+        self.settings = settings or IdempotencySweeperSettings.from_env()
+        self._stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Sweep every ``interval`` seconds until ``stop()`` is called."""
+        while not self._stopped.is_set():
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Idempotency key sweep failed")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.settings.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def sweep(self) -> int:
+        """Delete all expired keys, one committed batch at a time."""
+        now = datetime.utcnow()
+        total = 0
+        while not self._stopped.is_set():
+            deleted = await anyio.to_thread.run_sync(self._delete_batch, now)
+            total += deleted
+            if deleted < self.settings.batch_size:
+                break
+            await asyncio.sleep(self.settings.batch_pause)
+        if total:
+            logger.info("Deleted %d expired idempotency keys", total)
+        return total
+
+    def _delete_batch(self, now: datetime) -> int:
+        db = self.session_factory()
+        try:
+            deleted = delete_expired_keys(db, now, self.settings.batch_size)
+            db.commit()
+            return deleted
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(IdempotencySweeper().run())
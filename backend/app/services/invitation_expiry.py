@@ -0,0 +1,144 @@
+"""
+Expiry of overdue team invitations.
+
+Invitations stay ``pending`` past ``expires_at`` until something expires
+them, and until then they hold a seat. ``expire_overdue_invitations`` does it
+set-based: one ``UPDATE ... RETURNING team_id`` per batch, then one seat
+release per team. It is driven by the partial index
+``ix_team_invitations_pending`` on (team_id, status, expires_at) WHERE
+status = 'pending', which only holds the pending rows.
+
+``InvitationSweeper`` runs it periodically in batches with a commit per batch,
+so no transaction holds many rows locked. ``send_invitation`` also expires
+its own team's overdue invitations before reserving a seat, through the same
+index, so seat counts do not depend on when the sweeper last ran.
+
+The sweeper runs inside the app (see ``main.py``) or on its own with
+``python -m app.services.invitation_expiry``.
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+import asyncio
+import logging
+import os
+
+import anyio
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from . import seats
+
+logger = logging.getLogger(__name__)
+
+TeamInvitation = models.TeamInvitation
+
+
+def expire_overdue_invitations(
+    db: Session,
+    now: Optional[datetime] = None,
+    team_id: Optional[UUID] = None,
+    limit: Optional[int] = None,
+) -> int:
+    """
+    Expire pending invitations past ``expires_at`` and free their seats.
+
+    Limited to one team and/or ``limit`` rows when given. Runs in the
+    caller's transaction; return the number of invitations expired.
+    """
+    now = now or datetime.utcnow()
+    overdue = select(TeamInvitation.id).where(
+        TeamInvitation.status == "pending",
+        TeamInvitation.expires_at < now,
+    )
+    if team_id is not None:
+        overdue = overdue.where(TeamInvitation.team_id == team_id)
+    if limit is not None:
+        # Concurrent sweepers take disjoint batches
+        overdue = overdue.limit(limit).with_for_update(skip_locked=True)
+
+    expired = db.execute(
+        update(TeamInvitation)
+        .where(TeamInvitation.id.in_(overdue), TeamInvitation.status == "pending")
+        .values(status="expired")
+        .returning(TeamInvitation.team_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    # Team rows are updated in a fixed order so concurrent sweeps cannot deadlock
+    per_team = Counter(expired)
+    for expired_team_id in sorted(per_team, key=str):
+        seats.release_invitation_seats(db, expired_team_id, per_team[expired_team_id])
+    return len(expired)
+
+
+@dataclass(frozen=True)
+class SweeperSettings:
+    batch_size: int = 1000
+    interval: float = 300.0  # seconds between sweeps
+    batch_pause: float = 0.1  # seconds between batches of one sweep
+
+    @classmethod
+    def from_env(cls) -> "SweeperSettings":
+        return cls(
+            batch_size=int(os.getenv("INVITATION_SWEEPER_BATCH_SIZE", "1000")),
+            interval=float(os.getenv("INVITATION_SWEEPER_INTERVAL", "300")),
+        )
+
+
+class InvitationSweeper:
+    def __init__(self, session_factory=SessionLocal, settings: Optional[SweeperSettings] = None):
+        self.session_factory = session_factory
+        self.settings = settings or SweeperSettings.from_env()
+        self._stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Sweep every ``interval`` seconds until ``stop()`` is called."""
+        while not self._stopped.is_set():
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Invitation expiry sweep failed")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.settings.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def sweep(self) -> int:
+        """Expire all overdue invitations, one committed batch at a time."""
+        now = datetime.utcnow()
+        total = 0
+        while not self._stopped.is_set():
+            expired = await anyio.to_thread.run_sync(self._expire_batch, now)
+            total += expired
+            if expired < self.settings.batch_size:
+                break
+            await asyncio.sleep(self.settings.batch_pause)
+        if total:
+            logger.info("Expired %d overdue invitations", total)
+        return total
+
+    def _expire_batch(self, now: datetime) -> int:
+        db = self.session_factory()
+        try:
+            expired = expire_overdue_invitations(db, now, limit=self.settings.batch_size)
+            db.commit()
+            return expired
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(InvitationSweeper().run())
@@ -0,0 +1,289 @@
+"""
+Monthly range partitions of the clinical history tables.
+
+On Postgres ``bed_history``, ``treatments`` and ``diagnostics`` are
+partitioned by month of their clinical date (declared on the models with
+``postgresql_partition_by``; the date is part of the primary key, as
+Postgres requires). Each month is a partition named ``<table>_YYYY_MM``, and
+``<table>_history`` holds everything before the first month. Indexes declared
+on the models exist on every partition, so a query on a patient's recent
+activity (``since=`` on the list endpoints) only reads the partitions of
+those months.
+
+There is no DEFAULT partition: adding a month next to one means scanning it
+under an exclusive lock. Months are instead created ahead of time, as an
+empty table attached with ``ATTACH PARTITION``, which only scans that empty
+table and lets reads and writes of the parent go on meanwhile.
+``PartitionMaintainer`` keeps ``months_ahead`` months created, and a row
+dated beyond that (a treatment programmed far ahead) gets its months created
+before the session flushes it.
+
+``detach_partition`` takes a month out of its table without touching its
+rows, to be archived or dropped, with ``DETACH PARTITION ... CONCURRENTLY``.
+
+Other databases (SQLite in tests) get plain tables and all of this is a no-op.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import logging
+import os
+import re
+
+import anyio
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+# table -> partition key
+PARTITION_KEYS = {
+    "bed_history": "start_date",
+    "treatments": "start_date",
+    "diagnostics": "date_diagnosed",
+}
+
+PARTITIONED_MODELS = {
+    models.BedHistory: "bed_history",
+    models.Treatment: "treatments",
+    models.Diagnostic: "diagnostics",
+}
+
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+_MONTH_SUFFIX = re.compile(r"_(\d{4})_(\d{2})$")
+
+# table -> first day without a partition, as last seen committed by this process
+_covered_until: Dict[str, date] = {}
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def history_partition_name(table: str) -> str:
+    return f"{table}_history"
+
+
+def _is_postgres(connection: Connection) -> bool:
+    return connection.dialect.name == "postgresql"
+
+
+def _partitions(connection: Connection, table: str) -> Optional[List[str]]:
+    """Names of the table's partitions, or None if it is not partitioned."""
+    kind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    ).scalar()
+    if kind != "p":
+        return None
+    return connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table)"
+        ),
+        {"table": table},
+    ).scalars().all()
+
+
+def _months(partitions: Iterable[str]) -> List[date]:
+    months = []
+    for name in partitions:
+        match = _MONTH_SUFFIX.search(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def covered_until(connection: Connection, table: str) -> Optional[date]:
+    """First day with no partition yet, or None if the table is not partitioned."""
+    partitions = _partitions(connection, table)
+    if partitions is None:
+        return None
+    months = _months(partitions)
+    return add_months(months[-1], 1) if months else date.min
+
+
+def create_month_partition(connection: Connection, table: str, month: date) -> str:
+    """Create and attach the (empty) partition of ``month``."""
+    name = partition_name(table, month)
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+    connection.execute(
+        text(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+        )
+    )
+    return name
+
+
+def ensure_partitions(
+    connection: Connection,
+    until: Optional[date] = None,
+    months_ahead: int = MONTHS_AHEAD,
+    today: Optional[date] = None,
+    tables: Iterable[str] = tuple(PARTITION_KEYS),
+) -> List[str]:
+    """
+    Create the monthly partitions up to ``months_ahead`` months from
+    ``today``, or up to the month of ``until`` if that is later.
+
+    A table without partitions yet gets its history partition, ending this
+    month, first. Tables that are not partitioned (a database not migrated
+    yet) are skipped. Returns the names of the partitions created.
+    """
+    if not _is_postgres(connection):
+        return []
+    # Serialize with other processes doing the same
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('ensure_partitions'))"))
+    this_month = month_start(today or date.today())
+    last = add_months(this_month, months_ahead)
+    if until is not None and month_start(until) > last:
+        last = month_start(until)
+    created = []
+    for table in tables:
+        partitions = _partitions(connection, table)
+        if partitions is None:
+            continue
+        months = _months(partitions)
+        if not partitions:
+            history = history_partition_name(table)
+            connection.execute(
+                text(
+                    f"CREATE TABLE {history} PARTITION OF {table} "
+                    f"FOR VALUES FROM (MINVALUE) TO ('{this_month}')"
+                )
+            )
+            created.append(history)
+        month = add_months(months[-1], 1) if months else this_month
+        while month <= last:
+            created.append(create_month_partition(connection, table, month))
+            month = add_months(month, 1)
+    return created
+
+
+def detach_partition(connection: Connection, table: str, month: date) -> str:
+    """
+    Detach a month's partition; it stays as a standalone table.
+
+    ``CONCURRENTLY`` cannot run inside a transaction: pass a connection in
+    autocommit mode.
+    """
+    name = partition_name(table, month)
+    connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name} CONCURRENTLY"))
+    return name
+
+
+def _create_partitions(table, connection, **kw):
+    ensure_partitions(connection, tables=[table.name])
+
+
+# Tables created by create_all (tests, scratch databases) get their
+# partitions right away; migrated databases get them from the migration
+for model in PARTITIONED_MODELS:
+    event.listen(model.__table__, "after_create", _create_partitions)
+
+
+@event.listens_for(Session, "before_flush")
+def _cover_new_dates(session, flush_context, instances):
+    """Create the months of rows dated past the partitions this process knows."""
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    needed = {}
+    for instance in list(session.new) + list(session.dirty):
+        table = PARTITIONED_MODELS.get(type(instance))
+        if table is None:
+            continue
+        day = getattr(instance, PARTITION_KEYS[table])
+        if day is None:
+            continue
+        needed[table] = max(day, needed.get(table, day))
+    cover_dates(session, needed)
+
+
+def cover_dates(session: Session, needed: Dict[str, date]) -> None:
+    """Make sure each table has partitions up to its day in ``needed``.
+
+    Also called by writes that bypass the flush (``services/patches.py``).
+    """
+    if not needed or session.get_bind().dialect.name != "postgresql":
+        return
+    # In the session's transaction: attaching a month locks the tables its
+    # foreign keys reference, which this transaction may already be writing
+    connection = session.connection()
+    for table, day in needed.items():
+        if day < _covered_until.get(table, date.min):
+            continue
+        bound = covered_until(connection, table)
+        if bound is None:
+            continue
+        if day < bound:
+            _covered_until[table] = bound
+            continue
+        created = ensure_partitions(connection, until=day, tables=[table])
+        logger.info("Created partitions: %s", ", ".join(created))
+
+
+@dataclass(frozen=True)
+class MaintainerSettings:
+    interval: float = 86400.0  # seconds between runs
+    months_ahead: int = MONTHS_AHEAD
+
+    @classmethod
+    def from_env(cls) -> "MaintainerSettings":
+        return cls(interval=float(os.getenv("PARTITION_MAINTAINER_INTERVAL", "86400")))
+
+
+class PartitionMaintainer:
+    """Keeps ``months_ahead`` months of partitions created ahead of time."""
+
+    def __init__(self, engine=default_engine, settings: Optional[MaintainerSettings] = None):
+        self.engine = engine
+        self.settings = settings or MaintainerSettings.from_env()
+        self._stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Create upcoming partitions every ``interval`` seconds until stopped."""
+        while not self._stopped.is_set():
+            try:
+                await anyio.to_thread.run_sync(self.maintain)
+            except Exception:
+                logger.exception("Partition maintenance failed")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.settings.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def maintain(self) -> List[str]:
+        with self.engine.begin() as connection:
+            created = ensure_partitions(connection, months_ahead=self.settings.months_ahead)
+        with self.engine.connect() as connection:
+            for table in PARTITION_KEYS:
+                bound = covered_until(connection, table)
+                if bound is not None:
+                    _covered_until[table] = bound
+        if created:
+            logger.info("Created partitions: %s", ", ".join(created))
+        return created
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(PartitionMaintainer().run())
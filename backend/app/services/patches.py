@@ -0,0 +1,74 @@
+"""
+Partial updates with optimistic concurrency.
+
+``PATCH`` routes send only the fields that changed, plus the ``version`` the
+client read the row at. ``patch_row`` applies them in one statement:
+
+    UPDATE ... SET <fields>, version = version + 1
+    WHERE id = :id AND version = :version RETURNING ...
+
+The conflict check is part of the write. Only when no row comes back is a
+second query made, to tell a stale version (409) from a missing row (404).
+
+Full updates through the ORM (``PUT``) bump ``version`` too, since it is the
+models' ``version_id_col``. One that loses a race raises ``StaleDataError``,
+which ``main.py`` also answers with 409.
+
+The statement bypasses the unit of work, so it records the row's change
+itself (``changes.record_change``), with the row's team read back by the same
+statement (through the patient, for treatments and diagnostics). For the same
+reason it creates the partitions of a new date itself, as
+``partitions._cover_new_dates`` does before a flush.
+"""
+
+from typing import Any, Dict
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from .changes import TRACKED, record_change
+from .partitions import PARTITION_KEYS, PARTITIONED_MODELS, cover_dates
+
+
+def patch_row(db: Session, model, row_id: UUID, values: Dict[str, Any], *criteria):
+    """Apply ``values`` (with the expected ``version``) to a row; return the updated row."""
+    values = dict(values)
+    version = values.pop("version")
+    Patient = models.Patient
+    if model is Patient:
+        team_id = Patient.team_id
+    else:
+        team_id = (
+            select(Patient.team_id)
+            .where(Patient.id == model.patient_id)
+            .correlate_except(Patient)
+            .scalar_subquery()
+        )
+        if criteria:
+            # Team criteria are on the patient
+            criteria = (*criteria, model.patient_id == Patient.id)
+    table = PARTITIONED_MODELS.get(model)
+    if table is not None and values.get(PARTITION_KEYS[table]) is not None:
+        # Moving the row to a month with no partition yet
+        cover_dates(db, {table: values[PARTITION_KEYS[table]]})
+    statement = (
+        update(model)
+        .where(model.id == row_id, model.version == version, *criteria)
+        .values(**values, version=model.version + 1)
+        .returning(model, team_id)
+        .execution_options(synchronize_session=False)
+    )
+    result = db.execute(statement).one_or_none()
+    if result is None:
+        exists = db.query(model.id).filter(model.id == row_id, *criteria).first()
+        if exists:
+            raise HTTPException(
+                status_code=409, detail="Changed by someone else since it was read; reload and retry"
+            )
+        raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
+    row, team_id = result
+    record_change(db, TRACKED[model], row.id, team_id)
+    return row
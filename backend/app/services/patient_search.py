@@ -0,0 +1,133 @@
+"""
+Patient search by RUT or name (``GET /patients/search?q=``).
+
+A query made only of digits, dots and spaces, optionally followed by a dash
+and the check digit, is a RUT prefix. Both sides are compared as the digits
+of the RUT body: ``12.345`` and ``12345`` both find ``12.345.678-5``.
+Matches are ranked exact first, then shortest.
+
+Anything else is a name. Names are compared lowercased and without accents
+(``name_key``), with pg_trgm's word similarity: ``gonzales`` finds
+``María González``. Matches are ranked by similarity, then name.
+
+On Postgres both run on team-scoped indexes from migration
+``add_patient_search``. That migration builds them on the same expressions
+as ``name_key`` and ``rut_key`` below, which must stay in step with them:
+
+* a GIN index on (team_id, name_key gin_trgm_ops), needing the ``pg_trgm``
+  and ``btree_gin`` extensions;
+* a btree index on (team_id, rut_key text_pattern_ops), for ``LIKE 'digits%'``.
+
+Other databases (SQLite in tests and local development) have no pg_trgm.
+There the team's patients are matched in Python with the same normalization
+and difflib's similarity.
+"""
+
+from difflib import SequenceMatcher
+from typing import List, Optional
+from uuid import UUID
+import re
+
+from sqlalchemy import func, literal
+from sqlalchemy.orm import Session
+
+from .. import models
+
+ACCENTED = "áàâäãéèêëíìîïóòôöõúùûüñçÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÑÇ"
+PLAIN = "aaaaaeeeeiiiiooooouuuuncaaaaaeeeeiiiiooooouuuunc"
+_UNACCENT = str.maketrans(ACCENTED, PLAIN)
+
+# Digits with dots or spaces, then optionally a dash and the check digit
+RUT_QUERY = re.compile(r"[\d.\s]*\d[\d.\s]*(-[\dkK]?)?")
+
+# pg_trgm's default word_similarity_threshold, used for the Python fallback too
+SIMILARITY_THRESHOLD = 0.6
+
+
+def _constant(value):
+    # Rendered inline so the expression matches the index definition
+    return literal(value, literal_execute=True)
+
+
+def name_key(column):
+    """translate(lower(name), ACCENTED, PLAIN)"""
+    return func.translate(func.lower(column), _constant(ACCENTED), _constant(PLAIN))
+
+
+def rut_key(column):
+    """The RUT body digits: left(regexp_replace(upper(rut), '[^0-9K]', '', 'g'), -1)"""
+    cleaned = func.regexp_replace(func.upper(column), _constant("[^0-9K]"), _constant(""), _constant("g"))
+    return func.left(cleaned, _constant(-1))
+
+
+def normalize_name(value: str) -> str:
+    return value.lower().translate(_UNACCENT).strip()
+
+
+def rut_body(rut: str) -> str:
+    """Digits of a stored RUT without the check digit."""
+    return re.sub(r"[^0-9K]", "", rut.upper())[:-1]
+
+
+def query_rut_digits(q: str) -> Optional[str]:
+    """The RUT body digits a query asks for, or None when it is a name."""
+    q = q.strip()
+    if not RUT_QUERY.fullmatch(q):
+        return None
+    return re.sub(r"\D", "", q.split("-")[0])
+
+
+def search_patients(db: Session, team_id: Optional[UUID], q: str, limit: int) -> List[models.Patient]:
+    """Patients of the team matching ``q``, best first."""
+    Patient = models.Patient
+    digits = query_rut_digits(q)
+    if db.get_bind().dialect.name != "postgresql":
+        return _search_in_python(db, team_id, q, digits, limit)
+
+    query = db.query(Patient)
+    # Like the list endpoints: users without a team are not filtered
+    if team_id:
+        query = query.filter(Patient.team_id == team_id)
+    if digits is not None:
+        key = rut_key(Patient.rut)
+        return (
+            query.filter(key.like(_constant(digits + "%")))
+            .order_by((key == digits).desc(), func.length(key), key)
+            .limit(limit)
+            .all()
+        )
+    key = name_key(Patient.name)
+    term = normalize_name(q)
+    return (
+        query.filter(literal(term).op("<%")(key))
+        .order_by(func.word_similarity(term, key).desc(), Patient.name)
+        .limit(limit)
+        .all()
+    )
+
+
+def _word_similarity(term: str, name: str) -> float:
+    if term in name:
+        return 1.0
+    return max(
+        (SequenceMatcher(None, term, word).ratio() for word in name.split()),
+        default=0.0,
+    )
+
+
+def _search_in_python(db, team_id, q, digits, limit):
+    Patient = models.Patient
+    query = db.query(Patient)
+    if team_id:
+        query = query.filter(Patient.team_id == team_id)
+    patients = query.all()
+    if digits is not None:
+        bodies = {patient.id: rut_body(patient.rut) for patient in patients}
+        found = [patient for patient in patients if bodies[patient.id].startswith(digits)]
+        found.sort(key=lambda patient: (bodies[patient.id] != digits, len(bodies[patient.id]), bodies[patient.id]))
+        return found[:limit]
+    term = normalize_name(q)
+    scored = [(_word_similarity(term, normalize_name(patient.name)), patient) for patient in patients]
+    scored = [(score, patient) for score, patient in scored if score >= SIMILARITY_THRESHOLD]
+    scored.sort(key=lambda item: (-item[0], item[1].name))
+    return [patient for _, patient in scored[:limit]]
@@ -0,0 +1,133 @@
+"""
+Team seat accounting.
+
+A team's seats are its members plus its pending invitations, and together
+they may not exceed ``member_limit``. Both are counters on ``teams``, changed
+only through these functions. Each change is one conditional
+``UPDATE ... RETURNING`` on the team row, so concurrent invites and accepts
+serialize on that row and cannot overshoot the limit, and the check costs the
+same however large the team is.
+
+Callers pass the limit from the team's entitlements snapshot
+(``services/entitlements.py``), so the plan enforced is the one the request
+was checked against; without it the ``member_limit`` column is used.
+
+The functions run in the caller's transaction; the caller commits.
+"""
+
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .. import models
+
+Team = models.Team
+
+
+def _limit(member_limit: Optional[int]):
+    return Team.member_limit if member_limit is None else member_limit
+
+
+def _update(db: Session, team_id: UUID, *conditions, **values) -> Optional[int]:
+    """Apply ``values`` to the team if ``conditions`` hold; return the seats
+    now in use, or None if the team does not exist or a condition failed."""
+    statement = (
+        update(Team)
+        .where(Team.id == team_id, *conditions)
+        .values(**values)
+        .returning(Team.member_count + Team.pending_invitation_count)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(statement).scalar()
+
+
+def reserve_invitation_seats(
+    db: Session, team_id: UUID, count: int = 1, member_limit: Optional[int] = None
+) -> bool:
+    """Reserve ``count`` seats for new invitations, all or nothing."""
+    return _update(
+        db, team_id,
+        Team.member_count + Team.pending_invitation_count + count <= _limit(member_limit),
+        pending_invitation_count=Team.pending_invitation_count + count,
+    ) is not None
+
+
+def reserve_available_invitation_seats(
+    db: Session, team_id: UUID, count: int, member_limit: Optional[int] = None
+) -> int:
+    """Reserve up to ``count`` seats; return how many were reserved.
+
+    Reads the free seats and reserves exactly that many with the same
+    conditional UPDATE, retrying if a concurrent request took some in between.
+    """
+    while count > 0:
+        if reserve_invitation_seats(db, team_id, count, member_limit):
+            return count
+        free = db.execute(
+            select(_limit(member_limit) - Team.member_count - Team.pending_invitation_count)
+            .where(Team.id == team_id)
+        ).scalar()
+        if not free or free <= 0:
+            return 0
+        count = min(count, free)
+    return 0
+
+
+def release_invitation_seats(db: Session, team_id: UUID, count: int = 1) -> None:
+    """Free the seats of invitations that were cancelled or expired."""
+    _update(
+        db, team_id,
+        pending_invitation_count=Team.pending_invitation_count - count,
+    )
+
+
+def accept_invitation_seat(db: Session, team_id: UUID, member_limit: Optional[int] = None) -> bool:
+    """Turn a pending invitation's seat into a member's.
+
+    Fails if the team is already at its member limit (e.g. after a
+    downgrade), in which case the invitation keeps its seat.
+    """
+    return _update(
+        db, team_id,
+        Team.member_count < _limit(member_limit),
+        member_count=Team.member_count + 1,
+        pending_invitation_count=Team.pending_invitation_count - 1,
+    ) is not None
+
+
+def add_member_seat(db: Session, team_id: UUID, member_limit: Optional[int] = None) -> bool:
+    """Take a seat for a member joining without an invitation (team creator)."""
+    return _update(
+        db, team_id,
+        Team.member_count + Team.pending_invitation_count < _limit(member_limit),
+        member_count=Team.member_count + 1,
+    ) is not None
+
+
+def release_member_seat(db: Session, team_id: UUID) -> None:
+    """Free the seat of a member who left or was removed."""
+    _update(db, team_id, member_count=Team.member_count - 1)
+
+
+def close_invitation(db: Session, invitation: models.TeamInvitation, status: str, **values) -> bool:
+    """Move a pending invitation to ``status`` (accepted, cancelled, expired).
+
+    Only one of several concurrent requests gets to close an invitation;
+    the others get False. Cancelling or expiring frees the invitation's seat;
+    accepting leaves it to ``accept_invitation_seat``.
+    """
+    result = db.execute(
+        update(models.TeamInvitation)
+        .where(
+            models.TeamInvitation.id == invitation.id,
+            models.TeamInvitation.status == "pending",
+        )
+        .values(status=status, **values)
+    )
+    if result.rowcount != 1:
+        return False
+    if status != "accepted":
+        release_invitation_seats(db, invitation.team_id)
+    return True
@@ -0,0 +1,219 @@
+"""
+Non-blocking access to the Stripe API.
+
+The ``stripe`` SDK is synchronous, so every call is run in a worker thread
+(``call_stripe``), bounded by its own limiter so a slow Stripe cannot take
+over the threadpool the sync routes run in. Requests have strict connect and
+read timeouts, and a circuit breaker fails calls fast while Stripe is
+unreachable or erroring instead of letting every request wait for a timeout.
+
+Subscription item ids, which only change when a subscription's items are
+replaced, are cached for ``STRIPE_CACHE_TTL`` seconds and refreshed from
+``customer.subscription.*`` webhook events. Prices, which are immutable in
+Stripe apart from being archived, are cached for the same time.
+
+``STRIPE_API_BASE`` points the SDK at another server, e.g. the fake Stripe in
+``benchmarks/bench_stripe_client.py``.
+"""
+
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import anyio
+import stripe
+
+from ..cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "sk_test_placeholder")
+stripe.api_base = os.getenv("STRIPE_API_BASE", stripe.api_base)
+stripe.max_network_retries = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", "1"))
+stripe.default_http_client = stripe.RequestsClient(
+    timeout=(
+        float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3")),
+        float(os.getenv("STRIPE_READ_TIMEOUT", "10")),
+    )
+)
+
+STRIPE_CONCURRENCY = int(os.getenv("STRIPE_CONCURRENCY", "20"))
+STRIPE_CACHE_TTL = float(os.getenv("STRIPE_CACHE_TTL", "300"))
+
+
+class CircuitOpenError(stripe.error.StripeError):
+    """Raised instead of calling Stripe while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    calls fail with ``CircuitOpenError`` for ``reset_timeout`` seconds. Then a
+    single trial call is let through: success closes the breaker, failure
+    opens it again.
+    """
+
+    # Errors that say Stripe itself is unhealthy; a declined card or a bad
+    # request is a normal answer and counts as success
+    FAILURES = (stripe.error.APIConnectionError, stripe.error.APIError)
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        raise CircuitOpenError("Stripe is temporarily unavailable")
+
+    def abandon(self) -> None:
+        """Forget a call whose outcome is unknown (cancelled): let another trial through."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record(self, error: Optional[BaseException]) -> None:
+        with self._lock:
+            self._trial_in_flight = False
+            if error is None or not isinstance(error, self.FAILURES):
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(f"Stripe circuit opened after {self.failures} failures: {error}")
+                self.opened_at = self.clock()
+
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("STRIPE_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("STRIPE_BREAKER_RESET_SECONDS", "30")),
+)
+subscription_items = TTLCache(STRIPE_CACHE_TTL)
+prices = TTLCache(STRIPE_CACHE_TTL)
+_lookups: Dict[Tuple[str, str], "asyncio.Future"] = {}
+
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _get_limiter() -> anyio.CapacityLimiter:
+    # Created lazily: a limiter belongs to the running event loop
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(STRIPE_CONCURRENCY)
+    return _limiter
+
+
+async def call_stripe(fn: Callable, *args, **kwargs):
+    """Run a synchronous Stripe SDK call in a worker thread, behind the breaker."""
+    breaker.before_call()
+    try:
+        result = await anyio.to_thread.run_sync(lambda: fn(*args, **kwargs), limiter=_get_limiter())
+    except Exception as exc:
+        breaker.record(exc)
+        raise
+    except BaseException:
+        # Cancelled while waiting: without this a trial call would stay in flight forever
+        breaker.abandon()
+        raise
+    breaker.record(None)
+    return result
+
+
+async def create_checkout_session(**params):
+    return await call_stripe(stripe.checkout.Session.create, **params)
+
+
+async def create_portal_session(**params):
+    return await call_stripe(stripe.billing_portal.Session.create, **params)
+
+
+def remember_subscription(subscription: dict) -> None:
+    """Cache the first item id of a subscription object (API or webhook)."""
+    items = (subscription.get("items") or {}).get("data") or []
+    if items:
+        subscription_items.set(subscription["id"], items[0]["id"])
+    else:
+        subscription_items.delete(subscription["id"])
+
+
+async def _shared_lookup(key: Tuple[str, str], retrieve: Callable[[], Awaitable]):
+    # Concurrent misses for one key share a single retrieve
+    pending = _lookups.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(retrieve())
+        _lookups[key] = pending
+        pending.add_done_callback(lambda _: _lookups.pop(key, None))
+    return await asyncio.shield(pending)
+
+
+async def get_subscription_item_id(subscription_id: str) -> str:
+    item_id = subscription_items.get(subscription_id)
+    if item_id is not None:
+        return item_id
+    return await _shared_lookup(
+        ("subscription", subscription_id),
+        lambda: _retrieve_subscription_item_id(subscription_id),
+    )
+
+
+async def _retrieve_subscription_item_id(subscription_id: str) -> str:
+    subscription = await call_stripe(stripe.Subscription.retrieve, subscription_id)
+    item_id = subscription["items"]["data"][0]["id"]
+    subscription_items.set(subscription_id, item_id)
+    return item_id
+
+
+async def get_price(price_id: str) -> dict:
+    """Amount, currency and billing interval of a price."""
+    price = prices.get(price_id)
+    if price is not None:
+        return price
+    return await _shared_lookup(("price", price_id), lambda: _retrieve_price(price_id))
+
+
+async def _retrieve_price(price_id: str) -> dict:
+    price = await call_stripe(stripe.Price.retrieve, price_id)
+    recurring = price.get("recurring") or {}
+    summary = {
+        "id": price["id"],
+        "unit_amount": price.get("unit_amount"),
+        "currency": price.get("currency"),
+        "interval": recurring.get("interval"),
+        "active": price.get("active", True),
+    }
+    prices.set(price_id, summary)
+    return summary
+
+
+async def modify_subscription(subscription_id: str, **params):
+    subscription = await call_stripe(stripe.Subscription.modify, subscription_id, **params)
+    remember_subscription(subscription)
+    return subscription
@@ -0,0 +1,292 @@
+"""
+Stripe webhook events: storage and processing.
+
+The webhook only verifies the signature and stores the event (``record_event``)
+keyed by its Stripe id, so it answers Stripe immediately and a redelivered
+event is a primary-key conflict that is ignored. ``StripeEventWorker`` then
+applies the stored events to teams.
+
+Events are applied in ``created`` order per ordering key (the subscription,
+falling back to the customer): a key's events are claimed only up to its
+first event that is not due, so an event waiting for a retry holds back the
+later events of its subscription but not those of other subscriptions.
+Applying an event and marking it processed happen in one transaction.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import random
+
+import anyio
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from . import seats
+from .entitlements import PLAN_MEMBER_LIMITS
+from .stripe_client import remember_subscription, subscription_items
+
+logger = logging.getLogger(__name__)
+
+# Stripe subscription status -> team subscription status
+STATUS_MAPPING = {
+    "active": "active",
+    "past_due": "active",  # Keep active but may need payment
+    "canceled": "cancelled",
+    "unpaid": "expired",
+    "incomplete": "trial",
+    "incomplete_expired": "expired"
+}
+
+
+def ordering_key(event: dict) -> str:
+    """The subscription an event belongs to, so its events apply in order."""
+    obj = event["data"]["object"]
+    if obj.get("object") == "subscription":
+        return obj["id"]
+    return obj.get("subscription") or obj.get("customer") or event["id"]
+
+
+def record_event(db: Session, event: dict) -> bool:
+    """Store a verified event; return False if it was already stored."""
+    db.add(
+        models.StripeEvent(
+            id=event["id"],
+            type=event["type"],
+            ordering_key=ordering_key(event),
+            stripe_created=event["created"],
+            payload=event,
+            next_attempt_at=datetime.utcnow(),
+        )
+    )
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+
+def handle_checkout_completed(db: Session, session: dict) -> None:
+    """Payment successful, create team"""
+    user_id = session["metadata"].get("user_id")
+    plan = session["metadata"].get("plan", "basic")
+    if not user_id:
+        return
+
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user and not user.team_id:
+        member_limit = PLAN_MEMBER_LIMITS.get(plan, PLAN_MEMBER_LIMITS["basic"])
+        team = models.Team(
+            name=f"{user.name}'s Team",
+            subscription_status="active",
+            subscription_plan=plan,
+            member_limit=member_limit,
+            stripe_customer_id=session.get("customer"),
+            stripe_subscription_id=session.get("subscription")
+        )
+        db.add(team)
+        db.flush()
+
+        # Assign user as team owner, taking the team's first seat
+        seats.add_member_seat(db, team.id)
+        user.team_id = team.id
+        user.team_role = "owner"
+        user.role = "advanced"
+
+
+def handle_subscription_updated(db: Session, subscription: dict) -> None:
+    """Subscription plan changed"""
+    remember_subscription(subscription)
+    team = db.query(models.Team).filter(
+        models.Team.stripe_subscription_id == subscription["id"]
+    ).first()
+    if team:
+        team.subscription_status = STATUS_MAPPING.get(subscription["status"], "active")
+        team.updated_at = datetime.utcnow()
+
+
+def handle_subscription_deleted(db: Session, subscription: dict) -> None:
+    """Subscription cancelled"""
+    subscription_items.delete(subscription["id"])
+    team = db.query(models.Team).filter(
+        models.Team.stripe_subscription_id == subscription["id"]
+    ).first()
+    if team:
+        team.subscription_status = "cancelled"
+        team.updated_at = datetime.utcnow()
+
+
+def handle_payment_failed(db: Session, invoice: dict) -> None:
+    """Payment failed"""
+    team = db.query(models.Team).filter(
+        models.Team.stripe_customer_id == invoice.get("customer")
+    ).first()
+    if team:
+        # TODO: Send email notification in Phase 4
+        # send_payment_failed_email(team.owner_email, team.name)
+        pass
+
+
+HANDLERS: Dict[str, Callable[[Session, dict], None]] = {
+    "checkout.session.completed": handle_checkout_completed,
+    "customer.subscription.updated": handle_subscription_updated,
+    "customer.subscription.deleted": handle_subscription_deleted,
+    "invoice.payment_failed": handle_payment_failed,
+}
+
+
+@dataclass(frozen=True)
+class WorkerSettings:
+    batch_size: int = 200
+    poll_interval: float = 1.0
+    lease: timedelta = timedelta(minutes=5)
+    max_attempts: int = 10
+    backoff_base: float = 5.0  # seconds; doubles per attempt
+    backoff_max: float = 3600.0
+    concurrency: int = 4  # subscriptions processed in parallel
+
+    @classmethod
+    def from_env(cls) -> "WorkerSettings":
+        return cls(
+            poll_interval=float(os.getenv("STRIPE_EVENT_POLL_INTERVAL", "1")),
+            max_attempts=int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", "10")),
+        )
+
+
+class StripeEventWorker:
+    def __init__(self, session_factory=SessionLocal, settings: Optional[WorkerSettings] = None):
+        self.session_factory = session_factory
+        self.settings = settings or WorkerSettings.from_env()
+        self._stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Process events until ``stop()`` is called."""
+        while not self._stopped.is_set():
+            try:
+                processed = await self.process_once()
+            except Exception:
+                logger.exception("Stripe event processing failed")
+                processed = 0
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=self.settings.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def process_once(self) -> int:
+        """Claim and process one batch; return the number of events claimed."""
+        claimed = await anyio.to_thread.run_sync(self._claim)
+        limiter = anyio.CapacityLimiter(self.settings.concurrency)
+        async with anyio.create_task_group() as tasks:
+            for event_ids in claimed.values():
+                tasks.start_soon(
+                    lambda ids: anyio.to_thread.run_sync(self._process_in_order, ids, limiter=limiter),
+                    event_ids,
+                )
+        return sum(len(event_ids) for event_ids in claimed.values())
+
+    def _claim(self) -> Dict[str, list]:
+        """Lease the due prefix of each ordering key's unprocessed events."""
+        settings = self.settings
+        now = datetime.utcnow()
+        db: Session = self.session_factory()
+        try:
+            # No SKIP LOCKED: a concurrent worker waits for this claim and then
+            # sees the leases, instead of jumping ahead within a subscription
+            rows = (
+                db.query(models.StripeEvent)
+                .filter(models.StripeEvent.status.in_(("pending", "processing")))
+                .order_by(models.StripeEvent.stripe_created, models.StripeEvent.received_at)
+                .limit(settings.batch_size)
+                .with_for_update()
+                .all()
+            )
+            claimed: Dict[str, list] = {}
+            blocked = set()
+            for row in rows:
+                if row.ordering_key in blocked:
+                    continue
+                if row.next_attempt_at > now:
+                    blocked.add(row.ordering_key)
+                    continue
+                row.status = "processing"
+                row.next_attempt_at = now + settings.lease
+                claimed.setdefault(row.ordering_key, []).append(row.id)
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _process_in_order(self, event_ids: list) -> None:
+        for position, event_id in enumerate(event_ids):
+            if not self._process(event_id):
+                self._release(event_ids[position + 1:])
+                return
+
+    def _process(self, event_id: str) -> bool:
+        db: Session = self.session_factory()
+        try:
+            event = db.query(models.StripeEvent).filter(models.StripeEvent.id == event_id).one()
+            handler = HANDLERS.get(event.type)
+            try:
+                if handler is not None:
+                    handler(db, event.payload["data"]["object"])
+                event.status = "processed"
+                event.attempts += 1
+                event.processed_at = datetime.utcnow()
+                event.last_error = None
+                db.commit()
+                return True
+            except Exception as exc:
+                db.rollback()
+                self._record_failure(db, event_id, exc)
+                return False
+        finally:
+            db.close()
+
+    def _record_failure(self, db: Session, event_id: str, error: Exception) -> None:
+        settings = self.settings
+        event = db.query(models.StripeEvent).filter(models.StripeEvent.id == event_id).one()
+        event.attempts += 1
+        event.last_error = str(error)[:2000]
+        if event.attempts >= settings.max_attempts:
+            event.status = "failed"
+            logger.error(f"✗ Giving up on Stripe event {event.id} ({event.type}): {error}")
+        else:
+            ceiling = min(settings.backoff_max, settings.backoff_base * 2 ** (event.attempts - 1))
+            event.status = "pending"
+            event.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=random.uniform(ceiling / 2, ceiling)
+            )
+            logger.warning(
+                f"Stripe event {event.id} ({event.type}) failed (attempt {event.attempts}), retrying: {error}"
+            )
+        db.commit()
+
+    def _release(self, event_ids: list) -> None:
+        """Hand back claimed events held up behind a failed one."""
+        if not event_ids:
+            return
+        db: Session = self.session_factory()
+        try:
+            db.query(models.StripeEvent).filter(models.StripeEvent.id.in_(event_ids)).update(
+                {"status": "pending", "next_attempt_at": datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(StripeEventWorker().run())
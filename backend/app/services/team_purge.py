@@ -0,0 +1,279 @@
+"""
+Purge of soft-deleted teams.
+
+``soft_delete_team`` only schedules the deletion; once
+``deletion_scheduled_for`` passes, ``TeamPurgeWorker`` deletes the team's
+data. A large team has far too many rows for one transaction, so each table
+is emptied in batches of ``batch_size`` rows taken in primary-key order, one
+short transaction per batch, with a pause between batches to leave room for
+regular traffic. Each batch starts after the last id of the one before, so it
+never re-reads the rows already handled, and the partitioned tables are
+deleted from by id and partition key, so only the batch's months are touched. Child rows go first (diagnostics, treatments, bed history),
+then patients, invitations and the team's cold archive; members are detached
+rather than deleted, and the team row goes last.
+
+Progress is kept per team in ``team_purges``, updated in the same
+transaction as each batch, so the row counts are exact and a purge
+interrupted by a crash or deploy picks up where it stopped: every batch is
+computed from what is left. A lease on that row (``claimed_by`` and
+``claimed_until``) keeps two workers from purging the same team: each batch
+renews it in its own transaction, conditionally on still holding it, and the
+worker stops as soon as it does not, so a worker that stalled past its lease
+cannot delete alongside the one that took the team over.
+
+The worker runs inside the app (see ``main.py``) or on its own with
+``python -m app.services.team_purge``.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+from uuid import UUID, uuid4
+import asyncio
+import logging
+import os
+import socket
+
+import anyio
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .. import models
+from ..database import SessionLocal
+from . import archive, entitlements
+from .partitions import PARTITION_KEYS
+
+logger = logging.getLogger(__name__)
+
+
+def _team_patients(team_id: UUID):
+    return select(models.Patient.id).where(models.Patient.team_id == team_id)
+
+
+# (table, model, condition selecting the team's rows), in deletion order
+PURGE_STEPS = [
+    ("diagnostics", models.Diagnostic, lambda team_id: models.Diagnostic.patient_id.in_(_team_patients(team_id))),
+    ("treatments", models.Treatment, lambda team_id: models.Treatment.patient_id.in_(_team_patients(team_id))),
+    ("bed_history", models.BedHistory, lambda team_id: models.BedHistory.patient_id.in_(_team_patients(team_id))),
+    ("patients", models.Patient, lambda team_id: models.Patient.team_id == team_id),
+    ("team_invitations", models.TeamInvitation, lambda team_id: models.TeamInvitation.team_id == team_id),
+    ("archive_files", models.ArchiveFile, lambda team_id: models.ArchiveFile.team_id == team_id),
+    ("users", models.User, lambda team_id: models.User.team_id == team_id),  # detached
+]
+
+
+@dataclass(frozen=True)
+class PurgeSettings:
+    batch_size: int = 500
+    batch_pause: float = 0.5  # seconds between batches
+    interval: float = 3600.0  # seconds between looking for due teams
+    lease: timedelta = timedelta(minutes=10)
+
+    @classmethod
+    def from_env(cls) -> "PurgeSettings":
+        return cls(
+            batch_size=int(os.getenv("TEAM_PURGE_BATCH_SIZE", "500")),
+            batch_pause=float(os.getenv("TEAM_PURGE_BATCH_PAUSE", "0.5")),
+            interval=float(os.getenv("TEAM_PURGE_INTERVAL", "3600")),
+        )
+
+
+class TeamPurgeWorker:
+    def __init__(self, session_factory=SessionLocal, settings: Optional[PurgeSettings] = None):
+        self.session_factory = session_factory
+        self.settings = settings or PurgeSettings.from_env()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Purge due teams every ``interval`` seconds until ``stop()`` is called."""
+        while not self._stopped.is_set():
+            try:
+                await self.purge_due_teams()
+            except Exception:
+                logger.exception("Team purge failed")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.settings.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def purge_due_teams(self) -> int:
+        """Purge every team past its deletion date; return how many finished."""
+        purged = 0
+        for team_id in await anyio.to_thread.run_sync(self._due_teams):
+            if self._stopped.is_set():
+                break
+            if await self.purge_team(team_id):
+                purged += 1
+        return purged
+
+    async def purge_team(self, team_id: UUID) -> bool:
+        """Purge one team; False if another worker holds it or we were stopped."""
+        if not await anyio.to_thread.run_sync(self._claim, team_id):
+            return False
+        for table, model, condition in PURGE_STEPS:
+            after = None
+            while True:
+                if self._stopped.is_set():
+                    return False
+                done = await anyio.to_thread.run_sync(
+                    self._purge_batch, team_id, table, model, condition, after
+                )
+                if done is None:
+                    logger.warning("Lost the lease on team %s; another worker continues", team_id)
+                    return False
+                if len(done) < self.settings.batch_size:
+                    break
+                after = done[-1]
+                await asyncio.sleep(self.settings.batch_pause)
+        return await anyio.to_thread.run_sync(self._finish, team_id)
+
+    def _due_teams(self) -> list:
+        db = self.session_factory()
+        try:
+            return db.execute(
+                select(models.Team.id)
+                .where(
+                    models.Team.deleted_at.isnot(None),
+                    models.Team.deletion_scheduled_for <= datetime.utcnow(),
+                )
+                .order_by(models.Team.deletion_scheduled_for)
+            ).scalars().all()
+        finally:
+            db.close()
+
+    def _claim(self, team_id: UUID) -> bool:
+        """Take the team's lease, creating its progress row on first run."""
+        db = self.session_factory()
+        try:
+            if db.get(models.TeamPurge, team_id) is None:
+                team = db.get(models.Team, team_id)
+                db.add(models.TeamPurge(
+                    team_id=team_id, team_name=team.name if team else None, rows_deleted={}
+                ))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()  # another worker created it first
+            now = datetime.utcnow()
+            result = db.execute(
+                update(models.TeamPurge)
+                .where(
+                    models.TeamPurge.team_id == team_id,
+                    models.TeamPurge.status == "running",
+                    or_(models.TeamPurge.claimed_until.is_(None), models.TeamPurge.claimed_until < now),
+                )
+                .values(claimed_by=self.worker_id, claimed_until=now + self.settings.lease, updated_at=now)
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+
+    def _renew_lease(self, db, team_id: UUID) -> Optional[dict]:
+        """Extend our lease in the current transaction, locking the progress
+        row; None if the lease expired or another worker took it over."""
+        now = datetime.utcnow()
+        return db.execute(
+            update(models.TeamPurge)
+            .where(
+                models.TeamPurge.team_id == team_id,
+                models.TeamPurge.claimed_by == self.worker_id,
+                models.TeamPurge.claimed_until > now,
+            )
+            .values(claimed_until=now + self.settings.lease, updated_at=now)
+            .returning(models.TeamPurge.rows_deleted)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+
+    def _purge_batch(
+        self, team_id: UUID, table: str, model, condition, after: Optional[UUID] = None
+    ) -> Optional[List[UUID]]:
+        """Delete (or detach) the next batch of a table's rows, with ids after
+        ``after``, and record it.
+
+        Returns the batch's ids in order, or None without touching anything if
+        the lease was lost.
+        """
+        db = self.session_factory()
+        try:
+            rows_deleted = self._renew_lease(db, team_id)
+            if rows_deleted is None:
+                db.rollback()
+                return None
+            key = getattr(model, PARTITION_KEYS[table]) if table in PARTITION_KEYS else None
+            query = select(model.id, *([key] if key is not None else [])).where(condition(team_id))
+            if after is not None:
+                query = query.where(model.id > after)
+            rows = db.execute(query.order_by(model.id).limit(self.settings.batch_size)).all()
+            ids = [row[0] for row in rows]
+            if ids:
+                if model is models.User:
+                    db.execute(
+                        update(models.User)
+                        .where(models.User.id.in_(ids))
+                        .values(team_id=None, team_role=None)
+                    )
+                elif key is not None:
+                    # The partition key lets Postgres skip the other months
+                    days = {row[1] for row in rows}
+                    db.execute(delete(model).where(model.id.in_(ids), key.in_(days)))
+                else:
+                    db.execute(delete(model).where(model.id.in_(ids)))
+            rows_deleted = {**rows_deleted, table: rows_deleted.get(table, 0) + len(ids)}
+            db.execute(
+                update(models.TeamPurge)
+                .where(models.TeamPurge.team_id == team_id)
+                .values(rows_deleted=rows_deleted)
+            )
+            db.commit()
+            if len(ids) < self.settings.batch_size:
+                logger.info(
+                    "Purging team %s: %s done (%d rows)",
+                    team_id, table, rows_deleted[table],
+                )
+            return ids
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _finish(self, team_id: UUID) -> bool:
+        db = self.session_factory()
+        try:
+            if self._renew_lease(db, team_id) is None:
+                db.rollback()
+                return False
+            db.execute(
+                delete(models.Team).where(
+                    models.Team.id == team_id, models.Team.deleted_at.isnot(None)
+                )
+            )
+            now = datetime.utcnow()
+            db.execute(
+                update(models.TeamPurge)
+                .where(models.TeamPurge.team_id == team_id)
+                .values(
+                    status="completed", completed_at=now, updated_at=now,
+                    claimed_by=None, claimed_until=None,
+                )
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        archive.delete_team_archive(team_id)
+        entitlements.invalidate(team_id)
+        logger.info("Purged team %s", team_id)
+        return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(TeamPurgeWorker().run())
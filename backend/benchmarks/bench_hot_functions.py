@@ -0,0 +1,312 @@
+"""
+Microbenchmarks for the per-request hot path.
+
+Times, per call:
+
+* ``create_access_token`` and a bare JWT decode,
+* ``get_current_user`` (JWT decode plus the user lookup),
+* ``verify_password`` at several bcrypt costs,
+* validating and serializing lists of ``schemas.Patient`` / ``schemas.Treatment``
+  with pydantic, and the orjson serializers the list routes use,
+* the catalog reads (antibiotics, diagnostic categories and subcategories).
+
+Each benchmark is calibrated so a round lasts at least ``--min-time`` and is
+then run for ``--rounds`` rounds; the median per-call time is the figure to
+compare. Results are written as JSON with the commit and environment, and a
+previous result file can be compared against:
+
+    python benchmarks/bench_hot_functions.py --output before.json
+    # ... change code ...
+    python benchmarks/bench_hot_functions.py --compare before.json
+
+``--compare`` exits with status 1 if any benchmark got slower than
+``--threshold`` percent. Database benchmarks use DATABASE_URL and run inside
+a transaction that is rolled back; they are skipped with ``--no-db`` or when
+the database is unreachable. On SQLite the tables are created first, so
+``DATABASE_URL=sqlite://`` runs them on an empty in-memory database.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+import bcrypt
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+from pydantic import TypeAdapter
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import auth, models, schemas
+from app.database import engine
+from app.routers.antibiotics import read_antibiotics
+from app.routers.diagnostic_categories import (
+    read_diagnostic_categories,
+    read_diagnostic_subcategories,
+)
+from app.serialization import patient_list, treatment_list
+from bench_serialization import make_patients, make_treatments
+
+BCRYPT_COSTS = (4, 8, 10, 12)
+LIST_SIZES = (10, 100)
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str, needs_db: bool = False):
+    """Register a setup function returning the zero-argument callable to time."""
+
+    def register(setup):
+        BENCHMARKS[name] = (setup, needs_db)
+        return setup
+
+    return register
+
+
+def run_coroutine(coro):
+    """Drive a coroutine that never suspends, without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended")
+
+
+@benchmark("auth.create_access_token")
+def _create_access_token(ctx):
+    data = {"sub": str(uuid.uuid4())}
+    expires = timedelta(minutes=30)
+    return lambda: auth.create_access_token(data, expires)
+
+
+@benchmark("auth.jwt_decode")
+def _jwt_decode(ctx):
+    token = auth.create_access_token({"sub": str(uuid.uuid4())})
+    return lambda: jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+
+
+@benchmark("auth.get_current_user", needs_db=True)
+def _get_current_user(ctx):
+    db = ctx["db"]
+    token = auth.create_access_token({"sub": str(ctx["user"].id)})
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    def run():
+        user = run_coroutine(auth.get_current_user(credentials=credentials, db=db))
+        # A request starts with a fresh session, so don't serve the user from
+        # the identity map
+        db.expunge(user)
+
+    return run
+
+
+for _cost in BCRYPT_COSTS:
+
+    @benchmark(f"auth.verify_password[cost={_cost}]")
+    def _verify_password(ctx, cost=_cost):
+        hashed = bcrypt.hashpw(b"correct horse battery", bcrypt.gensalt(rounds=cost)).decode()
+        return lambda: auth.verify_password("correct horse battery", hashed)
+
+
+for _size in LIST_SIZES:
+    for _resource, _schema, _factory, _serializer in (
+        ("patients", schemas.Patient, make_patients, patient_list),
+        ("treatments", schemas.Treatment, make_treatments, treatment_list),
+    ):
+
+        @benchmark(f"serialize.{_resource}[{_size}].pydantic")
+        def _pydantic(ctx, schema=_schema, factory=_factory, size=_size):
+            adapter = TypeAdapter(List[schema])
+            rows = factory(size)
+            return lambda: adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+        @benchmark(f"serialize.{_resource}[{_size}].orjson")
+        def _orjson(ctx, serializer=_serializer, factory=_factory, size=_size):
+            rows = factory(size)
+            return lambda: serializer.dumps(rows)
+
+
+@benchmark("catalog.antibiotics", needs_db=True)
+def _antibiotics(ctx):
+    return lambda: read_antibiotics(db=ctx["db"], current_user=ctx["user"])
+
+
+@benchmark("catalog.diagnostic_categories", needs_db=True)
+def _diagnostic_categories(ctx):
+    return lambda: read_diagnostic_categories(db=ctx["db"], current_user=ctx["user"])
+
+
+@benchmark("catalog.diagnostic_subcategories", needs_db=True)
+def _diagnostic_subcategories(ctx):
+    return lambda: read_diagnostic_subcategories(db=ctx["db"], current_user=ctx["user"])
+
+
+def ensure_catalogs(db: Session) -> None:
+    """Give the catalog reads something to read if the database is empty."""
+    if not db.query(models.Antibiotic).first():
+        db.add_all(
+            models.Antibiotic(name=f"Antibiotic {i}", type="antibiotic", default_start_count=i % 2)
+            for i in range(45)
+        )
+    if not db.query(models.DiagnosticCategory).first():
+        for i in range(15):
+            category = models.DiagnosticCategory(name=f"Category {i}", code=f"CAT_{i}", sort_order=i)
+            category.subcategories = [
+                models.DiagnosticSubcategory(name=f"Diagnosis {i}.{j}", code=f"D{i}.{j}", sort_order=j)
+                for j in range(8)
+            ]
+            db.add(category)
+    db.flush()
+
+
+def measure(fn, min_time: float, rounds: int) -> dict:
+    fn()  # warm up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time:
+            break
+        number *= 2
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - start) / number)
+    median = statistics.median(per_call)
+    return {
+        "calls_per_round": number,
+        "rounds": rounds,
+        "median_us": median * 1e6,
+        "min_us": min(per_call) * 1e6,
+        "stdev_us": statistics.stdev(per_call) * 1e6 if rounds > 1 else 0.0,
+        "ops_per_s": 1 / median,
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def run_all(args) -> dict:
+    selected = {
+        name: entry
+        for name, entry in BENCHMARKS.items()
+        if not args.filter or any(f in name for f in args.filter)
+    }
+    results = {}
+    ctx = {}
+    connection = transaction = None
+    if not args.no_db and any(needs_db for _, needs_db in selected.values()):
+        try:
+            connection = engine.connect()
+        except OperationalError as exc:
+            print(f"Skipping database benchmarks: {exc.orig}", file=sys.stderr)
+        else:
+            transaction = connection.begin()
+            if connection.dialect.name == "sqlite":
+                # A scratch database (sqlite:// is empty); rolled back with the rest
+                models.Base.metadata.create_all(connection)
+            db = Session(bind=connection, join_transaction_mode="create_savepoint")
+            ensure_catalogs(db)
+            user = models.User(
+                name="Benchmark", email=f"bench-{uuid.uuid4().hex}@biotrack.app",
+                hashed_password="", role="advanced", is_active=True, email_verified=True,
+            )
+            db.add(user)
+            db.flush()
+            ctx = {"db": db, "user": user}
+    try:
+        for name, (setup, needs_db) in selected.items():
+            if needs_db and not ctx:
+                continue
+            results[name] = measure(setup(ctx), args.min_time, args.rounds)
+            if not args.quiet:
+                print(f"{name:<44} {results[name]['median_us']:>12.2f} us", file=sys.stderr)
+    finally:
+        if connection is not None:
+            ctx["db"].close()
+            transaction.rollback()
+            connection.close()
+    return {"environment": environment(), "benchmarks": results}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> bool:
+    """Print a comparison table; return True if anything regressed."""
+    regressed = False
+    base = baseline["benchmarks"]
+    print(
+        f"baseline {baseline['environment']['commit']} -> "
+        f"current {current['environment']['commit']}"
+    )
+    print(f"{'benchmark':<44} {'before us':>12} {'after us':>12} {'change':>8}")
+    for name, result in current["benchmarks"].items():
+        if name not in base:
+            print(f"{name:<44} {'-':>12} {result['median_us']:>12.2f} {'new':>8}")
+            continue
+        before, after = base[name]["median_us"], result["median_us"]
+        change = (after - before) / before * 100
+        flag = ""
+        if change > threshold:
+            flag, regressed = "  REGRESSION", True
+        print(f"{name:<44} {before:>12.2f} {after:>12.2f} {change:>+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--filter", action="append", help="Only run benchmarks containing this text")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimum seconds per round")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--no-db", action="store_true", help="Skip benchmarks needing the database")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Compare against a previous JSON result file")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    parser.add_argument("--quiet", action="store_true")
+    parser.add_argument("--list", action="store_true", help="List benchmark names and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return
+
+    results = run_all(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+    elif not args.output:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
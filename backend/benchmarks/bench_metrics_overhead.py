@@ -0,0 +1,146 @@
+"""
+Overhead of MetricsMiddleware and the SQL cursor listeners.
+
+Drives the application router in-process with raw ASGI calls, once bare and
+once wrapped in MetricsMiddleware (with the cursor event listeners attached),
+and reports the per-request cost of each. The budget is 2%.
+
+Rounds are short and interleaved, and the fastest round of each variant is
+compared, so drift in the database or the machine affects both sides equally.
+The middleware's fixed cost is also measured around a no-op app, which is
+free of database noise.
+
+Needs the database from DATABASE_URL (the endpoints used run real queries).
+Run with: python benchmarks/bench_metrics_overhead.py [--requests 200] [--rounds 30]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from fastapi.middleware.asyncexitstack import AsyncExitStackMiddleware
+
+from app import instrumentation
+from app.main import app
+from app.middleware.metrics import MetricsMiddleware, MetricsRegistry
+
+PATHS = ["/api/v1/health/ready", "/api/v1/auth/users"]
+
+
+async def call(asgi_app, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await asgi_app(scope, receive, send)
+    return status
+
+
+async def run(asgi_app, requests: int) -> float:
+    """Seconds per request over ``requests`` sequential calls."""
+    start = time.perf_counter()
+    for i in range(requests):
+        status = await call(asgi_app, PATHS[i % len(PATHS)])
+        assert status == 200, status
+    return (time.perf_counter() - start) / requests
+
+
+async def noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def fixed_cost(requests: int = 20000) -> float:
+    """Seconds the middleware adds to a request that does no work."""
+    wrapped = MetricsMiddleware(noop_app, registry=MetricsRegistry())
+    times = {}
+    for name, asgi_app in (("bare", noop_app), ("wrapped", wrapped)) * 2:
+        start = time.perf_counter()
+        for _ in range(requests):
+            await call(asgi_app, "/noop")
+        times[name] = min(times.get(name, 1.0), (time.perf_counter() - start) / requests)
+    return times["wrapped"] - times["bare"]
+
+
+async def main_async(args):
+    bare = AsyncExitStackMiddleware(app.router)
+    wrapped = MetricsMiddleware(bare, registry=MetricsRegistry())
+
+    await run(bare, 500)  # warm up the pool and the routes
+    bare_times, wrapped_times = [], []
+    for _ in range(args.rounds):
+        instrumentation.uninstall()
+        bare_times.append(await run(bare, args.requests))
+        instrumentation.install()
+        wrapped_times.append(await run(wrapped, args.requests))
+
+    fixed_s = await fixed_cost()
+    bare_s = min(bare_times)
+    wrapped_s = min(wrapped_times)
+    return {
+        "requests_per_round": args.requests,
+        "rounds": args.rounds,
+        "bare_us_per_request": bare_s * 1e6,
+        "instrumented_us_per_request": wrapped_s * 1e6,
+        "middleware_fixed_cost_us": fixed_s * 1e6,
+        "fixed_cost_percent": fixed_s / bare_s * 100,
+        "overhead_percent": (wrapped_s - bare_s) / bare_s * 100,
+        "median_overhead_percent": (
+            statistics.median(wrapped_times) - statistics.median(bare_times)
+        )
+        / statistics.median(bare_times)
+        * 100,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--json", action="store_true", help="Emit JSON results")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"bare:         {result['bare_us_per_request']:.1f} us/request")
+    print(f"instrumented: {result['instrumented_us_per_request']:.1f} us/request")
+    print(
+        f"fixed cost:   {result['middleware_fixed_cost_us']:.1f} us/request "
+        f"({result['fixed_cost_percent']:.2f}%)"
+    )
+    print(f"overhead:     {result['overhead_percent']:.2f}% (best rounds)")
+    print(f"              {result['median_overhead_percent']:.2f}% (median rounds)")
+
+
+if __name__ == "__main__":
+    main()
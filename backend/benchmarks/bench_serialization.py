@@ -0,0 +1,172 @@
+"""
+Microbenchmark for list response serialization.
+
+Compares, per 1k rows, the cost of turning ORM rows into a JSON body through:
+
+* ``fastapi``   - what FastAPI does for ``response_model=List[...]``
+                  (validation + jsonable_encoder + json.dumps)
+* ``validated`` - ListSerializer with a prebuilt TypeAdapter
+* ``trusted``   - ListSerializer reading ORM attributes and encoding with orjson
+
+Runs without a database: rows are transient ORM instances.
+Run with: python benchmarks/bench_serialization.py [--rows 1000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import models, schemas
+from app.serialization import diagnostic_list, patient_list, treatment_list
+
+
+def make_patients(n: int) -> list:
+    now = datetime.utcnow()
+    return [
+        models.Patient(
+            id=uuid.uuid4(),
+            team_id=uuid.uuid4(),
+            rut=f"{10000000 + i}-{i % 10}",
+            name=f"Paciente {i}",
+            age=20 + i % 70,
+            status="active",
+            unit="UCI",
+            bed_number=i % 30,
+            has_ending_soon_program=bool(i % 2),
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(n)
+    ]
+
+
+def make_treatments(n: int) -> list:
+    now = datetime.utcnow()
+    return [
+        models.Treatment(
+            id=uuid.uuid4(),
+            patient_id=uuid.uuid4(),
+            antibiotic_name="Ceftriaxona",
+            antibiotic_type="antibiotic",
+            start_date=date.today() - timedelta(days=i % 14),
+            days_applied=i % 14,
+            programmed_days=14,
+            status="active",
+            start_count=0,
+            dosage="1g c/24h",
+            created_by_user_id=uuid.uuid4(),
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(n)
+    ]
+
+
+def make_diagnostics(n: int) -> list:
+    now = datetime.utcnow()
+    return [
+        models.Diagnostic(
+            id=uuid.uuid4(),
+            patient_id=uuid.uuid4(),
+            category_id=uuid.uuid4(),
+            subcategory_id=uuid.uuid4(),
+            diagnosis_name="Neumonía adquirida en la comunidad",
+            diagnosis_code="J18.9",
+            date_diagnosed=date.today(),
+            severity="moderate",
+            notes="Sin complicaciones",
+            created_by="Dr. Test",
+            created_by_user_id=uuid.uuid4(),
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(n)
+    ]
+
+
+def fastapi_path(schema):
+    """Reproduce FastAPI's response_model serialization for a list route."""
+    field = create_response_field(name="Response", type_=List[schema])
+
+    def run(rows):
+        content = asyncio.run(
+            serialize_response(field=field, response_content=rows, is_coroutine=True)
+        )
+        return JSONResponse(content).body
+
+    return run
+
+
+def measure(fn, rows, repeat: int) -> float:
+    """Return the best time in seconds over ``repeat`` runs."""
+    fn(rows)  # warm up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Emit JSON results")
+    args = parser.parse_args()
+
+    cases = [
+        ("patients", schemas.Patient, make_patients, patient_list),
+        ("treatments", schemas.Treatment, make_treatments, treatment_list),
+        ("diagnostics", schemas.Diagnostic, make_diagnostics, diagnostic_list),
+    ]
+
+    results = []
+    for name, schema, factory, serializer in cases:
+        rows = factory(args.rows)
+        paths = {
+            "fastapi": fastapi_path(schema),
+            "validated": lambda r, s=serializer: s.dumps(r, validate=True),
+            "trusted": serializer.dumps,
+        }
+        for path, fn in paths.items():
+            seconds = measure(fn, rows, args.repeat)
+            results.append(
+                {
+                    "resource": name,
+                    "path": path,
+                    "rows": args.rows,
+                    "ms_per_1k_rows": seconds * 1000 * 1000 / args.rows,
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'resource':<12} {'path':<10} {'ms/1k rows':>10} {'speedup':>8}")
+    baseline = {}
+    for r in results:
+        if r["path"] == "fastapi":
+            baseline[r["resource"]] = r["ms_per_1k_rows"]
+        speedup = baseline[r["resource"]] / r["ms_per_1k_rows"]
+        print(
+            f"{r['resource']:<12} {r['path']:<10} "
+            f"{r['ms_per_1k_rows']:>10.2f} {speedup:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
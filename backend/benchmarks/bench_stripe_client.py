@@ -0,0 +1,225 @@
+"""
+Benchmark the Stripe calls against a local fake Stripe server.
+
+Starts a threaded HTTP server that answers the endpoints the subscription
+routes use after ``--latency`` milliseconds, points the SDK at it and runs
+``--concurrency`` concurrent calls per scenario:
+
+* ``checkout.blocking``  - the SDK called directly from a coroutine (what the
+                           routes used to do): calls run one after another
+                           and the event loop is blocked meanwhile
+* ``checkout.threaded``  - ``stripe_client.create_checkout_session``
+* ``item_lookup.cold``   - ``get_subscription_item_id`` with an empty cache
+* ``item_lookup.cached`` - the same lookups served from the cache
+* ``outage.no_breaker``  - calls while the fake server answers 503, in
+                           waves of ``--wave`` concurrent calls
+* ``outage.breaker``     - the same through the circuit breaker
+
+For each scenario it reports wall time, the worst event loop stall (measured
+by a 5 ms ticker) and the number of requests the fake server received.
+
+    python benchmarks/bench_stripe_client.py --concurrency 50 --latency 100
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import stripe
+
+from app.services import stripe_client
+from bench_hot_functions import environment
+
+SUBSCRIPTION_PATH = re.compile(r"^/v1/subscriptions/(?P<id>[\w-]+)$")
+
+
+class FakeStripe(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), FakeStripeHandler)
+        self.latency = latency
+        self.outage = False
+        self.requests = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.requests[key] += 1
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like api.stripe.com
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._handle()
+
+    def _handle(self):
+        server: FakeStripe = self.server
+        server.count(f"{self.command} {SUBSCRIPTION_PATH.sub('/v1/subscriptions/{id}', self.path)}")
+        time.sleep(server.latency)
+        if server.outage:
+            return self._reply(503, {"error": {"type": "api_error", "message": "Service unavailable"}})
+
+        match = SUBSCRIPTION_PATH.match(self.path)
+        if self.path == "/v1/checkout/sessions":
+            body = {"id": "cs_test_1", "object": "checkout.session", "url": "https://checkout.test/cs_test_1"}
+        elif self.path == "/v1/billing_portal/sessions":
+            body = {"id": "bps_test_1", "object": "billing_portal.session", "url": "https://portal.test/bps_test_1"}
+        elif match:
+            body = {
+                "id": match["id"],
+                "object": "subscription",
+                "status": "active",
+                "items": {"object": "list", "data": [{"id": f"si_{match['id']}", "object": "subscription_item"}]},
+            }
+        else:
+            return self._reply(404, {"error": {"type": "invalid_request_error", "message": "Unknown path"}})
+        self._reply(200, body)
+
+    def _reply(self, status: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+CHECKOUT_PARAMS = {
+    "customer_email": "bench@biotrack.app",
+    "mode": "subscription",
+    "line_items": [{"price": "price_basic", "quantity": 1}],
+    "success_url": "http://localhost/success",
+    "cancel_url": "http://localhost/cancel",
+}
+
+
+async def blocking_checkout(i):
+    return stripe.checkout.Session.create(**CHECKOUT_PARAMS)
+
+
+async def threaded_checkout(i):
+    return await stripe_client.create_checkout_session(**CHECKOUT_PARAMS)
+
+
+async def item_lookup(i):
+    return await stripe_client.get_subscription_item_id(f"sub_{i % 10}")
+
+
+async def call_during_outage(i):
+    try:
+        await stripe_client.call_stripe(stripe.Subscription.retrieve, f"sub_{i}")
+    except stripe.error.StripeError:
+        pass
+
+
+def without_breaker():
+    # A breaker that never opens
+    stripe_client.breaker = stripe_client.CircuitBreaker(failure_threshold=sys.maxsize)
+
+
+def with_breaker():
+    stripe_client.breaker = stripe_client.CircuitBreaker()
+
+
+async def run_scenario(call, concurrency: int, wave: int) -> dict:
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        interval = 0.005
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            stalls.append(time.perf_counter() - start - interval)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    for first in range(0, concurrency, wave):
+        await asyncio.gather(*(call(i) for i in range(first, min(first + wave, concurrency))))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return {"wall_ms": elapsed * 1000, "max_loop_stall_ms": max(stalls) * 1000}
+
+
+async def run_all(server: FakeStripe, concurrency: int, wave: int) -> dict:
+    scenarios = {
+        "checkout.blocking": (blocking_checkout, None),
+        "checkout.threaded": (threaded_checkout, None),
+        "item_lookup.cold": (item_lookup, stripe_client.subscription_items.clear),
+        "item_lookup.cached": (item_lookup, None),
+        "outage.no_breaker": (call_during_outage, without_breaker),
+        "outage.breaker": (call_during_outage, with_breaker),
+    }
+    results = {}
+    for name, (call, setup) in scenarios.items():
+        if setup:
+            setup()
+        server.outage = name.startswith("outage")
+        before = sum(server.requests.values())
+        results[name] = await run_scenario(
+            call, concurrency, wave if server.outage else concurrency
+        )
+        results[name]["stripe_requests"] = sum(server.requests.values()) - before
+        print(
+            f"{name:<20} {results[name]['wall_ms']:>10.1f} ms wall "
+            f"{results[name]['max_loop_stall_ms']:>10.1f} ms max stall "
+            f"{results[name]['stripe_requests']:>6} requests",
+            file=sys.stderr,
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=100, help="Fake Stripe latency in ms")
+    parser.add_argument("--wave", type=int, default=5, help="Concurrent calls per wave during the outage")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    server = FakeStripe(args.latency / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stripe.api_base = server.url
+    stripe.max_network_retries = 0  # one request per call, so counts compare
+    try:
+        results = asyncio.run(run_all(server, args.concurrency, args.wave))
+    finally:
+        server.shutdown()
+
+    report = {
+        "environment": environment(),
+        "config": {"concurrency": args.concurrency, "latency_ms": args.latency, "wave": args.wave},
+        "benchmarks": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
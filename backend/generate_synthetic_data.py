@@ -0,0 +1,429 @@
+"""
+Synthetic data generator for performance work.
+
+Creates N teams, each with an owner and members, patients spread over the
+hospital units, treatments drawn from the seeded antibiotics (using their
+``default_start_count``), diagnostics spread over the seeded diagnostic
+subcategories, and several years of bed history. Rows are streamed into
+Postgres with COPY, so tens of millions of rows load in minutes (pass
+``--skip-fk-checks`` as a superuser to roughly halve the load time).
+
+The output is deterministic for a given ``--seed`` and ``--as-of`` date
+(only the shared bcrypt password hash differs between runs). Every
+synthetic user can log in with ``--password``.
+
+Requires the catalogs to be seeded first:
+
+    python seed_antibiotics.py
+    python seed_diagnostic_categories.py
+    python generate_synthetic_data.py --teams 1000 --seed 42
+
+Meant for an empty or disposable database: RUTs and emails are only unique
+within one run.
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import bcrypt
+from app.database import engine
+from app.rut import check_digit, normalize_rut
+
+UNITS = {
+    # unit name: (relative size, beds)
+    "UCI": (0.6, 12),
+    "UTI": (0.8, 16),
+    "Medicina": (1.4, 40),
+    "Cirugía": (1.2, 32),
+}
+
+PATIENT_STATUSES = (("active", 0.55), ("waiting", 0.1), ("archived", 0.35))
+TREATMENT_STATUSES = ("active", "suspended", "extended", "finished")
+PROGRAMMED_DAYS = (5, 7, 7, 10, 14, 14, 21, 28)
+SEVERITIES = (("mild", 0.3), ("moderate", 0.4), ("severe", 0.22), ("critical", 0.08))
+DOSAGES = ("500mg c/8h", "1g c/12h", "1g c/24h", "2g c/8h", "15mg/kg c/12h")
+FIRST_NAMES = (
+    "María", "José", "Juan", "Ana", "Luis", "Carmen", "Pedro", "Rosa", "Jorge",
+    "Camila", "Diego", "Valentina", "Matías", "Javiera", "Sebastián", "Catalina",
+)
+LAST_NAMES = (
+    "González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva",
+    "Martínez", "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes", "Araya",
+)
+
+# Version 4 / RFC 4122 variant bits, as set by uuid.UUID(..., version=4)
+UUID_CLEAR_MASK = ~((0xF000 << 64) | (0xC000 << 48))
+UUID_V4_BITS = (0x4000 << 64) | (0x8000 << 48)
+
+RUT_MIN = 1_000_000
+RUT_SPAN = 98_000_000
+RUT_STRIDE = 7_919_993  # coprime with RUT_SPAN
+
+# Columns loaded per table, in dependency order
+TABLES = {
+    "teams": (
+        "id", "name", "subscription_status", "subscription_plan", "member_limit",
+        "member_count", "trial_ends_at", "created_at", "updated_at",
+    ),
+    "users": (
+        "id", "name", "email", "hashed_password", "role", "team_id", "team_role",
+        "is_active", "email_verified", "created_at", "updated_at",
+    ),
+    "patients": (
+        "id", "team_id", "rut", "rut_normalized", "name", "age", "status", "unit", "bed_number",
+        "has_ending_soon_program", "created_at", "updated_at",
+    ),
+    "treatments": (
+        "id", "patient_id", "antibiotic_name", "antibiotic_type", "start_date",
+        "days_applied", "programmed_days", "status", "start_count", "dosage",
+        "created_by_user_id", "created_at", "updated_at",
+    ),
+    "diagnostics": (
+        "id", "patient_id", "category_id", "subcategory_id", "diagnosis_name",
+        "diagnosis_code", "date_diagnosed", "severity", "created_by",
+        "created_by_user_id", "created_at", "updated_at",
+    ),
+    "bed_history": ("id", "patient_id", "bed_id", "start_date", "end_date", "notes"),
+}
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_value(value) -> str:
+    """Format a non-string value for COPY ... FROM STDIN in text format.
+
+    Strings are written as they are: generated strings never contain tabs,
+    newlines or backslashes, and catalog strings are escaped once on load.
+    """
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    return str(value)
+
+
+def escape(value: str) -> str:
+    return value.translate(_ESCAPES)
+
+
+class CopyLoader:
+    """Buffers rows per table and streams them to Postgres with COPY."""
+
+    def __init__(self, connection, batch_rows: int):
+        self.connection = connection
+        self.batch_rows = batch_rows
+        self.buffers = {table: io.StringIO() for table in TABLES}
+        self.pending = 0
+        self.counts = dict.fromkeys(TABLES, 0)
+
+    def add(self, table: str, row: tuple) -> None:
+        self.buffers[table].write(
+            "\t".join([v if type(v) is str else copy_value(v) for v in row]) + "\n"
+        )
+        self.counts[table] += 1
+        self.pending += 1
+
+    def maybe_flush(self) -> None:
+        if self.pending >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        # Parents are always generated before their children, so flushing every
+        # table in dependency order keeps foreign keys satisfied.
+        with self.connection.cursor() as cursor:
+            for table, columns in TABLES.items():
+                buffer = self.buffers[table]
+                if not buffer.tell():
+                    continue
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)",
+                    buffer,
+                )
+                self.buffers[table] = io.StringIO()
+        self.pending = 0
+
+
+class Generator:
+    def __init__(self, args, antibiotics, subcategories, beds):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.antibiotics = antibiotics
+        self.subcategories = subcategories
+        # Long-tailed popularity: a few diagnoses account for most cases
+        self.subcategory_weights = [1 / (rank + 1) for rank in range(len(subcategories))]
+        self.rng.shuffle(self.subcategory_weights)
+        self.beds = beds
+        self.as_of = args.as_of
+        self.history_days = int(args.years * 365)
+        self.password_hash = bcrypt.hashpw(
+            args.password.encode("utf-8"), bcrypt.gensalt(rounds=args.bcrypt_rounds)
+        ).decode("utf-8")
+        self.rut_offset = self.rng.randrange(RUT_SPAN)
+        self.patients = 0
+
+    def new_id(self) -> str:
+        """A random (version 4) UUID drawn from the seeded generator."""
+        h = "%032x" % (self.rng.getrandbits(128) & UUID_CLEAR_MASK | UUID_V4_BITS)
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+    def count(self, mean: float) -> int:
+        """Over-dispersed count around ``mean`` (gamma-distributed rate)."""
+        if mean <= 0:
+            return 0
+        return int(round(self.rng.gammavariate(2.0, mean / 2.0)))
+
+    def weighted(self, choices):
+        values, weights = zip(*choices)
+        return self.rng.choices(values, weights=weights)[0]
+
+    def timestamp(self, day: date) -> datetime:
+        return datetime.combine(day, datetime.min.time()) + timedelta(
+            seconds=self.rng.randrange(6 * 3600, 22 * 3600)
+        )
+
+    def past_day(self, max_days: int) -> date:
+        return self.as_of - timedelta(days=self.rng.randrange(max(1, max_days)))
+
+    def name(self) -> str:
+        rng = self.rng
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    def generate(self, loader: CopyLoader) -> None:
+        for team_index in range(self.args.teams):
+            self.team(loader, team_index)
+            loader.maybe_flush()
+            if self.args.progress and (team_index + 1) % self.args.progress == 0:
+                total = sum(loader.counts.values())
+                print(f"  {team_index + 1}/{self.args.teams} teams, {total:,} rows")
+        loader.flush()
+
+    def team(self, loader: CopyLoader, team_index: int) -> None:
+        rng, args = self.rng, self.args
+        team_id = self.new_id()
+        created = self.timestamp(self.past_day(self.history_days))
+        status = self.weighted((("active", 0.7), ("trial", 0.2), ("cancelled", 0.1)))
+        plan = "premium" if rng.random() < 0.3 else "basic"
+
+        user_ids = []
+        for member_index in range(1 + rng.randrange(args.members_per_team)):
+            user_id = self.new_id()
+            user_ids.append(user_id)
+            loader.add(
+                "users",
+                (
+                    user_id, self.name(),
+                    f"synthetic-{args.seed}-{team_index}-{member_index}@biotrack.app",
+                    self.password_hash, "advanced" if member_index == 0 else "basic",
+                    team_id, "owner" if member_index == 0 else "member",
+                    True, True, created, created,
+                ),
+            )
+        # Added after its members to know member_count; tables load in TABLES order
+        loader.add(
+            "teams",
+            (
+                team_id, f"Equipo sintético {args.seed}-{team_index}", status, plan,
+                20 if plan == "premium" else 5, len(user_ids),
+                created + timedelta(days=14) if status == "trial" else None,
+                created, created,
+            ),
+        )
+
+        for unit, (size, _) in UNITS.items():
+            for _ in range(self.count(args.patients_per_unit * size)):
+                self.patient(loader, team_id, unit, user_ids)
+
+    def patient(self, loader: CopyLoader, team_id, unit: str, user_ids: list) -> None:
+        rng, args = self.rng, self.args
+        patient_id = self.new_id()
+        status = self.weighted(PATIENT_STATUSES)
+        admitted = self.past_day(30 if status != "archived" else self.history_days)
+        created = self.timestamp(admitted)
+        # An affine permutation of the RUT range: unique, but not sequential
+        number = RUT_MIN + (self.patients * RUT_STRIDE + self.rut_offset) % RUT_SPAN
+        rut = f"{number}-{check_digit(str(number))}"
+        self.patients += 1
+        loader.add(
+            "patients",
+            (
+                patient_id, team_id, rut, normalize_rut(rut), self.name(),
+                min(99, max(15, int(rng.gauss(62, 17)))), status, unit,
+                rng.randint(1, UNITS[unit][1]) if status == "active" else None,
+                rng.random() < 0.15, created, created,
+            ),
+        )
+
+        for _ in range(self.count(args.treatments_per_patient)):
+            antibiotic = rng.choice(self.antibiotics)
+            start = admitted + timedelta(days=rng.randrange(10))
+            start = min(start, self.as_of)
+            programmed = rng.choice(PROGRAMMED_DAYS)
+            elapsed = (self.as_of - start).days
+            if status == "archived" or elapsed > programmed:
+                treatment_status = "finished"
+            else:
+                treatment_status = rng.choice(TREATMENT_STATUSES[:3])
+            stamp = self.timestamp(start)
+            loader.add(
+                "treatments",
+                (
+                    self.new_id(), patient_id, antibiotic[0], antibiotic[1], start,
+                    min(elapsed, programmed), programmed, treatment_status,
+                    antibiotic[2], rng.choice(DOSAGES), rng.choice(user_ids), stamp, stamp,
+                ),
+            )
+
+        for _ in range(self.count(args.diagnostics_per_patient)):
+            sub_id, category_id, sub_name, sub_code = rng.choices(
+                self.subcategories, weights=self.subcategory_weights
+            )[0]
+            day = min(admitted + timedelta(days=rng.randrange(5)), self.as_of)
+            stamp = self.timestamp(day)
+            loader.add(
+                "diagnostics",
+                (
+                    self.new_id(), patient_id, category_id, sub_id, sub_name, sub_code,
+                    day, self.weighted(SEVERITIES), None, rng.choice(user_ids), stamp, stamp,
+                ),
+            )
+
+        self.bed_history(loader, patient_id, unit, admitted, status)
+
+    def bed_history(self, loader: CopyLoader, patient_id, unit: str, admitted: date, status: str) -> None:
+        """Stays going back from the current admission across the history window."""
+        rng = self.rng
+        beds = self.beds[unit]
+        end = None if status == "active" else min(self.as_of, admitted + timedelta(days=rng.randint(2, 20)))
+        start = admitted
+        for stay in range(1 + self.count(self.args.previous_stays)):
+            if stay:
+                # Earlier admission, possibly years before
+                end = start - timedelta(days=rng.randint(15, 400))
+                start = end - timedelta(days=rng.randint(1, 25))
+                if (self.as_of - start).days > self.history_days:
+                    break
+            loader.add("bed_history", (self.new_id(), patient_id, rng.choice(beds), start, end, None))
+
+
+def load_catalogs(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, type, default_start_count FROM antibiotics "
+            "WHERE is_active ORDER BY name"
+        )
+        antibiotics = [(escape(n), escape(t), count) for n, t, count in cursor.fetchall()]
+        cursor.execute(
+            "SELECT s.id, s.category_id, s.name, s.code FROM diagnostic_subcategories s "
+            "WHERE s.is_active ORDER BY s.category_id, s.sort_order, s.code"
+        )
+        subcategories = [
+            (str(sub_id), str(category_id), escape(name), escape(code))
+            for sub_id, category_id, name, code in cursor.fetchall()
+        ]
+    if not antibiotics or not subcategories:
+        raise SystemExit(
+            "Seed the catalogs first: python seed_antibiotics.py && "
+            "python seed_diagnostic_categories.py"
+        )
+    return antibiotics, subcategories
+
+
+def ensure_beds(connection, seed: int) -> dict:
+    """Get or create the units and beds used for bed history."""
+    rng = random.Random(f"{seed}:beds")
+    beds = {}
+    with connection.cursor() as cursor:
+        for unit, (_, bed_count) in UNITS.items():
+            cursor.execute("SELECT id FROM units WHERE name = %s", (unit,))
+            row = cursor.fetchone()
+            if row is None:
+                row = (str(uuid.UUID(int=rng.getrandbits(128), version=4)),)
+                cursor.execute("INSERT INTO units (id, name) VALUES (%s, %s)", (row[0], unit))
+            cursor.execute(
+                "SELECT id FROM beds WHERE unit_id = %s ORDER BY bed_number", (row[0],)
+            )
+            unit_beds = [r[0] for r in cursor.fetchall()]
+            for bed_number in range(len(unit_beds) + 1, bed_count + 1):
+                bed_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+                cursor.execute(
+                    "INSERT INTO beds (id, unit_id, bed_number, is_occupied) "
+                    "VALUES (%s, %s, %s, false)",
+                    (bed_id, row[0], bed_number),
+                )
+                unit_beds.append(bed_id)
+            beds[unit] = unit_beds
+    return beds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--teams", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--as-of", type=date.fromisoformat, default=date.today(),
+                        help="Date the data ends at (YYYY-MM-DD); default today")
+    parser.add_argument("--years", type=float, default=3, help="Years of history")
+    parser.add_argument("--members-per-team", type=int, default=5)
+    parser.add_argument("--patients-per-unit", type=float, default=40,
+                        help="Mean patients per unit and team (units are weighted by size)")
+    parser.add_argument("--treatments-per-patient", type=float, default=3)
+    parser.add_argument("--diagnostics-per-patient", type=float, default=2)
+    parser.add_argument("--previous-stays", type=float, default=1.5,
+                        help="Mean earlier admissions per patient in bed history")
+    parser.add_argument("--password", default="synthetic-password")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--batch-rows", type=int, default=200_000, help="Rows buffered per COPY round")
+    parser.add_argument("--progress", type=int, default=100, help="Report every N teams (0 = quiet)")
+    parser.add_argument(
+        "--skip-fk-checks", action="store_true",
+        help="Disable foreign-key triggers while loading (superuser only, ~2x faster)",
+    )
+    parser.add_argument("--no-analyze", action="store_true", help="Skip ANALYZE after loading")
+    args = parser.parse_args()
+
+    connection = engine.raw_connection()
+    try:
+        if args.skip_fk_checks:
+            # Generated rows reference each other consistently by construction
+            with connection.cursor() as cursor:
+                cursor.execute("SET session_replication_role = replica")
+        antibiotics, subcategories = load_catalogs(connection)
+        beds = ensure_beds(connection, args.seed)
+        generator = Generator(args, antibiotics, subcategories, beds)
+        loader = CopyLoader(connection, args.batch_rows)
+
+        print(f"Generating {args.teams} teams (seed {args.seed}, as of {args.as_of})...")
+        started = time.perf_counter()
+        generator.generate(loader)
+        connection.commit()
+        elapsed = time.perf_counter() - started
+
+        if not args.no_analyze:
+            with connection.cursor() as cursor:
+                for table in TABLES:
+                    cursor.execute(f"ANALYZE {table}")
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    total = sum(loader.counts.values())
+    for table, rows in loader.counts.items():
+        print(f"  {table:<12} {rows:>12,}")
+    print(f"✓ Loaded {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
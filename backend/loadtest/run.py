@@ -0,0 +1,329 @@
+"""
+Load test for the BioTrack API.
+
+Creates a fixture of teams (one owner login per team, patients, a unit with
+beds) through the public API, then drives a closed-loop traffic mix
+(see ``scenarios.py``) at each requested concurrency and reports throughput,
+p50/p95/p99 latency and error rate per scenario and endpoint.
+
+The driver needs httpx (``pip install -r loadtest/requirements.txt``).
+Against a server you started yourself:
+
+    python loadtest/run.py --base-url http://127.0.0.1:8000 --concurrency 10,50
+
+Or let the driver start uvicorn for each worker count (needs DATABASE_URL and
+SECRET_KEY in the environment, pointing at a migrated database):
+
+    python loadtest/run.py --start-server --workers 1,4 --concurrency 10,50,100 \\
+        --duration 60 --output results.json
+
+Runs are reproducible: the traffic of every virtual user comes from a random
+generator derived from ``--seed``. Run against a disposable database; the
+fixture is left in place so repeated runs can reuse it with ``--fixture``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from scenarios import (
+    API,
+    DEFAULT_WEIGHTS,
+    FALLBACK_ANTIBIOTICS,
+    Fixture,
+    FixtureUser,
+    VirtualUser,
+)
+from stats import Recorder
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+PASSWORD = "loadtest-password"
+UNITS = ["UCI", "UTI", "Medicina", "Cirugía"]
+
+
+def rut_check_digit(number: int) -> str:
+    total, factor = 0, 2
+    for digit in reversed(str(number)):
+        total += int(digit) * factor
+        factor = 2 if factor == 7 else factor + 1
+    remainder = 11 - total % 11
+    return {11: "0", 10: "K"}.get(remainder, str(remainder))
+
+
+def format_rut(number: int) -> str:
+    return f"{number}-{rut_check_digit(number)}"
+
+
+def expect(response: httpx.Response, *codes: int) -> dict:
+    if response.status_code not in codes:
+        raise SystemExit(
+            f"Fixture setup failed: {response.request.method} {response.request.url} "
+            f"-> {response.status_code} {response.text[:200]}"
+        )
+    return response.json()
+
+
+async def build_fixture(client: httpx.AsyncClient, args) -> Fixture:
+    """Create teams, owners, patients and beds through the API."""
+    run_tag = args.run_tag or datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    rng = random.Random(args.seed)
+    # RUTs are unique per database, so they also depend on the run tag
+    rut_numbers = random.Random(f"{args.seed}:{run_tag}").sample(
+        range(5_000_000, 30_000_000), args.teams * args.patients_per_team
+    )
+
+    unit = expect(
+        await client.post(f"{API}/units", json={"name": f"Load test {run_tag}"}), 200
+    )
+    for bed_number in range(1, args.beds + 1):
+        expect(
+            await client.post(
+                f"{API}/beds", json={"bed_number": bed_number, "unit_id": unit["id"]}
+            ),
+            200,
+        )
+
+    users = []
+    for team_index in range(args.teams):
+        email = f"loadtest+{run_tag}-{team_index}@biotrack.app"
+        registered = expect(
+            await client.post(
+                f"{API}/auth/register",
+                json={"name": f"Load Test {team_index}", "email": email, "password": PASSWORD},
+            ),
+            201,
+        )
+        headers = {"Authorization": f"Bearer {registered['access_token']}"}
+        expect(
+            await client.post(
+                f"{API}/teams/", json={"name": f"Load test {run_tag} #{team_index}"}, headers=headers
+            ),
+            201,
+        )
+        user = FixtureUser(email=email, password=PASSWORD, token=registered["access_token"])
+        for i in range(args.patients_per_team):
+            patient = expect(
+                await client.post(
+                    f"{API}/patients",
+                    json={
+                        "rut": format_rut(rut_numbers[team_index * args.patients_per_team + i]),
+                        "name": f"Paciente {team_index}-{i}",
+                        "age": rng.randint(18, 95),
+                        "status": "active",
+                        "unit": rng.choice(UNITS),
+                        "bed_number": rng.randint(1, args.beds),
+                    },
+                    headers=headers,
+                ),
+                200,
+            )
+            user.patient_ids.append(patient["id"])
+        users.append(user)
+
+    antibiotics = expect(await client.get(f"{API}/antibiotics", headers=headers), 200)
+    return Fixture(users=users, antibiotics=antibiotics or FALLBACK_ANTIBIOTICS)
+
+
+async def refresh_tokens(client: httpx.AsyncClient, fixture: Fixture) -> None:
+    for user in fixture.users:
+        response = await client.post(
+            f"{API}/auth/login", json={"email": user.email, "password": user.password}
+        )
+        user.token = expect(response, 200)["access_token"]
+
+
+async def run_load(client: httpx.AsyncClient, fixture: Fixture, concurrency: int, args) -> dict:
+    recorder = Recorder()
+    stop = asyncio.Event()
+    weights = dict(DEFAULT_WEIGHTS, **parse_weights(args.weights))
+    virtual_users = [
+        VirtualUser(
+            client,
+            fixture.users[i % len(fixture.users)],
+            fixture,
+            recorder,
+            random.Random(f"{args.seed}:{concurrency}:{i}"),
+            args.think_time,
+            args.burst_size,
+        )
+        for i in range(concurrency)
+    ]
+    tasks = [asyncio.create_task(vu.run(weights, stop)) for vu in virtual_users]
+    await asyncio.sleep(args.warmup)
+    recorder.recording = True
+    start = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return recorder.summary(elapsed)
+
+
+def parse_weights(value: str) -> dict:
+    weights = {}
+    for item in filter(None, (value or "").split(",")):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_WEIGHTS:
+            raise SystemExit(f"Unknown scenario {name!r}; expected one of {sorted(DEFAULT_WEIGHTS)}")
+        weights[name] = int(weight)
+    return weights
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    # Registration sends verification emails; never reach SendGrid from a load test
+    env.pop("SENDGRID_API_KEY", None)
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--no-access-log", "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def wait_until_healthy(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{API}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"Server at {base_url} did not become healthy within {timeout:.0f}s")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_run(run: dict) -> None:
+    print(
+        f"\nworkers={run['workers']} concurrency={run['concurrency']} "
+        f"elapsed={run['elapsed_s']:.1f}s "
+        f"requests/s={run['overall_requests']['throughput_per_s']:.1f} "
+        f"errors={run['overall_requests']['error_rate']:.2%}"
+    )
+    header = f"  {'scenario / endpoint':<38} {'count':>7} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    print(header)
+    for name, scenario in run["scenarios"].items():
+        rows = [(name, scenario)] + [(f"  {e}", s) for e, s in scenario["requests"].items()]
+        for label, s in rows:
+            print(
+                f"  {label:<38} {s['count']:>7} {s['throughput_per_s']:>8.1f} "
+                f"{s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['error_rate']:>7.2%}"
+            )
+
+
+async def main_async(args) -> dict:
+    concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    if not args.start_server and len(worker_counts) > 1:
+        raise SystemExit("Several --workers values need --start-server")
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "runs": [],
+    }
+    fixture = None
+    if args.fixture and Path(args.fixture).exists():
+        data = json.loads(Path(args.fixture).read_text())
+        fixture = Fixture(users=[FixtureUser(**u) for u in data["users"]], antibiotics=data["antibiotics"])
+
+    for workers in worker_counts:
+        server = None
+        base_url = args.base_url
+        if args.start_server:
+            base_url = f"http://127.0.0.1:{free_port()}"
+            server = start_server(workers, int(base_url.rsplit(":", 1)[1]))
+        try:
+            await wait_until_healthy(base_url)
+            limits = httpx.Limits(
+                max_connections=max(concurrency_levels) * max(args.burst_size, 4),
+                max_keepalive_connections=max(concurrency_levels) * 4,
+            )
+            async with httpx.AsyncClient(
+                base_url=base_url, timeout=args.timeout, limits=limits
+            ) as client:
+                if fixture is None:
+                    fixture = await build_fixture(client, args)
+                    if args.fixture:
+                        Path(args.fixture).write_text(json.dumps(asdict(fixture), indent=2))
+                else:
+                    await refresh_tokens(client, fixture)
+                for concurrency in concurrency_levels:
+                    summary = await run_load(client, fixture, concurrency, args)
+                    run = {"workers": workers, "concurrency": concurrency, **summary}
+                    results["runs"].append(run)
+                    print_run(run)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--start-server", action="store_true", help="Start uvicorn for each --workers value")
+    parser.add_argument("--workers", default="1", help="Comma-separated uvicorn worker counts")
+    parser.add_argument("--concurrency", default="10", help="Comma-separated virtual user counts")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before each run")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean pause between scenarios, seconds")
+    parser.add_argument("--burst-size", type=int, default=5, help="Treatments created per burst")
+    parser.add_argument("--weights", default="", help="Scenario weights, e.g. ward_board=20,login=0")
+    parser.add_argument("--teams", type=int, default=5)
+    parser.add_argument("--patients-per-team", type=int, default=30)
+    parser.add_argument("--beds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--run-tag", default=None, help="Suffix for fixture emails and names")
+    parser.add_argument("--fixture", default=None, help="JSON file to save the fixture to, or reuse it from")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", default=None, help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
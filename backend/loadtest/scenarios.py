@@ -0,0 +1,166 @@
+"""
+Traffic model for the load test.
+
+Each virtual user is a clinician of one of the fixture teams. It loops over
+scenarios picked by weight, pausing for a think time between them:
+
+* ``login``           - POST /auth/login (bcrypt verification)
+* ``ward_board``      - the ward board poll: patients and beds fetched together
+* ``patient_detail``  - opening a patient: the patient, its treatments,
+                        diagnostics and bed history fetched together
+* ``treatment_burst`` - a round of several treatments created at once
+* ``catalog``         - antibiotics and diagnostic categories/subcategories
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List
+
+import httpx
+
+from stats import Recorder
+
+API = "/api/v1"
+
+DEFAULT_WEIGHTS = {
+    "login": 1,
+    "ward_board": 10,
+    "patient_detail": 5,
+    "treatment_burst": 1,
+    "catalog": 2,
+}
+
+FALLBACK_ANTIBIOTICS = [
+    {"name": "Ceftriaxona", "type": "antibiotic", "default_start_count": 0},
+    {"name": "Vancomicina", "type": "antibiotic", "default_start_count": 1},
+    {"name": "Fluconazol", "type": "antifungal", "default_start_count": 0},
+]
+
+
+@dataclass
+class FixtureUser:
+    email: str
+    password: str
+    token: str
+    patient_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Fixture:
+    users: List[FixtureUser]
+    antibiotics: List[dict]
+
+
+class VirtualUser:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        user: FixtureUser,
+        fixture: Fixture,
+        recorder: Recorder,
+        rng: random.Random,
+        think_time: float,
+        burst_size: int,
+    ):
+        self.client = client
+        self.user = user
+        self.fixture = fixture
+        self.recorder = recorder
+        self.rng = rng
+        self.think_time = think_time
+        self.burst_size = burst_size
+        self.headers = {"Authorization": f"Bearer {user.token}"}
+
+    async def call(self, scenario: str, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        status = None
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            ok = status is not None and status < 400
+            self.recorder.request(scenario, endpoint, time.perf_counter() - start, status, ok)
+
+    async def login(self) -> bool:
+        response = await self.call(
+            "login",
+            "POST /auth/login",
+            "POST",
+            f"{API}/auth/login",
+            json={"email": self.user.email, "password": self.user.password},
+        )
+        if response.status_code != 200:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return True
+
+    async def ward_board(self) -> bool:
+        responses = await asyncio.gather(
+            self.call("ward_board", "GET /patients", "GET", f"{API}/patients", headers=self.headers),
+            self.call("ward_board", "GET /beds", "GET", f"{API}/beds", headers=self.headers),
+        )
+        return all(r.status_code == 200 for r in responses)
+
+    async def patient_detail(self) -> bool:
+        patient_id = self.rng.choice(self.user.patient_ids)
+        params = {"patient_id": patient_id}
+        name = "patient_detail"
+        responses = await asyncio.gather(
+            self.call(name, "GET /patients/{id}", "GET", f"{API}/patients/{patient_id}", headers=self.headers),
+            self.call(name, "GET /treatments", "GET", f"{API}/treatments", params=params, headers=self.headers),
+            self.call(name, "GET /diagnostics", "GET", f"{API}/diagnostics", params=params, headers=self.headers),
+            self.call(name, "GET /bed-history", "GET", f"{API}/bed-history", params=params, headers=self.headers),
+        )
+        return all(r.status_code == 200 for r in responses)
+
+    async def treatment_burst(self) -> bool:
+        async def create():
+            antibiotic = self.rng.choice(self.fixture.antibiotics)
+            payload = {
+                "patient_id": self.rng.choice(self.user.patient_ids),
+                "antibiotic_name": antibiotic["name"],
+                "antibiotic_type": antibiotic["type"],
+                "start_date": date.today().isoformat(),
+                "programmed_days": self.rng.choice([5, 7, 10, 14]),
+                "status": "active",
+                "start_count": antibiotic.get("default_start_count", 0),
+            }
+            return await self.call(
+                "treatment_burst", "POST /treatments", "POST", f"{API}/treatments",
+                json=payload, headers=self.headers,
+            )
+
+        responses = await asyncio.gather(*(create() for _ in range(self.burst_size)))
+        return all(r.status_code == 200 for r in responses)
+
+    async def catalog(self) -> bool:
+        name = "catalog"
+        responses = await asyncio.gather(
+            self.call(name, "GET /antibiotics", "GET", f"{API}/antibiotics", headers=self.headers),
+            self.call(name, "GET /diagnostic-categories", "GET", f"{API}/diagnostic-categories", headers=self.headers),
+            self.call(name, "GET /diagnostic-subcategories", "GET", f"{API}/diagnostic-subcategories", headers=self.headers),
+        )
+        return all(r.status_code == 200 for r in responses)
+
+    async def run(self, weights: Dict[str, int], stop: asyncio.Event) -> None:
+        names = [name for name, weight in weights.items() if weight > 0]
+        scenario_weights = [weights[name] for name in names]
+        while not stop.is_set():
+            scenario = self.rng.choices(names, weights=scenario_weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = await getattr(self, scenario)()
+            except httpx.HTTPError:
+                ok = False
+            self.recorder.iteration(scenario, time.perf_counter() - start, ok)
+            if self.think_time:
+                # Exponential think time keeps virtual users from moving in lockstep
+                delay = self.rng.expovariate(1 / self.think_time)
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
@@ -0,0 +1,79 @@
+"""
+Latency and error bookkeeping for the load-test driver.
+
+Every HTTP request is recorded under its scenario and endpoint name; every
+completed scenario iteration is recorded under the scenario. Samples taken
+during the warm-up window are discarded.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (q in 0..100)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class Series:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    status_codes: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, seconds: float, status: Optional[int], ok: bool) -> None:
+        self.latencies.append(seconds)
+        if not ok:
+            self.errors += 1
+        key = str(status) if status is not None else "exception"
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        values = sorted(self.latencies)
+        count = len(values)
+        return {
+            "count": count,
+            "throughput_per_s": count / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": (values[-1] if values else 0.0) * 1000,
+            "error_rate": self.errors / count if count else 0.0,
+            "status_codes": dict(sorted(self.status_codes.items())),
+        }
+
+
+class Recorder:
+    def __init__(self):
+        self.recording = False
+        self.iterations: Dict[str, Series] = {}
+        self.requests: Dict[tuple, Series] = {}
+
+    def request(self, scenario: str, endpoint: str, seconds: float, status, ok: bool) -> None:
+        if self.recording:
+            self.requests.setdefault((scenario, endpoint), Series()).add(seconds, status, ok)
+
+    def iteration(self, scenario: str, seconds: float, ok: bool) -> None:
+        if self.recording:
+            self.iterations.setdefault(scenario, Series()).add(seconds, 200 if ok else None, ok)
+
+    def summary(self, elapsed: float) -> dict:
+        scenarios = {}
+        for name, series in sorted(self.iterations.items()):
+            scenarios[name] = series.summary(elapsed)
+            scenarios[name]["requests"] = {
+                endpoint: self.requests[(scenario, endpoint)].summary(elapsed)
+                for scenario, endpoint in sorted(self.requests)
+                if scenario == name
+            }
+        total = Series()
+        for series in self.requests.values():
+            total.latencies.extend(series.latencies)
+            total.errors += series.errors
+        overall = total.summary(elapsed)
+        del overall["status_codes"]
+        return {"elapsed_s": elapsed, "overall_requests": overall, "scenarios": scenarios}
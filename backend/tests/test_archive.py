@@ -0,0 +1,105 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.models import ArchiveFile, Diagnostic, Patient, Treatment
+from app.services import archive
+from app.services.archive import ArchiveSettings, ArchiveWorker
+from tests.conftest import TestingSessionLocal
+
+pytest.importorskip("pyarrow")
+
+LONG_AGO = datetime.utcnow() - timedelta(days=200)
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def make_worker():
+    return ArchiveWorker(
+        session_factory=TestingSessionLocal,
+        settings=ArchiveSettings(after_days=90, batch_size=2, batch_pause=0),
+    )
+
+
+@pytest.fixture
+def closed_records(db_session, test_team):
+    """An archived patient with records and a finished treatment of a patient in care."""
+    archived = Patient(
+        team_id=test_team.id, rut="11111111-1", name="Archived", status="archived",
+        unit="UCI", updated_at=LONG_AGO,
+    )
+    active = Patient(team_id=test_team.id, rut="22222222-2", name="Active", status="active", unit="UCI")
+    db_session.add_all([
+        archived,
+        active,
+        Diagnostic(patient=archived, diagnosis_name="Neumonia", updated_at=LONG_AGO),
+        Treatment(
+            patient=archived, antibiotic_name="Meropenem", antibiotic_type="antibiotic",
+            status="finished", start_date=date(2026, 1, 10), updated_at=LONG_AGO,
+        ),
+        Treatment(
+            patient=active, antibiotic_name="Vancomicina", antibiotic_type="antibiotic",
+            status="finished", start_date=date(2026, 2, 3), updated_at=LONG_AGO,
+        ),
+        Treatment(patient=active, antibiotic_name="Cefazolina", antibiotic_type="antibiotic", status="active"),
+    ])
+    db_session.commit()
+    return {"archived": archived.id, "active": active.id}
+
+
+class TestArchive:
+    def test_moves_closed_records_to_parquet(self, db_session, test_team, closed_records, archive_dir):
+        assert asyncio.run(make_worker().archive()) == 2
+
+        db_session.expire_all()
+        assert [p.name for p in db_session.query(Patient)] == ["Active"]
+        assert [t.antibiotic_name for t in db_session.query(Treatment)] == ["Cefazolina"]
+        assert db_session.query(Diagnostic).count() == 0
+        files = db_session.query(ArchiveFile).all()
+        assert sorted(f.table_name for f in files) == ["diagnostics", "patients", "treatments", "treatments"]
+        assert {f.month for f in files if f.table_name == "treatments"} == {
+            date(LONG_AGO.year, LONG_AGO.month, 1), date(2026, 2, 1),
+        }
+        assert all((archive_dir / f.path).exists() for f in files)
+        assert all(f.path.startswith(str(test_team.id)) for f in files)
+
+    def test_detail_and_export_read_through(self, client, db_session, closed_records, auth_headers):
+        asyncio.run(make_worker().archive())
+        patient_id = closed_records["archived"]
+
+        assert client.get(f"/api/v1/patients/{patient_id}", headers=auth_headers).status_code == 404
+        response = client.get(f"/api/v1/patients/{patient_id}?include_archived=true", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["name"] == "Archived"
+        for path in ("patients", "treatments"):
+            malformed = client.get(f"/api/v1/{path}/not-a-uuid?include_archived=true", headers=auth_headers)
+            assert malformed.status_code == 422
+
+        export = client.get(f"/api/v1/patients/{closed_records['active']}/export", headers=auth_headers).json()
+        assert sorted(t["antibiotic_name"] for t in export["treatments"]) == ["Cefazolina", "Vancomicina"]
+        export = client.get(f"/api/v1/patients/{patient_id}/export", headers=auth_headers).json()
+        assert export["patient"]["rut"] == "11111111-1"
+        assert [d["diagnosis_name"] for d in export["diagnostics"]] == ["Neumonia"]
+
+    def test_failed_move_leaves_no_files(self, db_session, closed_records, archive_dir, monkeypatch):
+        write_file = archive.write_file
+        calls = []
+
+        def write_then_fail(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("disk full")
+            return write_file(*args)
+
+        monkeypatch.setattr(archive, "write_file", write_then_fail)
+        with pytest.raises(RuntimeError):
+            make_worker()._archive_patients(datetime.utcnow() - timedelta(days=90))
+
+        db_session.expire_all()
+        assert db_session.query(Patient).count() == 2
+        assert list(archive_dir.rglob("*.parquet")) == []
@@ -0,0 +1,142 @@
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.middleware.compression import (
+    CompressionMiddleware,
+    CompressionPolicy,
+    NO_COMPRESSION,
+    available_encoders,
+    negotiate_encoding,
+)
+
+LARGE = "x" * 5000
+
+
+def build_app():
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=1024,
+        policies={
+            "/health": NO_COMPRESSION,
+            "/export": CompressionPolicy(minimum_size=10),
+        },
+    )
+
+    @app.get("/large")
+    def large():
+        return {"data": LARGE}
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/health")
+    def health():
+        return {"data": LARGE}
+
+    @app.get("/image")
+    def image():
+        return PlainTextResponse(LARGE, media_type="image/png")
+
+    @app.get("/export")
+    def export():
+        def rows():
+            for i in range(100):
+                yield f"{i},{LARGE[:50]}\n"
+
+        return StreamingResponse(rows(), media_type="text/csv")
+
+    @app.get("/export/short")
+    def export_short():
+        return PlainTextResponse("a" * 20)
+
+    return app
+
+
+@pytest.fixture
+def compression_client():
+    return TestClient(build_app())
+
+
+class TestNegotiation:
+    def test_prefers_highest_q(self):
+        assert negotiate_encoding("gzip;q=1.0, br;q=0.5", {"gzip": 1, "br": 1}) == "gzip"
+
+    def test_server_preference_on_tie(self):
+        assert negotiate_encoding("gzip, br", {"gzip": 1, "br": 1}) == "br"
+
+    def test_skips_unavailable(self):
+        assert negotiate_encoding("br, zstd", {"gzip": 1}) is None
+
+    def test_q_zero_disables(self):
+        assert negotiate_encoding("gzip;q=0", {"gzip": 1}) is None
+
+    def test_wildcard(self):
+        assert negotiate_encoding("*", {"gzip": 1}) == "gzip"
+
+    def test_empty_header(self):
+        assert negotiate_encoding("", available_encoders()) is None
+
+
+class TestCompressionMiddleware:
+    def test_large_json_is_gzipped(self, compression_client):
+        response = compression_client.get("/large", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == {"data": LARGE}
+        assert int(response.headers["content-length"]) < len(LARGE)
+
+    def test_no_accept_encoding_is_identity(self, compression_client):
+        response = compression_client.get("/large", headers={"Accept-Encoding": ""})
+        assert "content-encoding" not in response.headers
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == {"data": LARGE}
+
+    def test_small_response_is_not_compressed(self, compression_client):
+        response = compression_client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        # It would have been compressed had it been larger
+        assert "Accept-Encoding" in response.headers["vary"]
+
+    def test_route_policy_disables_compression(self, compression_client):
+        response = compression_client.get("/health", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    def test_route_policy_lowers_threshold(self, compression_client):
+        response = compression_client.get(
+            "/export/short", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers["content-encoding"] == "gzip"
+
+    def test_binary_media_type_is_not_compressed(self, compression_client):
+        response = compression_client.get("/image", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert "vary" not in response.headers
+
+    def test_streaming_response_is_compressed_incrementally(self, compression_client):
+        chunks = []
+        with compression_client.stream(
+            "GET", "/export", headers={"Accept-Encoding": "gzip"}
+        ) as response:
+            assert response.headers["content-encoding"] == "gzip"
+            assert "content-length" not in response.headers
+            chunks = list(response.iter_raw())
+
+        # Every chunk is sync-flushed, so a prefix decodes on its own
+        partial = zlib.decompressobj(31).decompress(b"".join(chunks[:2]))
+        assert partial.startswith(b"0,")
+        body = gzip.decompress(b"".join(chunks)).decode()
+        assert body.count("\n") == 100
+
+    @pytest.mark.parametrize("encoding", sorted(set(available_encoders()) - {"gzip"}))
+    def test_optional_encodings(self, compression_client, encoding):
+        response = compression_client.get(
+            "/large", headers={"Accept-Encoding": encoding}
+        )
+        assert response.headers["content-encoding"] == encoding
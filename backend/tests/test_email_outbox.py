@@ -0,0 +1,99 @@
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+
+from app.models import EmailOutbox
+from app.services.email import queue_invitation_email
+from app.services.email_outbox import EmailOutboxWorker, OutboxSettings
+from tests.conftest import TestingSessionLocal
+
+
+def drain(handler, **settings):
+    worker = EmailOutboxWorker(
+        session_factory=TestingSessionLocal,
+        api_key="SG.test",
+        settings=OutboxSettings(**settings),
+        transport=httpx.MockTransport(handler),
+    )
+
+    async def run():
+        async with worker:
+            return await worker.drain_once()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def queued_invitations(db_session):
+    for i in range(3):
+        queue_invitation_email(
+            db_session, f"user{i}@example.com", "ICU Team", "Dr. House", f"token-{i}"
+        )
+    db_session.commit()
+    return db_session
+
+
+class TestEmailOutbox:
+    def test_register_queues_verification_email(self, client, db_session):
+        response = client.post(
+            "/api/v1/auth/register",
+            json={"name": "New User", "email": "new@example.com", "password": "TestPassword123"},
+        )
+        assert response.status_code == 201
+
+        email = db_session.query(EmailOutbox).one()
+        assert email.template == "verification"
+        assert email.to_email == "new@example.com"
+        assert email.status == "pending"
+        assert "verification_link" in email.substitutions
+
+    def test_batches_recipients_into_one_request(self, queued_invitations):
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return httpx.Response(202)
+
+        assert drain(handler) == 3
+
+        assert len(requests) == 1
+        personalizations = requests[0]["personalizations"]
+        assert [p["to"][0]["email"] for p in personalizations] == [
+            "user0@example.com", "user1@example.com", "user2@example.com"
+        ]
+        assert personalizations[1]["substitutions"]["-invitation_link-"].endswith("token-1")
+        assert "-invited_by-" in requests[0]["subject"]
+
+        queued_invitations.expire_all()
+        emails = queued_invitations.query(EmailOutbox).all()
+        assert {e.status for e in emails} == {"sent"}
+        assert all(e.sent_at is not None for e in emails)
+
+    def test_server_error_schedules_retry(self, queued_invitations):
+        assert drain(lambda request: httpx.Response(503)) == 3
+
+        queued_invitations.expire_all()
+        for email in queued_invitations.query(EmailOutbox).all():
+            assert email.status == "pending"
+            assert email.attempts == 1
+            assert email.next_attempt_at > datetime.utcnow()
+        # Not due yet, so nothing is claimed
+        assert drain(lambda request: httpx.Response(202)) == 0
+
+    def test_gives_up_after_max_attempts(self, queued_invitations):
+        drain(lambda request: httpx.Response(429), max_attempts=1)
+
+        queued_invitations.expire_all()
+        assert {e.status for e in queued_invitations.query(EmailOutbox).all()} == {"failed"}
+
+    def test_client_error_fails_without_retry(self, queued_invitations):
+        drain(lambda request: httpx.Response(400, json={"errors": [{"message": "bad"}]}))
+
+        queued_invitations.expire_all()
+        for email in queued_invitations.query(EmailOutbox).all():
+            assert email.status == "failed"
+            assert email.attempts == 1
+            assert "400" in email.last_error
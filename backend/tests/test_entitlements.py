@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.database import engine
+from app.services import entitlements
+from tests.conftest import TestingSessionLocal
+
+PATIENT = {"rut": "12345678-5", "name": "Test Patient", "status": "active", "unit": "UCI"}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    entitlements.clear()
+    yield
+    entitlements.clear()
+
+
+@pytest.fixture
+def team_queries():
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if "FROM teams" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count)
+
+
+class TestEntitlements:
+    def test_lapsed_trial_can_read_but_not_write(self, client, db_session, test_team, auth_headers):
+        test_team.subscription_status = "trial"
+        test_team.trial_ends_at = datetime.utcnow() - timedelta(days=1)
+        db_session.commit()
+
+        assert client.get("/api/v1/patients", headers=auth_headers).status_code == 200
+
+        response = client.post("/api/v1/patients", json=PATIENT, headers=auth_headers)
+        assert response.status_code == 402
+        assert "Trial has ended" in response.json()["detail"]
+
+    def test_every_team_scoped_router_is_enforced(self, client, db_session, test_team, auth_headers):
+        test_team.subscription_status = "expired"
+        db_session.commit()
+
+        assert client.get("/api/v1/antibiotics", headers=auth_headers).status_code == 200
+        antibiotic = {"name": "Vancomicina", "type": "antibiotic"}
+        response = client.post("/api/v1/antibiotics", json=antibiotic, headers=auth_headers)
+        assert response.status_code == 402
+        # Shared, public routers stay open
+        assert client.post("/api/v1/units", json={"name": "UCI"}).status_code == 200
+
+    def test_active_team_can_write(self, client, test_team, auth_headers):
+        response = client.post("/api/v1/patients", json=PATIENT, headers=auth_headers)
+        assert response.status_code == 200
+
+    def test_snapshot_is_cached_between_requests(self, client, test_team, auth_headers, team_queries):
+        client.get("/api/v1/patients", headers=auth_headers)
+        client.get("/api/v1/patients", headers=auth_headers)
+
+        assert len(team_queries) == 1
+
+    def test_committed_team_change_invalidates(self, db_session, test_team):
+        assert entitlements.get_entitlements(db_session, test_team.id).is_active()
+
+        other = TestingSessionLocal()
+        team = other.get(type(test_team), test_team.id)
+        team.subscription_status = "cancelled"
+        other.flush()
+        other.rollback()
+        assert entitlements.get_entitlements(db_session, test_team.id).is_active()
+
+        team = other.get(type(test_team), test_team.id)
+        team.subscription_status = "cancelled"
+        other.commit()
+        other.close()
+        db_session.expire_all()
+        assert not entitlements.get_entitlements(db_session, test_team.id).is_active()
@@ -0,0 +1,112 @@
+import asyncio
+import uuid
+from datetime import date
+
+from app.models import Bed, Change, Diagnostic, Patient, Team, Unit
+from app.services.events import ChangeHub, EventSettings, EventStream
+from tests.conftest import TestingSessionLocal
+
+
+def make_hub(**settings):
+    return ChangeHub(session_factory=TestingSessionLocal, settings=EventSettings(**settings))
+
+
+def add_patient(db_session, team_id, name):
+    patient = Patient(team_id=team_id, rut=f"{uuid.uuid4().int % 10**8}-1", name=name, status="active", unit="UCI")
+    db_session.add(patient)
+    db_session.commit()
+    return patient
+
+
+def tables(subscriber):
+    return [event.split(b'"table":"')[1].split(b'"')[0].decode() for _, event in subscriber.events]
+
+
+async def stream(response, until):
+    """Run a stream until ``until(body)`` holds, then disconnect; return the body."""
+    body = bytearray()
+    left = asyncio.Event()
+
+    async def receive():
+        await left.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        body.extend(message.get("body", b""))
+        if until(bytes(body)):
+            left.set()
+
+    await asyncio.wait_for(response({"type": "http"}, receive, send), timeout=5)
+    return bytes(body)
+
+
+def test_hub_fans_out_by_team(db_session, test_team):
+    other = Team(id=uuid.uuid4(), name="Other", subscription_status="active")
+    db_session.add(other)
+    db_session.commit()
+    hub = make_hub()
+
+    async def scenario():
+        await hub.dispatch()
+        mine, theirs = hub.subscribe(test_team.id), hub.subscribe(other.id)
+        patient = add_patient(db_session, test_team.id, "Mine")
+        add_patient(db_session, other.id, "Theirs")
+        unit = Unit(name="UCI")
+        db_session.add(unit)
+        db_session.flush()
+        db_session.add_all([
+            Bed(unit_id=unit.id, bed_number=1),
+            Diagnostic(patient_id=patient.id, diagnosis_name="Neumonia", date_diagnosed=date.today()),
+        ])
+        db_session.commit()
+        await hub.dispatch()
+        return mine, theirs
+
+    mine, theirs = asyncio.run(scenario())
+    # Beds are shared; diagnostics are not streamed
+    assert tables(mine) == ["patients", "beds"]
+    assert tables(theirs) == ["patients", "beds"]
+    assert hub.position == db_session.query(Change.seq).order_by(Change.seq.desc()).first()[0]
+
+
+def test_stream_resumes_without_duplicates(db_session, test_team):
+    hub = make_hub(heartbeat=0.05)
+    add_patient(db_session, test_team.id, "First")
+    add_patient(db_session, test_team.id, "Second")
+    seqs = [seq for (seq,) in db_session.query(Change.seq).order_by(Change.seq)]
+
+    async def scenario():
+        hub.position = seqs[0]
+        subscriber = hub.subscribe(test_team.id)
+        # Resuming after the first change: the backlog has the second, and so
+        # does the live read that follows
+        backlog = hub.backlog(test_team.id, seqs[0])
+        add_patient(db_session, test_team.id, "Third")
+        await hub.dispatch()
+        body = await stream(EventStream(hub, subscriber, backlog), lambda body: b": ping" in body)
+        return subscriber, body
+
+    subscriber, body = asyncio.run(scenario())
+    ids = [int(line[4:]) for line in body.split(b"\n") if line.startswith(b"id: ")]
+    assert ids == [seqs[1], seqs[1] + 1]
+    assert b": ping" in body
+    assert hub.subscriber_count() == 0
+
+
+def test_slow_or_far_behind_clients_are_reset(db_session, test_team):
+    hub = make_hub(queue_size=1, backlog_limit=1)
+    add_patient(db_session, test_team.id, "First")
+    add_patient(db_session, test_team.id, "Second")
+
+    async def scenario():
+        assert hub.backlog(test_team.id, 0) is None
+        behind = await stream(EventStream(hub, hub.subscribe(test_team.id), None), lambda body: False)
+        slow = hub.subscribe(test_team.id)
+        hub.publish(1, test_team.id, b"id: 1\n\n")
+        hub.publish(2, test_team.id, b"id: 2\n\n")
+        lagging = await stream(EventStream(hub, slow, []), lambda body: False)
+        return behind, lagging
+
+    behind, lagging = asyncio.run(scenario())
+    assert behind.endswith(b"event: reset\ndata: {}\n\n")
+    assert lagging == b"id: 1\n\nevent: reset\ndata: {}\n\n"
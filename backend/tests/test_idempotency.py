@@ -0,0 +1,70 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from app.models import IdempotencyKey, Patient, Treatment
+from app.services.idempotency import IdempotencySweeper, IdempotencySweeperSettings
+from tests.conftest import TestingSessionLocal
+
+PATIENT = {"rut": "12.345.678-5", "name": "Ana Soto", "status": "active", "unit": "UCI"}
+
+
+def post(client, auth_headers, path, json, key):
+    return client.post(path, json=json, headers={**auth_headers, "Idempotency-Key": key})
+
+
+def test_retry_replays_the_stored_response(client, auth_headers, db_session):
+    first = post(client, auth_headers, "/api/v1/patients", PATIENT, "key-1")
+    retry = post(client, auth_headers, "/api/v1/patients", PATIENT, "key-1")
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert db_session.query(Patient).count() == 1
+
+
+def test_key_reused_for_another_request_is_rejected(client, auth_headers, db_session):
+    post(client, auth_headers, "/api/v1/patients", PATIENT, "key-1")
+    response = post(client, auth_headers, "/api/v1/patients", {**PATIENT, "name": "Otra"}, "key-1")
+    assert response.status_code == 422
+    assert db_session.query(Patient).one().name == "Ana Soto"
+
+
+def test_failed_requests_can_be_retried(client, auth_headers, db_session, test_team):
+    patient = Patient(team_id=test_team.id, **PATIENT)
+    treatment = {
+        "patient_id": "00000000-0000-0000-0000-000000000000",
+        "antibiotic_name": "Vancomicina",
+        "antibiotic_type": "antibiotic",
+        "start_date": str(date.today()),
+        "status": "active",
+    }
+    missing = post(client, auth_headers, "/api/v1/treatments", treatment, "key-2")
+    assert missing.status_code == 404
+    assert db_session.query(IdempotencyKey).count() == 0
+
+    db_session.add(patient)
+    db_session.commit()
+    treatment["patient_id"] = str(patient.id)
+    created = post(client, auth_headers, "/api/v1/treatments", treatment, "key-2")
+    replayed = post(client, auth_headers, "/api/v1/treatments", treatment, "key-2")
+    assert created.status_code == 200
+    assert "Idempotent-Replayed" not in created.headers
+    assert replayed.json() == created.json()
+    assert db_session.query(Treatment).count() == 1
+
+
+def test_sweeper_deletes_expired_keys(db_session, test_user):
+    now = datetime.utcnow()
+    db_session.add_all([
+        IdempotencyKey(
+            user_id=test_user.id, key=f"key-{hours}", request_hash="0" * 64, status_code=200,
+            response_body="{}", expires_at=now + timedelta(hours=hours),
+        )
+        for hours in (-2, -1, 1)
+    ])
+    db_session.commit()
+    sweeper = IdempotencySweeper(
+        session_factory=TestingSessionLocal, settings=IdempotencySweeperSettings(batch_size=1, batch_pause=0)
+    )
+    assert asyncio.run(sweeper.sweep()) == 2
+    assert [key for (key,) in db_session.query(IdempotencyKey.key)] == ["key-1"]
@@ -0,0 +1,53 @@
+import asyncio
+import secrets
+from datetime import datetime, timedelta
+
+from app.models import Team, TeamInvitation
+from app.services.invitation_expiry import InvitationSweeper, SweeperSettings
+from tests.conftest import TestingSessionLocal
+
+
+def add_invitations(db_session, team, user, count, expires_in):
+    for i in range(count):
+        db_session.add(
+            TeamInvitation(
+                team_id=team.id, email=f"invitee{i}-{secrets.token_hex(4)}@example.com",
+                invited_by=user.id, token=secrets.token_urlsafe(16),
+                expires_at=datetime.utcnow() + expires_in, status="pending",
+            )
+        )
+    team.pending_invitation_count += count
+    db_session.commit()
+
+
+def statuses(db_session):
+    db_session.expire_all()
+    return sorted(status for (status,) in db_session.query(TeamInvitation.status))
+
+
+class TestInvitationExpiry:
+    def test_sweeper_expires_overdue_invitations_in_batches(self, db_session, test_team, test_user):
+        add_invitations(db_session, test_team, test_user, 5, timedelta(days=-1))
+        add_invitations(db_session, test_team, test_user, 2, timedelta(days=1))
+        sweeper = InvitationSweeper(
+            session_factory=TestingSessionLocal, settings=SweeperSettings(batch_size=2, batch_pause=0)
+        )
+
+        assert asyncio.run(sweeper.sweep()) == 5
+
+        assert statuses(db_session) == ["expired"] * 5 + ["pending"] * 2
+        assert db_session.get(Team, test_team.id).pending_invitation_count == 2
+
+    def test_sending_frees_seats_of_overdue_invitations(self, client, db_session, test_team, test_user, auth_headers):
+        test_team.member_limit = 2
+        test_team.member_count = 1
+        db_session.commit()
+        add_invitations(db_session, test_team, test_user, 1, timedelta(days=-1))
+
+        response = client.post(
+            f"/api/v1/teams/{test_team.id}/invitations", json={"email": "new@example.com"}, headers=auth_headers
+        )
+
+        assert response.status_code == 201
+        assert statuses(db_session) == ["expired", "pending"]
+        assert db_session.get(Team, test_team.id).pending_invitation_count == 1
@@ -0,0 +1,51 @@
+from uuid import uuid4
+
+from app.middleware.metrics import REGISTRY, Histogram
+
+
+class TestHistogram:
+    def test_render_is_cumulative(self):
+        histogram = Histogram("test_seconds", "Test.", ("route",), (0.1, 1.0))
+        histogram.observe(("/a",), 0.05)
+        histogram.observe(("/a",), 0.5)
+        histogram.observe(("/a",), 5.0)
+        lines = histogram.render()
+        assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+        assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+        assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+        assert 'test_seconds_count{route="/a"} 3' in lines
+
+    def test_label_values_are_escaped(self):
+        histogram = Histogram("test_seconds", "Test.", ("route",), (1.0,))
+        histogram.observe(('/a"b',), 0.5)
+        assert 'test_seconds_count{route="/a\\"b"} 1' in histogram.render()
+
+
+class TestMetricsEndpoint:
+    def test_records_route_template_and_sql(self, client, auth_headers):
+        labels = ("GET", "/api/v1/patients/{patient_id}", "404")
+        before_count = REGISTRY.request_duration.count(labels)
+        before_statements = REGISTRY.db_statements.sum(labels)
+
+        response = client.get(f"/api/v1/patients/{uuid4()}", headers=auth_headers)
+        assert response.status_code == 404
+
+        assert REGISTRY.request_duration.count(labels) == before_count + 1
+        # User lookup plus the patient lookup
+        assert REGISTRY.db_statements.sum(labels) >= before_statements + 2
+        assert REGISTRY.in_flight.value(("GET",)) == 0
+
+    def test_unmatched_paths_share_one_series(self, client):
+        client.get("/api/v1/does-not-exist/12345")
+        assert REGISTRY.request_duration.count(("GET", "<unmatched>", "404")) >= 1
+
+    def test_metrics_endpoint_exposes_prometheus_text(self, client):
+        client.get("/api/v1/health")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert "# TYPE biotrack_http_request_duration_seconds histogram" in body
+        assert 'route="/api/v1/health"' in body
+        assert "biotrack_db_duration_seconds_sum" in body
+        assert "biotrack_http_requests_in_flight" in body
@@ -0,0 +1,98 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app.database import engine
+from app.models import Patient, Treatment
+from app.services import partitions
+from app.services.partitions import add_months, detach_partition, month_start, partition_name
+
+postgres_only = pytest.mark.skipif(
+    engine.dialect.name != "postgresql", reason="tables are only partitioned on Postgres"
+)
+
+
+def test_month_arithmetic():
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert partition_name("treatments", month_start(date(2026, 3, 17))) == "treatments_2026_03"
+
+
+@pytest.fixture
+def patient(db_session, test_team):
+    patient = Patient(team_id=test_team.id, rut="11111111-1", name="Paciente", status="active", unit="UCI")
+    db_session.add(patient)
+    db_session.commit()
+    return patient
+
+
+def add_treatment(db_session, patient, start_date):
+    treatment = Treatment(
+        patient_id=patient.id, antibiotic_name="Meropenem", antibiotic_type="antibiotic",
+        status="active", start_date=start_date,
+    )
+    db_session.add(treatment)
+    db_session.commit()
+    treatment_id = treatment.id
+    db_session.rollback()  # no open transaction holding locks on the table
+    return treatment_id
+
+
+def drop_months_ahead(months):
+    """Drop the treatment months from 4 (past the maintained ones) to ``months`` ahead."""
+    this_month = month_start(date.today())
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM treatments WHERE start_date >= :month"), {"month": add_months(this_month, 4)})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for ahead in range(4, months + 1):
+            name = detach_partition(connection, "treatments", add_months(this_month, ahead))
+            connection.execute(text(f"DROP TABLE {name}"))
+    partitions._covered_until.clear()
+
+
+def partition_of(treatment_id):
+    with engine.connect() as connection:
+        return connection.execute(
+            text("SELECT tableoid::regclass::text FROM treatments WHERE id = :id"), {"id": treatment_id}
+        ).scalar()
+
+
+@postgres_only
+class TestPartitions:
+    def test_rows_land_in_their_month(self, db_session, patient):
+        today = date.today()
+        assert partition_of(add_treatment(db_session, patient, today)) == partition_name("treatments", month_start(today))
+        assert partition_of(add_treatment(db_session, patient, date(2001, 5, 3))) == "treatments_history"
+
+    def test_far_dates_get_their_months_created(self, db_session, patient):
+        month = add_months(month_start(date.today()), 12)
+        treatment_id = add_treatment(db_session, patient, month)
+        try:
+            assert partition_of(treatment_id) == partition_name("treatments", month)
+        finally:
+            drop_months_ahead(12)
+
+    def test_patch_to_a_far_date_creates_its_months(self, client, auth_headers, db_session, patient):
+        treatment_id = add_treatment(db_session, patient, date.today())
+        month = add_months(month_start(date.today()), 36)
+        try:
+            response = client.patch(
+                f"/api/v1/treatments/{treatment_id}",
+                json={"version": 1, "start_date": str(month)},
+                headers=auth_headers,
+            )
+            assert response.status_code == 200
+            assert partition_of(treatment_id) == partition_name("treatments", month)
+        finally:
+            drop_months_ahead(36)
+
+    def test_recent_queries_skip_older_partitions(self, db_session, patient):
+        this_month = month_start(date.today())
+        with engine.connect() as connection:
+            plan = "\n".join(connection.execute(
+                text("EXPLAIN SELECT * FROM treatments WHERE patient_id = :patient AND start_date >= :since"),
+                {"patient": patient.id, "since": this_month},
+            ).scalars())
+        assert partition_name("treatments", this_month) in plan
+        assert "treatments_history" not in plan
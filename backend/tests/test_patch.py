@@ -0,0 +1,86 @@
+import uuid
+from datetime import date
+
+import pytest
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.models import Change, Patient, Treatment
+from tests.conftest import TestingSessionLocal
+
+PATIENT = {"rut": "12.345.678-5", "name": "Ana Soto", "status": "active", "unit": "UCI"}
+
+
+def add_patient(db_session, test_team, **fields):
+    patient = Patient(team_id=test_team.id, **{**PATIENT, **fields})
+    db_session.add(patient)
+    db_session.commit()
+    return patient
+
+
+def patch(client, auth_headers, path, json):
+    return client.patch(path, json=json, headers=auth_headers)
+
+
+def test_patch_updates_only_the_fields_sent(client, auth_headers, db_session, test_team):
+    patient = add_patient(db_session, test_team)
+    response = patch(client, auth_headers, f"/api/v1/patients/{patient.id}", {"version": 1, "unit": "UTI"})
+    assert response.status_code == 200
+    assert response.json()["unit"] == "UTI"
+    assert response.json()["name"] == "Ana Soto"
+    assert response.json()["version"] == 2
+    db_session.expire_all()
+    assert (patient.unit, patient.version) == ("UTI", 2)
+    # Recorded in the change feed like an ORM update
+    assert db_session.query(Change).filter(Change.row_id == patient.id).count() == 2
+
+
+def test_stale_version_conflicts(client, auth_headers, db_session, test_team):
+    patient = add_patient(db_session, test_team)
+    path = f"/api/v1/patients/{patient.id}"
+    assert patch(client, auth_headers, path, {"version": 1, "name": "Ana María Soto"}).status_code == 200
+    stale = patch(client, auth_headers, path, {"version": 1, "status": "discharged"})
+    assert stale.status_code == 409
+    db_session.expire_all()
+    assert (patient.name, patient.status, patient.version) == ("Ana María Soto", "active", 2)
+
+    missing = patch(client, auth_headers, f"/api/v1/patients/{uuid.uuid4()}", {"version": 1, "name": "X"})
+    assert missing.status_code == 404
+    assert patch(client, auth_headers, path, {"version": 2, "name": None}).status_code == 422
+
+
+def test_patch_rut_keeps_it_unique(client, auth_headers, db_session, test_team):
+    add_patient(db_session, test_team)
+    other = add_patient(db_session, test_team, rut="9876545-K", name="Pedro Núñez")
+    path = f"/api/v1/patients/{other.id}"
+    assert patch(client, auth_headers, path, {"version": 1, "rut": "12345678-5"}).status_code == 409
+    response = patch(client, auth_headers, path, {"version": 1, "rut": "1.234.567-4"})
+    assert response.status_code == 200
+    db_session.expire_all()
+    assert other.rut_normalized == "1234567-4"
+
+
+def test_patch_treatment_and_stale_put(client, auth_headers, db_session, test_team):
+    patient = add_patient(db_session, test_team)
+    treatment = Treatment(
+        patient_id=patient.id, antibiotic_name="Vancomicina", antibiotic_type="antibiotic",
+        start_date=date.today(), status="active",
+    )
+    db_session.add(treatment)
+    db_session.commit()
+    path = f"/api/v1/treatments/{treatment.id}"
+    response = patch(client, auth_headers, path, {"version": 1, "status": "finished"})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    change = db_session.query(Change).filter(Change.row_id == treatment.id).order_by(Change.seq.desc()).first()
+    assert change.team_id == test_team.id
+
+    # ORM updates check the version they loaded too (PUT answers 409)
+    db_session.expire_all()
+    treatment.antibiotic_name = "Meropenem"
+    other = TestingSessionLocal()
+    other.query(Treatment).filter(Treatment.id == treatment.id).one().status = "active"
+    other.commit()
+    other.close()
+    with pytest.raises(StaleDataError):
+        db_session.commit()
+    db_session.rollback()
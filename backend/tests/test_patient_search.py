@@ -0,0 +1,59 @@
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from app.models import Patient, Team
+
+
+@pytest.fixture
+def patients(db_session, test_team):
+    other = Team(id=uuid.uuid4(), name="Other", subscription_status="active")
+    db_session.add(other)
+    db_session.commit()
+    rows = [
+        (test_team.id, "12.345.678-5", "María José González Pérez"),
+        (test_team.id, "12345679-3", "Pedro Núñez"),
+        (test_team.id, "1.234.567-4", "Gonzalo Rojas"),
+        (test_team.id, "9.876.545-K", "Ana Soto"),
+        (other.id, "12.345.000-1", "María González"),
+    ]
+    db_session.add_all([
+        Patient(team_id=team_id, rut=rut, name=name, status="active", unit="UCI")
+        for team_id, rut, name in rows
+    ])
+    db_session.commit()
+
+
+@pytest.fixture
+def trigram(db_session):
+    """Name search needs pg_trgm on Postgres (created by migration add_patient_search)."""
+    if db_session.get_bind().dialect.name == "postgresql":
+        try:
+            db_session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            pytest.skip("pg_trgm is not available")
+
+
+def search(client, auth_headers, q):
+    response = client.get("/api/v1/patients/search", params={"q": q}, headers=auth_headers)
+    assert response.status_code == 200
+    return [patient["name"] for patient in response.json()]
+
+
+def test_rut_prefix_ignores_dots_and_check_digit(client, auth_headers, patients):
+    # The exact body first, then the longer ones; never the other team's
+    assert search(client, auth_headers, "1.234.567") == [
+        "Gonzalo Rojas", "María José González Pérez", "Pedro Núñez",
+    ]
+    assert search(client, auth_headers, "12345678-5") == ["María José González Pérez"]
+    assert search(client, auth_headers, "9876545-k") == ["Ana Soto"]
+
+
+def test_name_search_ignores_accents_and_typos(client, auth_headers, patients, trigram):
+    assert search(client, auth_headers, "nunez") == ["Pedro Núñez"]
+    assert search(client, auth_headers, "gonzales")[0] == "María José González Pérez"
+    assert "María González" not in search(client, auth_headers, "maria gonzalez")
+    assert search(client, auth_headers, "xyzzy") == []
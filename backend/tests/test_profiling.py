@@ -0,0 +1,72 @@
+import json
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware.profiling import ProfilingMiddleware
+
+
+def busy_wait(seconds: float) -> int:
+    total, deadline = 0, time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        total += 1
+    return total
+
+
+def build_app(tmp_path, **options):
+    app = FastAPI()
+    app.add_middleware(
+        ProfilingMiddleware, output_dir=str(tmp_path), interval=0.001, **options
+    )
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        return {"spins": busy_wait(0.05)}
+
+    return app
+
+
+@pytest.fixture
+def profiled_client(tmp_path):
+    return TestClient(build_app(tmp_path, token="s3cret"))
+
+
+class TestProfilingMiddleware:
+    def test_token_header_writes_speedscope_profile(self, profiled_client, tmp_path):
+        response = profiled_client.get(
+            "/items/1", headers={"X-Profile-Token": "s3cret", "X-Request-ID": "req-42"}
+        )
+        assert response.status_code == 200
+        assert response.headers["x-profile-request-id"] == "req-42"
+
+        files = list(tmp_path.iterdir())
+        assert len(files) == 1
+        assert files[0].name.endswith("-GET-items_item_id-req_42.speedscope.json")
+        profile = json.loads(files[0].read_text())
+        assert profile["profiles"][0]["samples"]
+        frame_names = {frame["name"] for frame in profile["shared"]["frames"]}
+        assert "busy_wait" in frame_names
+
+    def test_wrong_or_missing_token_is_not_profiled(self, profiled_client, tmp_path):
+        profiled_client.get("/items/1", headers={"X-Profile-Token": "nope"})
+        profiled_client.get("/items/1")
+        assert list(tmp_path.iterdir()) == []
+
+    def test_sampling_one_in_n(self, tmp_path):
+        client = TestClient(build_app(tmp_path, sample_rate=3, output_format="collapsed"))
+        for _ in range(6):
+            client.get("/items/1")
+        files = sorted(tmp_path.iterdir())
+        assert len(files) == 2
+        assert all(f.name.endswith(".collapsed.txt") for f in files)
+        assert "busy_wait" in files[0].read_text()
+
+    def test_retention_cap(self, tmp_path):
+        client = TestClient(build_app(tmp_path, token="s3cret", max_files=2))
+        for i in range(4):
+            client.get("/items/1", headers={"X-Profile-Token": "s3cret", "X-Request-ID": f"r{i}"})
+            time.sleep(0.01)
+        kept = {p.name.rsplit("-", 1)[1] for p in tmp_path.iterdir()}
+        assert kept == {"r2.speedscope.json", "r3.speedscope.json"}
@@ -0,0 +1,107 @@
+from uuid import uuid4
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware.query_inspector import QueryInspectorMiddleware
+from app.models import Patient
+from app.query_inspector import (
+    QueryReport,
+    capture_queries,
+    fingerprint,
+    inspector,
+    parameters_shape,
+)
+from tests.conftest import TestingSessionLocal
+
+
+class TestFingerprint:
+    def test_bound_parameters_and_literals_are_normalized(self):
+        a = fingerprint("SELECT * FROM patients WHERE id = %(id_1)s AND age > 30")
+        b = fingerprint("SELECT *   FROM patients\nWHERE id = %(id_1)s AND age > 45")
+        assert a == b == "SELECT * FROM patients WHERE id = ? AND age > ?"
+
+    def test_in_lists_collapse(self):
+        a = fingerprint("SELECT * FROM beds WHERE id IN (%s, %s, %s)")
+        b = fingerprint("SELECT * FROM beds WHERE id IN (%s)")
+        assert a == b
+
+    def test_identifiers_with_digits_are_kept(self):
+        assert "users_1" in fingerprint("SELECT users_1.id FROM users AS users_1")
+
+    def test_parameters_shape_has_no_values(self):
+        shape = parameters_shape({"name": "Secret Name", "age": 42})
+        assert shape == "{name: str, age: int}"
+        assert parameters_shape([(1,), (2,)], executemany=True) == "2 x (int)"
+
+
+class TestQueryInspector:
+    def test_detects_repeated_statements(self, db_session, test_team):
+        with capture_queries(n_plus_one_threshold=3) as report:
+            for _ in range(5):
+                db_session.query(Patient).filter(Patient.id == uuid4()).first()
+        assert len(report.n_plus_one) == 1
+        assert report.n_plus_one[0].count == 5
+        assert "FROM patients" in report.n_plus_one[0].fingerprint
+
+    def test_below_threshold_is_not_reported(self, db_session):
+        with capture_queries(n_plus_one_threshold=3) as report:
+            for _ in range(3):
+                db_session.query(Patient).filter(Patient.id == uuid4()).first()
+        assert report.n_plus_one == []
+        assert report.statements >= 3
+
+    def test_slow_queries_carry_route(self, client, auth_headers):
+        with capture_queries(slow_query_ms=0) as report:
+            client.get(f"/api/v1/patients/{uuid4()}", headers=auth_headers)
+        routes = {finding.route for finding in report.slow_queries}
+        assert "/api/v1/patients/{patient_id}" in routes
+
+    def test_patient_list_has_no_n_plus_one(self, client, auth_headers):
+        for i in range(3):
+            client.post(
+                "/api/v1/patients",
+                json={
+                    "rut": f"{i + 1}" * 8 + f"-{i + 1}",
+                    "name": f"Patient {i}",
+                    "status": "active",
+                    "unit": "UCI",
+                },
+                headers=auth_headers,
+            )
+        with capture_queries(n_plus_one_threshold=1) as report:
+            client.get("/api/v1/patients", headers=auth_headers)
+        assert report.n_plus_one == []
+
+    def test_capture_restores_previous_state(self):
+        inspector.disable()
+        with capture_queries():
+            assert inspector.enabled
+        assert not inspector.enabled
+
+
+class TestQueryInspectorMiddleware:
+    def test_inspects_requests_without_metrics(self, db_session):
+        app = FastAPI()
+        app.add_middleware(QueryInspectorMiddleware)
+
+        @app.get("/lookups")
+        def lookups():
+            db = TestingSessionLocal()
+            try:
+                for _ in range(3):
+                    db.query(Patient).filter(Patient.id == uuid4()).first()
+            finally:
+                db.close()
+
+        # Not capture_queries(): its own scope would hide the middleware's
+        report = QueryReport()
+        previous = inspector.enabled, inspector.n_plus_one_threshold
+        inspector.enable(n_plus_one_threshold=2)
+        inspector._reports.append(report)
+        try:
+            TestClient(app).get("/lookups")
+        finally:
+            inspector._reports.remove(report)
+            inspector.enabled, inspector.n_plus_one_threshold = previous
+        assert [finding.route for finding in report.n_plus_one] == ["/lookups"]
@@ -0,0 +1,65 @@
+import pytest
+
+from app.models import Patient
+from app.rut import normalize_rut
+
+PATIENT = {"name": "Ana Soto", "status": "active", "unit": "UCI"}
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("12.345.678-5", "12345678-5"),
+        ("12345678-5", "12345678-5"),
+        ("123456785", "12345678-5"),
+        (" 09.876.545-k ", "9876545-K"),
+    ],
+)
+def test_normalize_rut(value, expected):
+    assert normalize_rut(value) == expected
+
+
+@pytest.mark.parametrize("value", ["12.345.678-9", "12345678", "abc", "0-0", ""])
+def test_invalid_ruts_are_rejected(value):
+    with pytest.raises(ValueError):
+        normalize_rut(value)
+
+
+def test_rut_normalized_is_set_on_write(db_session, test_team):
+    patient = Patient(team_id=test_team.id, rut="12.345.678-5", **PATIENT)
+    assert patient.rut_normalized == "12345678-5"
+    patient.rut = "not a rut"
+    assert patient.rut_normalized is None
+
+
+def test_create_upserts_on_the_normalized_rut(client, auth_headers, db_session):
+    first = client.post(
+        "/api/v1/patients", json={**PATIENT, "rut": "12.345.678-5"}, headers=auth_headers
+    )
+    second = client.post(
+        "/api/v1/patients",
+        json={**PATIENT, "rut": "12345678-5", "name": "Ana Soto Díaz"},
+        headers=auth_headers,
+    )
+    assert first.status_code == second.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
+    assert second.json()["name"] == "Ana Soto Díaz"
+    assert db_session.query(Patient).count() == 1
+
+    invalid = client.post(
+        "/api/v1/patients", json={**PATIENT, "rut": "12345678-9"}, headers=auth_headers
+    )
+    assert invalid.status_code == 422
+
+
+def test_update_to_another_patients_rut_conflicts(client, auth_headers, db_session):
+    client.post("/api/v1/patients", json={**PATIENT, "rut": "11111111-1"}, headers=auth_headers)
+    other = client.post(
+        "/api/v1/patients", json={**PATIENT, "rut": "22222222-2"}, headers=auth_headers
+    ).json()
+    response = client.put(
+        f"/api/v1/patients/{other['id']}",
+        json={**PATIENT, "rut": "11.111.111-1"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 409
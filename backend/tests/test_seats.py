@@ -0,0 +1,142 @@
+import uuid
+
+import pytest
+
+from app.auth import create_access_token
+from app.models import EmailOutbox, Team, TeamInvitation, User
+from app.services import seats
+from tests.conftest import TEST_PASSWORD_HASH
+
+
+@pytest.fixture
+def small_team(db_session, test_team, test_user):
+    """The test team with room for one more member."""
+    test_team.member_limit = 2
+    test_team.member_count = 1
+    db_session.commit()
+    return test_team
+
+
+def invite(client, team, headers, email):
+    return client.post(
+        f"/api/v1/teams/{team.id}/invitations", json={"email": email}, headers=headers
+    )
+
+
+def seat_counts(db_session, team):
+    db_session.expire_all()
+    team = db_session.get(Team, team.id)
+    return team.member_count, team.pending_invitation_count
+
+
+class TestSeats:
+    def test_invitations_reserve_seats_up_to_the_limit(self, client, db_session, small_team, auth_headers):
+        assert invite(client, small_team, auth_headers, "a@example.com").status_code == 201
+
+        response = invite(client, small_team, auth_headers, "b@example.com")
+        assert response.status_code == 400
+        assert "member limit" in response.json()["detail"]
+        assert seat_counts(db_session, small_team) == (1, 1)
+
+    def test_cancelling_frees_the_seat(self, client, db_session, small_team, auth_headers):
+        invitation_id = invite(client, small_team, auth_headers, "a@example.com").json()["id"]
+
+        response = client.delete(
+            f"/api/v1/teams/{small_team.id}/invitations/{invitation_id}", headers=auth_headers
+        )
+        assert response.status_code == 204
+        assert seat_counts(db_session, small_team) == (1, 0)
+        # A second cancel does not free the seat twice
+        client.delete(f"/api/v1/teams/{small_team.id}/invitations/{invitation_id}", headers=auth_headers)
+        assert seat_counts(db_session, small_team) == (1, 0)
+
+    def test_accepting_turns_the_seat_into_a_member(self, client, db_session, small_team, auth_headers):
+        invite(client, small_team, auth_headers, "new@example.com")
+        token = db_session.query(TeamInvitation).one().token
+        user = User(
+            id=uuid.uuid4(), name="New", email="new@example.com", hashed_password=TEST_PASSWORD_HASH,
+            role="basic", is_active=True, email_verified=True,
+        )
+        db_session.add(user)
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+        assert client.post(f"/api/v1/invitations/{token}/accept", headers=headers).status_code == 200
+        assert seat_counts(db_session, small_team) == (2, 0)
+        assert client.post(f"/api/v1/invitations/{token}/accept", headers=headers).status_code == 400
+        assert seat_counts(db_session, small_team) == (2, 0)
+
+    def test_removing_a_member_frees_the_seat(self, client, db_session, small_team, auth_headers):
+        member = User(
+            id=uuid.uuid4(), name="Member", email="member@example.com", hashed_password=TEST_PASSWORD_HASH,
+            role="advanced", team_id=small_team.id, team_role="member", is_active=True, email_verified=True,
+        )
+        small_team.member_count = 2
+        db_session.add(member)
+        db_session.commit()
+
+        response = client.delete(
+            f"/api/v1/teams/{small_team.id}/members/{member.id}", headers=auth_headers
+        )
+        assert response.status_code == 204
+        assert seat_counts(db_session, small_team) == (1, 0)
+
+    def test_reservation_is_all_or_nothing(self, db_session, small_team):
+        assert not seats.reserve_invitation_seats(db_session, small_team.id, count=2)
+        assert seats.reserve_invitation_seats(db_session, small_team.id, count=1)
+        db_session.commit()
+        assert seat_counts(db_session, small_team) == (1, 1)
+
+    def test_team_creator_takes_the_first_seat(self, client, db_session):
+        user = User(
+            id=uuid.uuid4(), name="Founder", email="founder@example.com", hashed_password=TEST_PASSWORD_HASH,
+            role="basic", is_active=True, email_verified=True,
+        )
+        db_session.add(user)
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+        response = client.post("/api/v1/teams/", json={"name": "New team"}, headers=headers)
+        assert response.status_code == 201
+        assert seat_counts(db_session, db_session.get(Team, uuid.UUID(response.json()["id"]))) == (1, 0)
+
+    def test_limit_from_the_entitlements_snapshot(self, db_session, small_team):
+        assert not seats.reserve_invitation_seats(db_session, small_team.id, member_limit=1)
+        assert seats.reserve_invitation_seats(db_session, small_team.id, member_limit=2)
+
+
+class TestBulkInvitations:
+    def test_reports_a_status_per_email(self, client, db_session, test_team, test_user, auth_headers):
+        test_team.member_limit = 4
+        test_team.member_count = 1
+        db_session.commit()
+        invite(client, test_team, auth_headers, "pending@example.com")
+        emails = [
+            "a@example.com", test_user.email, "pending@example.com",
+            "a@example.com", "b@example.com", "c@example.com",
+        ]
+
+        response = client.post(
+            f"/api/v1/teams/{test_team.id}/invitations/bulk", json={"emails": emails}, headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["invited"] == 2
+        assert [result["status"] for result in body["results"]] == [
+            "invited", "already_member", "already_invited", "duplicate", "invited", "seat_limit",
+        ]
+        assert seat_counts(db_session, test_team) == (1, 3)
+        invited = {email for (email,) in db_session.query(TeamInvitation.email)}
+        assert invited == {"pending@example.com", "a@example.com", "b@example.com"}
+        assert db_session.query(EmailOutbox).count() == 3
+
+    def test_members_cannot_bulk_invite(self, client, db_session, test_team, test_user, auth_headers):
+        test_user.team_role = "member"
+        db_session.commit()
+
+        response = client.post(
+            f"/api/v1/teams/{test_team.id}/invitations/bulk",
+            json={"emails": ["a@example.com"]}, headers=auth_headers,
+        )
+        assert response.status_code == 403
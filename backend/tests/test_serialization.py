@@ -0,0 +1,76 @@
+import json
+from datetime import date, datetime
+from uuid import uuid4
+
+from app import models
+from app.serialization import diagnostic_list, patient_list, treatment_list
+
+
+def make_patient(**overrides):
+    data = dict(
+        id=uuid4(),
+        team_id=uuid4(),
+        rut="11111111-1",
+        name="Paciente Ñandú",
+        age=42,
+        status="active",
+        unit="UCI",
+        bed_number=3,
+        has_ending_soon_program=None,
+        created_at=datetime(2025, 1, 2, 3, 4, 5, 678901),
+        updated_at=datetime(2025, 1, 2, 3, 4, 5),
+    )
+    data.update(overrides)
+    return models.Patient(**data)
+
+
+class TestListSerializer:
+    """The trusted orjson path must produce the same JSON as pydantic."""
+
+    def test_patients_trusted_matches_validated(self):
+        rows = [make_patient(), make_patient(age=None, bed_number=None)]
+        trusted = json.loads(patient_list.dumps(rows))
+        validated = json.loads(patient_list.dumps(rows, validate=True))
+        assert trusted == validated
+        assert "team_id" not in trusted[0]
+
+    def test_treatments_trusted_matches_validated(self):
+        now = datetime(2025, 6, 1, 12, 0, 0)
+        rows = [
+            models.Treatment(
+                id=uuid4(),
+                patient_id=uuid4(),
+                antibiotic_name="Ceftriaxona",
+                antibiotic_type="antibiotic",
+                start_date=date(2025, 5, 30),
+                days_applied=2,
+                programmed_days=7,
+                status="active",
+                start_count=0,
+                dosage="1g",
+                created_by_user_id=None,
+                created_at=now,
+                updated_at=now,
+            )
+        ]
+        assert json.loads(treatment_list.dumps(rows)) == json.loads(
+            treatment_list.dumps(rows, validate=True)
+        )
+
+    def test_diagnostics_trusted_matches_validated(self):
+        rows = [
+            models.Diagnostic(
+                id=uuid4(),
+                patient_id=uuid4(),
+                diagnosis_name="Neumonía",
+                date_diagnosed=date(2025, 5, 30),
+                created_at=None,
+                updated_at=None,
+            )
+        ]
+        assert json.loads(diagnostic_list.dumps(rows)) == json.loads(
+            diagnostic_list.dumps(rows, validate=True)
+        )
+
+    def test_empty_list(self):
+        assert patient_list.dumps([]) == b"[]"
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+import stripe
+
+from app.cache import TTLCache
+from app.routers.subscriptions import STRIPE_PRICES
+from app.services import stripe_client
+from app.services.stripe_client import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(stripe_client, "breaker", CircuitBreaker())
+    stripe_client.subscription_items.clear()
+    stripe_client.prices.clear()
+    yield
+    stripe_client.subscription_items.clear()
+    stripe_client.prices.clear()
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures_and_recovers(self, clock):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        outage = stripe.error.APIConnectionError("connection refused")
+
+        breaker.before_call()
+        breaker.record(outage)
+        breaker.before_call()
+        breaker.record(outage)
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        clock.now += 30
+        assert breaker.state == "half-open"
+        breaker.before_call()  # the trial call
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()  # only one trial at a time
+        breaker.record(None)
+        assert breaker.state == "closed"
+
+    def test_failed_trial_reopens(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record(stripe.error.APIError("500"))
+        clock.now += 30
+        breaker.before_call()
+        breaker.record(stripe.error.APIError("500"))
+        assert breaker.state == "open"
+
+    def test_cancelled_trial_lets_another_through(self, clock, monkeypatch):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        monkeypatch.setattr(stripe_client, "breaker", breaker)
+        breaker.record(stripe.error.APIError("500"))
+        clock.now += 30
+
+        async def cancelled_trial():
+            trial = asyncio.ensure_future(stripe_client.call_stripe(time.sleep, 1))
+            await asyncio.sleep(0.05)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+
+        asyncio.run(cancelled_trial())
+        assert breaker.state == "half-open"
+        breaker.before_call()
+
+    def test_client_errors_do_not_count(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1, clock=clock)
+        breaker.record(stripe.error.InvalidRequestError("No such price", "price"))
+        assert breaker.state == "closed"
+
+
+def test_ttl_cache_expires_entries(clock):
+    cache = TTLCache(ttl=60, clock=clock)
+    cache.set("sub_1", "si_1")
+    assert cache.get("sub_1") == "si_1"
+    clock.now += 60
+    assert cache.get("sub_1") is None
+
+
+def test_subscription_item_lookups_are_shared_and_cached(monkeypatch):
+    calls = []
+
+    def retrieve(subscription_id):
+        calls.append(subscription_id)
+        time.sleep(0.05)
+        return {"id": subscription_id, "items": {"data": [{"id": "si_1"}]}}
+
+    monkeypatch.setattr(stripe.Subscription, "retrieve", retrieve)
+
+    async def lookups():
+        first = await asyncio.gather(
+            *(stripe_client.get_subscription_item_id("sub_1") for _ in range(5))
+        )
+        return first + [await stripe_client.get_subscription_item_id("sub_1")]
+
+    assert asyncio.run(lookups()) == ["si_1"] * 6
+    assert calls == ["sub_1"]
+
+
+def test_plan_prices_are_cached(client, monkeypatch):
+    calls = []
+
+    def retrieve(price_id):
+        calls.append(price_id)
+        return {
+            "id": price_id, "unit_amount": 2900, "currency": "usd",
+            "recurring": {"interval": "month"}, "active": True,
+        }
+
+    monkeypatch.setattr(stripe.Price, "retrieve", retrieve)
+    monkeypatch.setitem(STRIPE_PRICES, "basic", "price_basic")
+
+    for _ in range(2):
+        response = client.get("/api/v1/subscriptions/plans")
+        assert response.status_code == 200
+        assert response.json()["basic"]["unit_amount"] == 2900
+    assert calls == ["price_basic"]
+
+
+def test_portal_returns_503_while_circuit_is_open(client, db_session, test_team, auth_headers):
+    test_team.stripe_customer_id = "cus_1"
+    db_session.commit()
+    stripe_client.breaker.opened_at = stripe_client.breaker.clock()
+
+    response = client.post("/api/v1/subscriptions/portal", headers=auth_headers)
+
+    assert response.status_code == 503
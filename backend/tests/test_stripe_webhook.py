@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+
+from app.models import StripeEvent, Team
+from app.routers.subscriptions import STRIPE_WEBHOOK_SECRET
+from app.services.stripe_events import StripeEventWorker, WorkerSettings
+from tests.conftest import TestingSessionLocal
+
+
+def stripe_event(event_id, event_type, obj, created):
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type,
+        "created": created,
+        "data": {"object": obj},
+    }
+
+
+def deliver(client, event):
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(
+        STRIPE_WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+    ).hexdigest()
+    return client.post(
+        "/api/v1/subscriptions/webhooks/stripe",
+        content=payload,
+        headers={"stripe-signature": f"t={timestamp},v1={signature}"},
+    )
+
+
+def process():
+    # One subscription at a time: the in-memory test database is one connection
+    worker = StripeEventWorker(TestingSessionLocal, WorkerSettings(concurrency=1))
+    return asyncio.run(worker.process_once())
+
+
+@pytest.fixture
+def subscribed_team(db_session):
+    team = Team(
+        name="ICU Team", subscription_status="active", subscription_plan="basic",
+        stripe_customer_id="cus_1", stripe_subscription_id="sub_1",
+    )
+    db_session.add(team)
+    db_session.commit()
+    return team
+
+
+class TestStripeWebhook:
+    def test_stores_event_and_ignores_redelivery(self, client, db_session):
+        event = stripe_event(
+            "evt_1", "customer.subscription.updated",
+            {"id": "sub_1", "object": "subscription", "status": "active"}, created=100,
+        )
+
+        assert deliver(client, event).status_code == 200
+        assert deliver(client, event).status_code == 200
+
+        stored = db_session.query(StripeEvent).one()
+        assert stored.status == "pending"
+        assert stored.ordering_key == "sub_1"
+
+    def test_rejects_invalid_signature(self, client, db_session):
+        response = client.post(
+            "/api/v1/subscriptions/webhooks/stripe",
+            content=json.dumps(stripe_event("evt_1", "invoice.paid", {}, created=100)),
+            headers={"stripe-signature": "t=1,v1=bad"},
+        )
+        assert response.status_code == 400
+        assert db_session.query(StripeEvent).count() == 0
+
+    def test_applies_events_in_created_order(self, client, db_session, subscribed_team):
+        # Delivered out of order: the cancellation was created last
+        deliver(client, stripe_event(
+            "evt_2", "customer.subscription.deleted",
+            {"id": "sub_1", "object": "subscription", "status": "canceled"}, created=200,
+        ))
+        deliver(client, stripe_event(
+            "evt_1", "customer.subscription.updated",
+            {"id": "sub_1", "object": "subscription", "status": "past_due"}, created=100,
+        ))
+
+        assert process() == 2
+
+        db_session.expire_all()
+        assert db_session.get(Team, subscribed_team.id).subscription_status == "cancelled"
+        assert {e.status for e in db_session.query(StripeEvent)} == {"processed"}
+        assert process() == 0
+
+    def test_failed_event_holds_back_its_subscription(self, client, db_session, subscribed_team):
+        # Missing "status" makes the handler fail
+        deliver(client, stripe_event(
+            "evt_1", "customer.subscription.updated",
+            {"id": "sub_1", "object": "subscription"}, created=100,
+        ))
+        deliver(client, stripe_event(
+            "evt_2", "customer.subscription.deleted",
+            {"id": "sub_1", "object": "subscription", "status": "canceled"}, created=200,
+        ))
+        deliver(client, stripe_event(
+            "evt_3", "customer.subscription.deleted",
+            {"id": "sub_2", "object": "subscription", "status": "canceled"}, created=150,
+        ))
+
+        process()
+
+        db_session.expire_all()
+        events = {e.id: e for e in db_session.query(StripeEvent)}
+        assert events["evt_1"].status == "pending"
+        assert events["evt_1"].attempts == 1
+        assert events["evt_2"].status == "pending"
+        assert events["evt_2"].attempts == 0
+        assert events["evt_3"].status == "processed"
+        assert db_session.get(Team, subscribed_team.id).subscription_status == "active"
+        # evt_1 is waiting for its retry, so evt_2 is not claimed either
+        assert process() == 0
@@ -0,0 +1,85 @@
+import uuid
+from datetime import date
+
+from app.models import Bed, Change, Patient, Team, Treatment, Unit
+
+
+def sync(client, auth_headers, since=0, limit=500):
+    response = client.get(
+        f"/api/v1/sync?since={since}&limit={limit}", headers=auth_headers
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_records_changes_in_commit_order(client, auth_headers, db_session, test_team):
+    patient = Patient(team_id=test_team.id, rut="11111111-1", name="Ana", status="active", unit="UCI")
+    db_session.add(patient)
+    db_session.commit()
+    db_session.add(Treatment(
+        patient_id=patient.id, antibiotic_name="Vancomicina", antibiotic_type="antibiotic",
+        start_date=date.today(), days_applied=0, status="active",
+    ))
+    patient.name = "Ana María"
+    db_session.commit()
+
+    page = sync(client, auth_headers)
+    assert sorted((c["table"], c["op"]) for c in page["changes"]) == [
+        ("patients", "upsert"), ("treatments", "upsert"),
+    ]
+    # The patient is listed once, at its latest change, with its current row
+    patients = [c for c in page["changes"] if c["table"] == "patients"]
+    assert len(patients) == 1
+    assert patients[0]["data"]["name"] == "Ana María"
+    assert page["has_more"] is False
+    assert page["next"] == max(c["seq"] for c in page["changes"])
+
+    db_session.delete(patient.treatments[0])
+    db_session.commit()
+    page = sync(client, auth_headers, since=page["next"])
+    assert [(c["table"], c["op"], c["data"]) for c in page["changes"]] == [
+        ("treatments", "delete", None),
+    ]
+
+    assert sync(client, auth_headers, since=page["next"])["changes"] == []
+
+
+def test_pages_through_changes(client, auth_headers, db_session, test_team):
+    for number in range(5):
+        db_session.add(Patient(
+            team_id=test_team.id, rut=f"{number}-1", name=f"P{number}", status="active", unit="UCI",
+        ))
+        db_session.commit()
+
+    names, since, has_more = [], 0, True
+    while has_more:
+        page = sync(client, auth_headers, since=since, limit=2)
+        names += [c["data"]["name"] for c in page["changes"]]
+        since, has_more = page["next"], page["has_more"]
+    assert names == [f"P{number}" for number in range(5)]
+
+
+def test_only_the_teams_changes_and_shared_beds(client, auth_headers, db_session, test_team):
+    other = Team(id=uuid.uuid4(), name="Other", subscription_status="active")
+    db_session.add(other)
+    db_session.commit()
+    unit = Unit(name="UCI")
+    db_session.add_all([
+        Patient(team_id=other.id, rut="33333333-3", name="Other", status="active", unit="UCI"),
+        unit,
+    ])
+    db_session.flush()
+    db_session.add(Bed(unit_id=unit.id, bed_number=1))
+    db_session.commit()
+
+    page = sync(client, auth_headers)
+    assert [c["table"] for c in page["changes"]] == ["beds"]
+
+
+def test_rollback_records_nothing(db_session, test_team):
+    db_session.add(Patient(team_id=test_team.id, rut="1-9", name="Gone", status="active", unit="UCI"))
+    db_session.flush()
+    db_session.rollback()
+    db_session.add(Team(id=uuid.uuid4(), name="Unrelated"))
+    db_session.commit()
+    assert db_session.query(Change).count() == 0
@@ -0,0 +1,112 @@
+import asyncio
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.models import (
+    Bed, BedHistory, Diagnostic, Patient, Team, TeamInvitation, TeamPurge, Treatment, Unit, User,
+)
+from app.services.team_purge import PURGE_STEPS, PurgeSettings, TeamPurgeWorker
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def deleted_team(db_session, test_team, test_user):
+    """A team past its deletion date with three patients and their records."""
+    test_team.deleted_at = datetime.utcnow() - timedelta(days=31)
+    test_team.deletion_scheduled_for = datetime.utcnow() - timedelta(days=1)
+    unit = Unit(name="UCI")
+    bed = Bed(unit=unit, bed_number=1)
+    db_session.add_all([unit, bed])
+    for i in range(3):
+        patient = Patient(team_id=test_team.id, rut=f"1000000{i}-{i}", name=f"Patient {i}", status="active", unit="UCI")
+        db_session.add_all([
+            patient,
+            Diagnostic(patient=patient, diagnosis_name="Neumonia"),
+            Diagnostic(patient=patient, diagnosis_name="Sepsis"),
+            Treatment(patient=patient, antibiotic_name="Meropenem", antibiotic_type="antibiotic", status="active"),
+            BedHistory(patient=patient, bed=bed, start_date=date.today()),
+        ])
+    db_session.add(TeamInvitation(
+        team_id=test_team.id, email="invitee@example.com", invited_by=test_user.id,
+        token="purge-token", expires_at=datetime.utcnow(), status="pending",
+    ))
+    db_session.commit()
+    return test_team
+
+
+def make_worker(**settings):
+    return TeamPurgeWorker(
+        session_factory=TestingSessionLocal,
+        settings=PurgeSettings(batch_size=2, batch_pause=0, **settings),
+    )
+
+
+def expire_lease(db_session, team_id):
+    db_session.get(TeamPurge, team_id).claimed_until = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+
+
+class TestTeamPurge:
+    def test_purges_due_team_in_batches(self, db_session, deleted_team, test_user):
+        team_id, user_id = deleted_team.id, test_user.id
+        other = Team(name="Other")
+        db_session.add(other)
+        db_session.flush()
+        db_session.add(Patient(team_id=other.id, rut="2000000-0", name="Kept", status="active", unit="UCI"))
+        db_session.commit()
+
+        assert asyncio.run(make_worker().purge_due_teams()) == 1
+
+        db_session.expire_all()
+        assert db_session.get(Team, team_id) is None
+        assert db_session.query(Diagnostic).count() == 0
+        assert db_session.query(Treatment).count() == 0
+        assert db_session.query(BedHistory).count() == 0
+        assert [p.name for p in db_session.query(Patient)] == ["Kept"]
+        assert db_session.get(User, user_id).team_id is None
+        purge = db_session.get(TeamPurge, team_id)
+        assert purge.status == "completed"
+        assert purge.rows_deleted == {
+            "diagnostics": 6, "treatments": 3, "bed_history": 3,
+            "patients": 3, "team_invitations": 1, "archive_files": 0, "users": 1,
+        }
+
+    def test_resumes_after_interruption(self, db_session, deleted_team):
+        team_id = deleted_team.id
+        crashed = make_worker()
+        assert crashed._claim(team_id)
+        table, model, condition = PURGE_STEPS[0]
+        first = crashed._purge_batch(team_id, table, model, condition)
+        second = crashed._purge_batch(team_id, table, model, condition, after=first[-1])
+        assert len(first) == len(second) == 2
+        assert first[-1] < second[0]
+        expire_lease(db_session, team_id)
+
+        assert asyncio.run(make_worker().purge_team(team_id))
+
+        db_session.expire_all()
+        purge = db_session.get(TeamPurge, team_id)
+        assert purge.status == "completed"
+        assert purge.rows_deleted["diagnostics"] == 6
+
+    def test_stalled_worker_stops_once_its_lease_is_taken_over(self, db_session, deleted_team):
+        team_id = deleted_team.id
+        stalled = make_worker()
+        assert stalled._claim(team_id)
+        expire_lease(db_session, team_id)
+        assert make_worker()._claim(team_id)
+
+        table, model, condition = PURGE_STEPS[0]
+        assert stalled._purge_batch(team_id, table, model, condition) is None
+        db_session.expire_all()
+        assert db_session.query(Diagnostic).count() == 6
+
+    def test_leased_team_is_skipped(self, db_session, deleted_team):
+        assert make_worker()._claim(deleted_team.id)
+        assert not asyncio.run(make_worker().purge_team(deleted_team.id))
+
+    def test_team_past_grace_period_cannot_be_restored(self, client, deleted_team, auth_headers):
+        response = client.post(f"/api/v1/teams/{deleted_team.id}/restore", headers=auth_headers)
+        assert response.status_code == 409